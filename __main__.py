@@ -1,15 +1,26 @@
+"""
+Command line interface, e.g.
 
+    python -m real_estate build-addresses
+    python -m real_estate discover-ains --chunk-size 100 --chunks 5
+    python -m real_estate scrape-details --chunk-size 100 --chunks 5
+    python -m real_estate run-shard search 2 8 --chunks 0
+    python -m real_estate merge-shards search
+    python -m real_estate build-dataset
+    python -m real_estate plot bedrooms --base 2019-06
+    python -m real_estate export --processes 4
+
+Each subcommand imports what it needs when it runs, so --help is quick.
+"""
 import os
-import pandas as pd
-from .real.addresses import (get_address_csv,
-                             prune_by_zipcode
-                             )
-from .real.scraper import (scrape_ains_for_file,
-                           scrape_data_for_ains,
-                           AINData,
-                           scrape_chunks_for_ains
-                           )
+import sys
 import time
+import argparse
+
+from .resources.defaults import (ADDRESS_FILE as CSV_FILE, DATASET_LOC,
+                                 DEFAULT_ZIPS, REGION, INFLATION_BASE,
+                                 ASYNC_CONCURRENCY, CUBE_FILE, EXPORT_LOC,
+                                 SPATIAL_FILE, STORE_LOC, DAY)
 
 LOCATION = os.sep.join(__file__.split(os.sep)[:-1] + ['resources'])
 
@@ -17,44 +28,371 @@ ADDRESS_FILE = os.sep.join(__file__.split(os.sep)[:-1] +
                            ['resources', 'address_dataframe.pkl'])
 AIN_FILE = os.sep.join(__file__.split(os.sep)[:-1] +
                        ['resources', 'ain_dataframe.pkl'])
+HOUSING_FILE = os.sep.join([LOCATION, 'wla_housing_df.pkl'])
+
 
 # build a west LA address dataframe
-def create_dataframe():
-    all_df = get_address_csv()
-    small_df = prune_by_zipcode(all_df)
+def create_dataframe(csv: str = None, zipcodes: list = None):
+    from .real.addresses import load_addresses
+    small_df = load_addresses(zipcodes, csv or CSV_FILE)
     # only keep entries without fractional numbers
     # small_df = small_df[small_df['HSE_FRAC_NBR'].isnull()].copy()
     small_df.reset_index(inplace=True)
     return small_df
 
 
-if os.path.isfile(ADDRESS_FILE):
-    df = pd.read_pickle(ADDRESS_FILE)
-else:
-    df = create_dataframe()
-    df.to_pickle(ADDRESS_FILE)
-
-
-t0 = time.time()
-# scrape all the AIN numbers you can find from the Assessor's website
-scrape_ains_for_file(ADDRESS_FILE, AIN_FILE, chunk_size=100, chunks=5)
-# scrape all the information for each of the ains that you can find
-scrape_chunks_for_ains(AIN_FILE, chunk_size=100, chunks=5)
-t1 = time.time()
-print('Time to run: {:4.3f} hours'.format((t1 - t0) / 3600.0))
-
-# for testing:
-# tiny_df = df.head(5).copy()  # keep only the first 5 entries
-# tiny_df.to_pickle('test_df.pkl')
-#
-# scrape_ains_for_file('test_df.pkl', 'new_ain_df.pkl',
-#                      chunk_size=15, chunks=3)
-#
-# td = pd.read_pickle('test_df.pkl')
-# ta = pd.read_pickle('new_ain_df.pkl')
-# ts = ta.head(5).copy()
-# ts.to_pickle('small_ain_df.pkl')
-#
-# _ = scrape_chunks_for_ains('small_ain_df.pkl', chunk_size=2, chunks=2)
-#
-# tx = pd.read_pickle('small_ain_df.pkl')
\ No newline at end of file
+def build_addresses(args: argparse.Namespace) -> None:
+    from .real.addresses import canonicalize_addresses
+    if os.path.isfile(args.output) and not args.force:
+        print('{:s} exists, use --force to rebuild it'.format(args.output))
+        return
+    df = canonicalize_addresses(create_dataframe(args.csv, args.zips))
+    df.to_pickle(args.output)
+    print('Wrote {:d} addresses to {:s}'.format(df.shape[0], args.output))
+
+
+def discover_ains(args: argparse.Namespace) -> None:
+    if args.method == 'sweep':
+        from .real.sweep import sweep_ains_for_file
+        sweep_ains_for_file(args.addresses, args.ains,
+                            chunk_size=args.chunk_size, chunks=args.chunks,
+                            base_sleep=args.base_sleep)
+    elif args.method == 'async':
+        from .real.async_scraper import async_scrape_ains_for_file
+        async_scrape_ains_for_file(args.addresses, args.ains,
+                                   chunk_size=args.chunk_size,
+                                   chunks=args.chunks,
+                                   concurrency=args.concurrency)
+    elif args.method == 'queue':
+        from .real.scraper import scrape_ains_from_queue
+        scrape_ains_from_queue(args.addresses, args.ains,
+                               chunk_size=args.chunk_size,
+                               chunks=args.chunks,
+                               base_sleep=args.base_sleep,
+                               skip_covered=not args.search_all)
+    else:
+        from .real.scraper import scrape_ains_for_file
+        scrape_ains_for_file(args.addresses, args.ains,
+                             chunk_size=args.chunk_size, chunks=args.chunks,
+                             base_sleep=args.base_sleep,
+                             skip_covered=not args.search_all)
+
+
+def scrape_details(args: argparse.Namespace) -> None:
+    from .real.store import RecordStore
+    store = RecordStore(args.store) if args.store else None
+    try:
+        if args.method == 'async':
+            from .real.async_scraper import async_scrape_chunks_for_ains
+            async_scrape_chunks_for_ains(args.ains,
+                                         chunk_size=args.chunk_size,
+                                         chunks=args.chunks,
+                                         location=args.location,
+                                         concurrency=args.concurrency,
+                                         store=store)
+        elif args.method == 'queue':
+            from .real.scraper import scrape_data_from_queue
+            scrape_data_from_queue(args.ains, chunk_size=args.chunk_size,
+                                   chunks=args.chunks,
+                                   location=args.location,
+                                   base_sleep=args.base_sleep, store=store)
+        else:
+            from .real.scraper import scrape_chunks_for_ains
+            scrape_chunks_for_ains(args.ains, chunk_size=args.chunk_size,
+                                   chunks=args.chunks,
+                                   location=args.location,
+                                   base_sleep=args.base_sleep, store=store)
+    finally:
+        if store is not None:
+            store.close()
+
+
+def run_shard(args: argparse.Namespace) -> None:
+    if args.stage == 'search':
+        from .real.shards import run_search_shard
+        run_search_shard(args.addresses, args.ains, args.shard, args.shards,
+                         chunk_size=args.chunk_size, chunks=args.chunks,
+                         base_sleep=args.base_sleep)
+    else:
+        from .real.shards import run_details_shard
+        run_details_shard(args.ains, args.shard, args.shards,
+                          location=args.store, chunk_size=args.chunk_size,
+                          chunks=args.chunks, base_sleep=args.base_sleep)
+
+
+def merge_shards(args: argparse.Namespace) -> None:
+    from .real.shards import merge_shards
+    merge_shards(args.stage, args.addresses, args.ains, args.store)
+
+
+def build_dataset(args: argparse.Namespace) -> None:
+    from .real.json_reader import build_dataframe, rebuild_dataframe
+    if args.full:
+        df = build_dataframe(args.records, args.output, args.processes)
+    else:
+        df = rebuild_dataframe(args.records, args.output, args.processes)
+    if not args.no_dataset:
+        from .real.dataset import write_dataset
+        write_dataset(df, args.dataset)
+    from .real.cube import AggregateCube
+    AggregateCube.build(df).save(args.cube)
+    from .real.spatial import SpatialIndex
+    SpatialIndex(df).save(args.spatial)
+
+
+def plot(args: argparse.Namespace) -> None:
+    from . import plots
+    if args.no_points and args.kind == 'bedrooms':
+        df = None  # the medians in the aggregate cube are enough
+    elif args.pickle:
+        import pandas as pd
+        df = pd.read_pickle(args.pickle)
+    else:
+        df = plots.load_plot_data(args.zips, args.since)
+    if args.kind == 'zipcodes':
+        plots.make_zipcode_plot(df, plot_what=args.what or 'AssessedValue',
+                                index=args.index or 'UrbanShelterIndex',
+                                base=args.base, density=args.density,
+                                zips=args.zips)
+    else:
+        plots.make_bedroom_plots(df, beds=args.beds,
+                                 plot_what=args.what or 'DTTSalePrice',
+                                 index=args.index or 'CPI-WIndex',
+                                 logplot=not args.linear, base=args.base,
+                                 density=args.density, zips=args.zips)
+
+
+def export(args: argparse.Namespace) -> None:
+    from .export import plot_jobs, export_plots
+    indexes = [None if index.lower() == 'none' else index
+               for index in args.indexes]
+    jobs = plot_jobs(kinds=args.kinds, columns=args.columns, indexes=indexes,
+                     zip_groups=args.zip_groups, bed_sets=args.bed_sets,
+                     base=args.base, density=args.density,
+                     location=args.output)
+    export_plots(jobs, processes=args.processes, pickle=args.pickle,
+                 force=args.force)
+
+
+def comparables(args: argparse.Namespace) -> None:
+    from .real.spatial import get_spatial_index
+    if args.radius is None and args.k is None:
+        args.k = 10
+    found = get_spatial_index(args.spatial).comparables(
+        args.ain, radius=args.radius, k=args.k, beds=args.beds,
+        since=args.since, until=args.until)
+    print(found.to_string(index=False))
+
+
+def int_list(text: str) -> list:
+    """ '90025,90064' -> [90025, 90064] """
+    return [int(t) for t in text.split(',') if t]
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='real_estate',
+        description='Scrape the LA Assessor and plot West LA housing prices.')
+    parser.add_argument('--region',
+                        help='name of a region file in resources/regions, or '
+                             'the path of one (default: {})'.format(
+                                 REGION or DEFAULT_ZIPS))
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument('--offline', action='store_true',
+                       help="answer only from the cache of the Assessor's "
+                            "responses, however old, and never contact it")
+    cache.add_argument('--no-cache', action='store_true',
+                       help='send every request to the server')
+    parser.add_argument('--max-age', type=float, metavar='DAYS',
+                        help='days a cached response stays fresh (default: '
+                             'by endpoint, see CACHE_TTLS)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('build-addresses',
+                            help='pick the addresses to search out of the '
+                                 'city address csv')
+    p.add_argument('--csv', default=CSV_FILE, help='the city address csv')
+    p.add_argument('--zips', type=int, nargs='+',
+                   help="zip codes to keep (default: the region's)")
+    p.add_argument('--output', default=ADDRESS_FILE,
+                   help='address dataframe pickle')
+    p.add_argument('--force', action='store_true',
+                   help='rebuild even if the output exists')
+    p.set_defaults(func=build_addresses)
+
+    def add_chunks(p, default_chunks):
+        p.add_argument('--chunk-size', type=int, default=100,
+                       help='requests between saves (default: 100)')
+        p.add_argument('--chunks', type=int, default=default_chunks,
+                       help='chunks to run (default: {}), 0 for all'.format(
+                           default_chunks))
+        p.add_argument('--base-sleep', type=float, default=1.0,
+                       help='seconds to sleep between requests '
+                            '(default: 1.0)')
+        p.add_argument('--concurrency', type=int, default=ASYNC_CONCURRENCY,
+                       help='requests in flight with --method async')
+
+    p = commands.add_parser('discover-ains',
+                            help="search the Assessor's site for the AINs "
+                                 "of the addresses")
+    p.add_argument('--addresses', default=ADDRESS_FILE,
+                   help='address dataframe pickle')
+    p.add_argument('--ains', default=AIN_FILE, help='AIN dataframe pickle')
+    p.add_argument('--method', default='search',
+                   choices=['search', 'sweep', 'async', 'queue'],
+                   help='one search per address (default), street sweeps, '
+                        'concurrent searches or a persistent work queue')
+    p.add_argument('--search-all', action='store_true',
+                   help='search addresses earlier results already cover')
+    add_chunks(p, 5)
+    p.set_defaults(func=discover_ains)
+
+    p = commands.add_parser('scrape-details',
+                            help='download the records of the AINs found')
+    p.add_argument('--ains', default=AIN_FILE, help='AIN dataframe pickle')
+    p.add_argument('--location', default=LOCATION,
+                   help='directory for the json records')
+    p.add_argument('--store',
+                   help='save to this RecordStore instead of json files')
+    p.add_argument('--method', default='serial',
+                   choices=['serial', 'async', 'queue'])
+    add_chunks(p, 5)
+    p.set_defaults(func=scrape_details)
+
+    def add_shard_files(p):
+        p.add_argument('stage', choices=['search', 'details'],
+                       help='discover-ains or scrape-details')
+        p.add_argument('--addresses', default=ADDRESS_FILE,
+                       help='address dataframe pickle')
+        p.add_argument('--ains', default=AIN_FILE,
+                       help='merged AIN dataframe pickle')
+        p.add_argument('--store', default=STORE_LOC,
+                       help='merged RecordStore of the details')
+
+    p = commands.add_parser('run-shard',
+                            help="one worker's share of a stage, run "
+                                 "alongside the other shards")
+    add_shard_files(p)
+    p.add_argument('shard', type=int, help='this worker, from 0')
+    p.add_argument('shards', type=int, help='the number of workers')
+    add_chunks(p, 5)
+    p.set_defaults(func=run_shard)
+
+    p = commands.add_parser('merge-shards',
+                            help='combine what the workers of a stage wrote')
+    add_shard_files(p)
+    p.set_defaults(func=merge_shards)
+
+    p = commands.add_parser('build-dataset',
+                            help='turn the records into the housing dataset')
+    p.add_argument('--records', default=LOCATION,
+                   help='directory of json records or a RecordStore')
+    p.add_argument('--output', default=HOUSING_FILE,
+                   help='housing dataframe pickle')
+    p.add_argument('--dataset', default=DATASET_LOC,
+                   help='partitioned dataset directory')
+    p.add_argument('--full', action='store_true',
+                   help='parse every record, not only new or changed ones')
+    p.add_argument('--processes', type=int,
+                   help='worker processes (default: one per CPU)')
+    p.add_argument('--no-dataset', action='store_true',
+                   help="don't write the partitioned dataset (no pyarrow)")
+    p.add_argument('--cube', default=CUBE_FILE,
+                   help='aggregate cube pickle')
+    p.add_argument('--spatial', default=SPATIAL_FILE,
+                   help='spatial index pickle')
+    p.set_defaults(func=build_dataset)
+
+    p = commands.add_parser('plot', help='plot the housing data')
+    p.add_argument('kind', choices=['zipcodes', 'bedrooms'])
+    p.add_argument('--what', help="column to plot, e.g. 'DTTSalePrice'")
+    p.add_argument('--index',
+                   help="inflation index, e.g. 'LAGoodsIndex'")
+    p.add_argument('--base', default=INFLATION_BASE,
+                   help='month whose dollars to plot in, e.g. 2019-06')
+    p.add_argument('--zips', type=int, nargs='+',
+                   help="zip codes to plot (default: the region's)")
+    p.add_argument('--since', type=int, help='first year to load')
+    p.add_argument('--beds', type=int, nargs='+', default=[1, 2, 3])
+    p.add_argument('--linear', action='store_true',
+                   help='linear instead of log prices')
+    p.add_argument('--density', action='store_true',
+                   help='shade the density of sales instead of drawing '
+                        'each one')
+    p.add_argument('--no-points', action='store_true',
+                   help='bedrooms: plot monthly medians from the aggregate '
+                        'cube instead of every sale')
+    p.add_argument('--pickle',
+                   help='plot a housing dataframe pickle instead of the '
+                        'partitioned dataset')
+    p.set_defaults(func=plot)
+
+    p = commands.add_parser('export',
+                            help='save every combination of plots as images')
+    p.add_argument('--kinds', nargs='+', default=['zipcodes', 'bedrooms'],
+                   choices=['zipcodes', 'bedrooms'])
+    p.add_argument('--columns', nargs='+',
+                   default=['AssessedValue', 'DTTSalePrice'])
+    p.add_argument('--indexes', nargs='+',
+                   default=['CPI-WIndex', 'UrbanShelterIndex', 'LAGoodsIndex',
+                            'none'],
+                   help="inflation indexes, 'none' for nominal dollars")
+    p.add_argument('--zip-groups', type=int_list, nargs='+',
+                   help='zip codes of each figure, e.g. 90025,90064 90049 '
+                        "(default: the region's)")
+    p.add_argument('--bed-sets', type=int_list, nargs='+', default=[[1, 2, 3]],
+                   help='bedrooms of each bedroom figure, e.g. 1,2,3 4,5')
+    p.add_argument('--base', default=INFLATION_BASE,
+                   help='month whose dollars to plot in, e.g. 2019-06')
+    p.add_argument('--density', action='store_true',
+                   help='shade the density of sales instead of drawing '
+                        'each one')
+    p.add_argument('--output', default=EXPORT_LOC,
+                   help='directory for the images')
+    p.add_argument('--processes', type=int,
+                   help='worker processes (default: one per CPU)')
+    p.add_argument('--pickle',
+                   help='plot a housing dataframe pickle instead of the '
+                        'partitioned dataset')
+    p.add_argument('--force', action='store_true',
+                   help='redraw figures even if their inputs are unchanged')
+    p.set_defaults(func=export)
+
+    p = commands.add_parser('comparables',
+                            help='sales near a parcel, from the spatial '
+                                 'index build-dataset saves')
+    p.add_argument('ain', help="the parcel's AIN")
+    p.add_argument('--radius', type=float, help='metres around the parcel')
+    p.add_argument('-k', type=int,
+                   help='number of nearest sales (default: 10 without '
+                        '--radius)')
+    p.add_argument('--beds', type=int, nargs='+',
+                   help='only sales with these numbers of bedrooms')
+    p.add_argument('--since', help='only sales from this date, e.g. 2015')
+    p.add_argument('--until', help='only sales until this date')
+    p.add_argument('--spatial', default=SPATIAL_FILE,
+                   help='spatial index pickle')
+    p.set_defaults(func=comparables)
+    return parser
+
+
+def main(argv: list = None) -> None:
+    args = make_parser().parse_args(argv)
+    if args.region is not None:
+        from .real.region import set_region
+        print(set_region(args.region))
+    if args.offline or args.no_cache or args.max_age is not None:
+        from .real.client import set_cache
+        set_cache(offline=args.offline,
+                  max_age=None if args.max_age is None else args.max_age * DAY,
+                  enabled=not args.no_cache)
+    if getattr(args, 'chunks', None) == 0:
+        args.chunks = None  # run until done
+    t0 = time.time()
+    args.func(args)
+    if args.command in ('discover-ains', 'scrape-details', 'run-shard'):
+        print('Time to run: {:4.3f} hours'.format((time.time() - t0) / 3600.0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,261 @@
+# renders every combination of plot settings to image files, headless and
+# in parallel, skipping figures whose inputs haven't changed
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from typing import Dict, List, Union
+
+from .resources.defaults import (DATASET_LOC, INFLATION_FILE, INFLATION_BASE,
+                                 EXPORT_LOC)
+from .real.region import get_region
+
+KINDS = ['zipcodes', 'bedrooms']
+EXPORT_COLUMNS = ['AssessedValue', 'DTTSalePrice']
+EXPORT_INDEXES = ['CPI-WIndex', 'UrbanShelterIndex', 'LAGoodsIndex', None]
+MANIFEST_NAME = 'figures.json'
+
+# the dataset and cube of a worker, see _init_worker
+_df = None
+_cube = None
+
+
+def plot_jobs(kinds: List[str] = KINDS,
+              columns: List[str] = EXPORT_COLUMNS,
+              indexes: List[Union[str, None]] = EXPORT_INDEXES,
+              zip_groups: Union[List[List[int]], None] = None,
+              bed_sets: List[List[int]] = [[1, 2, 3]],
+              base: str = INFLATION_BASE,
+              density: bool = False,
+              location: str = EXPORT_LOC) -> List[dict]:
+    """
+    One job for each figure in the matrix of kinds x columns x indexes x
+    zip groups (x bed sets for the bedroom plots).
+
+    Parameters
+    ----------
+    kinds : List[str]
+        'zipcodes' (make_zipcode_plot) and/or 'bedrooms'
+        (make_bedroom_plots).
+    columns : List[str]
+        Price columns to plot.
+    indexes : List[str]
+        Inflation indexes, e.g. 'CPI-WIndex', None for nominal dollars.
+    zip_groups : List[List[int]]
+        The zip codes of each figure, which is paged if there are many (see
+        plots.facet_pages).  The current region if None.
+    bed_sets : List[List[int]]
+        The numbers of bedrooms of each bedroom figure.
+    base : str
+        The month whose dollars to plot in.
+    density : bool
+        Shade the density of sales instead of drawing each one.
+    location : str
+        Directory the figures are written to.
+
+    Returns
+    -------
+    list of dicts with the plot settings and filename of each figure
+    """
+    if zip_groups is None:
+        zip_groups = [get_region().zips]
+    jobs = []
+    for kind in kinds:
+        for column in columns:
+            for index in indexes:
+                for zips in zip_groups:
+                    for beds in (bed_sets if kind == 'bedrooms' else [None]):
+                        parts = [kind, column,
+                                 'Nominal' if index is None else index,
+                                 zip_group_name(zips)]
+                        if beds is not None:
+                            parts.append('beds' +
+                                         '-'.join(str(b) for b in beds))
+                        if density:
+                            parts.append('density')
+                        jobs.append({
+                            'kind': kind, 'column': column, 'index': index,
+                            'zips': list(zips), 'beds': beds, 'base': base,
+                            'density': density,
+                            'filename': os.sep.join(
+                                [location, '_'.join(parts) + '.png'])})
+    return jobs
+
+
+def zip_group_name(zips: List[int]) -> str:
+    """ e.g. 90025-90064-90049, or 90001-to-91791-(250) for many """
+    if len(zips) <= 3:
+        return '-'.join(str(z) for z in zips)
+    return '{:d}-to-{:d}-({:d})'.format(zips[0], zips[-1], len(zips))
+
+
+def figure_files(job: dict) -> List[str]:
+    """ the files of a job's figure, one per page """
+    from .plots import facet_pages, page_filenames
+    return page_filenames(job['filename'], len(facet_pages(job['zips'])))
+
+
+def _file_hash(filename: str, digests: Dict[str, str]) -> str:
+    """ sha1 of a file's contents, remembered in digests """
+    if filename not in digests:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024 ** 2), b''):
+                h.update(block)
+        digests[filename] = h.hexdigest()
+    return digests[filename]
+
+
+def _source_files(zips: List[int], pickle: Union[str, None]) -> List[str]:
+    """ the data files a figure of zips is drawn from """
+    if pickle is not None:
+        return [pickle]
+    files = []
+    for zipcode in zips:
+        part = os.sep.join([DATASET_LOC, 'ZipCode={:d}'.format(zipcode)])
+        for root, _, names in sorted(os.walk(part)):
+            files.extend(os.sep.join([root, name]) for name in sorted(names))
+    return files
+
+
+def job_hash(job: dict, pickle: Union[str, None] = None,
+             digests: Union[Dict[str, str], None] = None) -> str:
+    """
+    A hash of everything a figure is drawn from: its settings, the
+    contents of the data files for its zip codes, the inflation data and
+    the plotting code.
+    """
+    if digests is None:
+        digests = {}
+    h = hashlib.sha1(json.dumps(
+        {k: v for k, v in job.items() if k != 'filename'},
+        sort_keys=True).encode())
+    plots_file = os.sep.join([os.path.dirname(__file__), 'plots.py'])
+    for filename in ([INFLATION_FILE, plots_file] +
+                     _source_files(job['zips'], pickle)):
+        h.update(os.path.basename(filename).encode())
+        h.update(_file_hash(filename, digests).encode())
+    return h.hexdigest()
+
+
+def _init_worker(zips: List[int], pickle: Union[str, None]) -> None:
+    """ loads the data every job in this process plots from, once """
+    global _df, _cube
+    import matplotlib
+    matplotlib.use('Agg')  # no display needed
+    import pandas as pd
+    from .plots import load_plot_data
+    from .real.cube import AggregateCube
+    if pickle is not None:
+        _df = pd.read_pickle(pickle)
+        _df = _df[_df['ZipCode'].isin(zips)]
+    else:
+        _df = load_plot_data(zips)
+    _cube = AggregateCube.build(_df)
+
+
+def render_job(job: dict) -> str:
+    """ draws and saves one figure from the worker's data """
+    from . import plots
+    df = _df[_df['ZipCode'].isin(job['zips'])].copy()
+    if job['kind'] == 'zipcodes':
+        plots.make_zipcode_plot(df, plot_what=job['column'],
+                                index=job['index'], base=job['base'],
+                                density=job['density'], zips=job['zips'],
+                                filename=job['filename'])
+    else:
+        plots.make_bedroom_plots(df, beds=job['beds'],
+                                 plot_what=job['column'], index=job['index'],
+                                 base=job['base'],
+                                 cube=_cube if job['column'] in
+                                 _cube.data.index.levels[0] else None,
+                                 density=job['density'], zips=job['zips'],
+                                 filename=job['filename'])
+    return job['filename']
+
+
+def export_plots(jobs: List[dict],
+                 processes: Union[int, None] = None,
+                 pickle: Union[str, None] = None,
+                 force: bool = False) -> Dict[str, int]:
+    """
+    Renders the figures of jobs (see plot_jobs) on the Agg backend across
+    a process pool.  Each worker loads the data once.  A figure whose file
+    exists and whose inputs hash the same as when it was last written (see
+    job_hash) is skipped.  The hashes are kept in figures.json next to the
+    figures.
+
+    Parameters
+    ----------
+    jobs : List[dict]
+        The figures to draw, from plot_jobs.
+    processes : int
+        Worker processes.  The number of CPUs if None; 1 draws in this
+        process.
+    pickle : str
+        Plot a housing dataframe pickle instead of the partitioned dataset.
+    force : bool
+        Draw every figure even if it hasn't changed.
+
+    Returns
+    -------
+    dict of the numbers of figures rendered and skipped, which is also
+    printed.
+    """
+    stats = {'rendered': 0, 'skipped': 0}
+    locations = {os.path.dirname(job['filename']) for job in jobs}
+    manifests = {}
+    for location in locations:
+        os.makedirs(location, exist_ok=True)
+        try:
+            with open(os.sep.join([location, MANIFEST_NAME])) as f:
+                manifests[location] = json.load(f)
+        except FileNotFoundError:
+            manifests[location] = {}
+
+    digests: Dict[str, str] = {}
+    todo = []
+    for job in jobs:
+        job_key = job_hash(job, pickle, digests)
+        location = os.path.dirname(job['filename'])
+        name = os.path.basename(job['filename'])
+        if not force and manifests[location].get(name) == job_key and \
+                all(os.path.isfile(f) for f in figure_files(job)):
+            stats['skipped'] += 1
+        else:
+            todo.append((job, job_key))
+
+    def done(job, job_key):
+        location = os.path.dirname(job['filename'])
+        manifests[location][os.path.basename(job['filename'])] = job_key
+        stats['rendered'] += 1
+        print('Wrote ' + job['filename'])
+
+    zips = sorted({z for job, _ in todo for z in job['zips']})
+    try:
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = min(processes, len(todo))
+        if processes == 1:
+            _init_worker(zips, pickle)
+            for job, job_key in todo:
+                render_job(job)
+                done(job, job_key)
+        elif todo:
+            with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                     initargs=(zips, pickle)) as pool:
+                futures = {pool.submit(render_job, job): (job, job_key)
+                           for job, job_key in todo}
+                for future in as_completed(futures):
+                    future.result()
+                    done(*futures[future])
+    finally:
+        for location, manifest in manifests.items():
+            filename = os.sep.join([location, MANIFEST_NAME])
+            with open(filename + '.tmp', 'w') as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(filename + '.tmp', filename)
+    print('Rendered {rendered:d} figures, {skipped:d} unchanged'.format(
+        **stats))
+    return stats
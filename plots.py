@@ -1,10 +1,210 @@
+# pandas and matplotlib are imported when a function needs them, so that
+# importing this module is quick
+from __future__ import annotations
 
-import pandas as pd
-import matplotlib.pyplot as plt
+import os
 
-from .resources.defaults import DEFAULT_ZIPS, DEFAULT_LOC
+from .resources.defaults import DEFAULT_LOC, INFLATION_BASE
+from .real.region import get_region
 
-from typing import Union, List
+from typing import TYPE_CHECKING, Union, List, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .real.cube import AggregateCube
+
+# the columns the plots below read
+# (the inflation indexes are recomputed from RecordingDate, see
+# inflation_divisor)
+PLOT_COLUMNS = ['ZipCode', 'RecordingDate', 'NumOfBeds', 'DTTSalePrice',
+                'AssessedValue']
+# (time, price) bins of the density plots
+DENSITY_BINS = (300, 150)
+# zip codes per figure, more are plotted on more figures (pages)
+FACET_PAGE_SIZE = 12
+# columns of small multiples on a figure of more than three zip codes
+FACET_COLUMNS = 3
+
+
+def load_plot_data(zips: Union[List[int], None] = None,
+                   since: Union[int, None] = None) -> pd.DataFrame:
+    """
+    Loads just the zip codes, years and columns the plots need from the
+    partitioned housing dataset (see real/dataset.py).
+
+    Parameters
+    ----------
+    zips : List[int]
+        Zip codes to load.  The current region's if None (see
+        real/region.py).
+    since : int
+        First year to load.  All years if None.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    from .real.dataset import load
+    if zips is None:
+        zips = get_region().zips
+    return load(zips=zips, since=since, columns=PLOT_COLUMNS)
+
+
+def inflation_divisor(df: pd.DataFrame,
+                      index: Union[str, None],
+                      base: str = INFLATION_BASE) -> pd.Series:
+    """
+    The inflation index column named by index (e.g. 'CPI-WIndex'), rebased
+    so that the base month is 100, or 100 everywhere if index is None.
+    100 * price / divisor is then the price in base month dollars.
+    """
+    import pandas as pd
+    from .real.inflation import get_inflation
+    if index is None:
+        return pd.Series(100.0, df.index, name='divisor')
+    series = index[:-len('Index')] if index.endswith('Index') else index
+    return pd.Series(get_inflation().index(series, df['RecordingDate'], base),
+                     df.index, name='divisor')
+
+
+def dollars_label(index: Union[str, None],
+                  base: str = INFLATION_BASE) -> str:
+    import pandas as pd
+    if index is None:
+        return 'Nominal Dollars'
+    return pd.Period(base, freq='M').strftime('%b %Y') + ' Dollars'
+
+
+def density_mesh(ax, x, y, color: str,
+                 bins: Tuple[int, int] = DENSITY_BINS,
+                 logy: bool = True,
+                 label: Union[str, None] = None):
+    """
+    Draws points as a 2D histogram of time and (log) price shaded from
+    transparent to color by the log of the number of points in each bin, so
+    the time to draw depends on bins rather than on how many points there
+    are.
+
+    Parameters
+    ----------
+    ax : matplotlib axes
+        The axes to draw on.
+    x : array-like of dates
+        The times of the points.
+    y : array-like of floats
+        The prices of the points.
+    color : str
+        A matplotlib color.
+    bins : (int, int)
+        Number of time and price bins.
+    logy : bool
+        Bin the log of the prices, for a log price axis.
+    label : str
+        Legend label.
+
+    Returns
+    -------
+    The QuadMesh drawn, or None if there are no points.
+    """
+    import numpy as np
+    import pandas as pd
+    from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgba
+    x = pd.to_datetime(pd.Series(x)).to_numpy(dtype='datetime64[ns]')
+    y = pd.Series(y).to_numpy(dtype='float64', na_value=np.nan)
+    keep = ~np.isnat(x) & np.isfinite(y)
+    if logy:
+        keep &= y > 0
+    if not keep.any():
+        return None
+    x = x[keep].astype(np.int64).astype('float64')
+    y = np.log10(y[keep]) if logy else y[keep]
+
+    def edges(values, n):
+        low, high = values.min(), values.max()
+        if high <= low:
+            high = low + 1
+        return np.linspace(low, high, n + 1)
+
+    xedges, yedges = edges(x, bins[0]), edges(y, bins[1])
+    counts, _, _ = np.histogram2d(x, y, bins=[xedges, yedges])
+    red, green, blue, _ = to_rgba(color)
+    cmap = LinearSegmentedColormap.from_list(
+        'density', [(red, green, blue, 0.15), (red, green, blue, 1.0)])
+    return ax.pcolormesh(xedges.astype(np.int64).astype('datetime64[ns]'),
+                         10 ** yedges if logy else yedges,
+                         np.ma.masked_equal(counts.T, 0), cmap=cmap,
+                         norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)),
+                         shading='flat', label=label)
+
+
+def facet_pages(zips: List[int],
+                per_page: int = FACET_PAGE_SIZE) -> List[List[int]]:
+    """ zips split into the zip codes of each figure """
+    return [zips[i:i + per_page] for i in range(0, len(zips), per_page)]
+
+
+def page_filenames(filename: Union[str, None],
+                   pages: int) -> List[Union[str, None]]:
+    """
+    The file each page of a figure is saved to, e.g. zips.png, or
+    zips-p1.png, zips-p2.png, ... if there is more than one page.
+    """
+    if filename is None or pages == 1:
+        return [filename] * pages
+    root, ext = os.path.splitext(filename)
+    return ['{:s}-p{:d}{:s}'.format(root, page + 1, ext)
+            for page in range(pages)]
+
+
+def facet_figure(n: int):
+    """
+    A figure of n axes sharing the time axis: one above the other for up
+    to three, else small multiples FACET_COLUMNS wide.
+
+    Returns
+    -------
+    the figure, the list of axes and a list of whether each axes is at the
+    bottom of its column
+    """
+    import matplotlib.pyplot as plt
+    if n <= 3:
+        columns, rows, size = 1, n, (8, 8)
+    else:
+        columns = FACET_COLUMNS
+        rows = -(-n // columns)
+        size = (4 * columns, 2.5 * rows + 1)
+    fig, axs = plt.subplots(rows, columns, sharex='all', figsize=size,
+                            squeeze=False, layout='constrained')
+    axs = list(axs.flat)
+    for ax in axs[n:]:
+        ax.remove()
+    bottom = [i + columns >= n for i in range(n)]
+    for ax, at_bottom in zip(axs, bottom):
+        if at_bottom:
+            ax.xaxis.set_tick_params(labelbottom=True)
+    return fig, axs[:n], bottom
+
+
+def positions_by_zip(zipcodes: pd.Series, mask: Union[pd.Series, None] = None
+                     ) -> dict:
+    """ the positions of the rows of each zip code (where mask is True) """
+    import numpy as np
+    import pandas as pd
+    if mask is None:
+        positions = np.arange(zipcodes.shape[0])
+    else:
+        positions = np.flatnonzero(mask.to_numpy(dtype=bool, na_value=False))
+    return pd.Index(positions).groupby(zipcodes.to_numpy()[positions])
+
+
+def show_or_save(fig, filename: Union[str, None] = None) -> None:
+    """ shows fig, or saves it to filename and closes it """
+    import matplotlib.pyplot as plt
+    if filename is None:
+        plt.show()
+    else:
+        fig.savefig(filename)
+        plt.close(fig)
 
 
 def median_by_year_month(df: pd.DataFrame) -> pd.DataFrame:
@@ -21,11 +221,12 @@ def median_by_year_month(df: pd.DataFrame) -> pd.DataFrame:
     -------
     pandas dataframe
     """
+    import pandas as pd
     dt = pd.DatetimeIndex(df[df.columns[0]])
     gb = df.groupby([dt.year, dt.month]).median()
-    gb.index = pd.to_datetime(gb.index.map(
-        lambda x: '{:d} {:d} 15'.format(x[0], x[1])
-    ))
+    gb.index = pd.to_datetime({'year': gb.index.get_level_values(0),
+                               'month': gb.index.get_level_values(1),
+                               'day': 15})
     return gb
 
 
@@ -49,16 +250,20 @@ def median_by_year(df: pd.DataFrame) -> pd.DataFrame:
     -------
     pandas dataframe
     """
+    import pandas as pd
     dt = pd.DatetimeIndex(df[df.columns[0]])
     gb = df.groupby([dt.year]).median()
-    gb.index = pd.to_datetime(gb.index.map(
-        lambda x: '{:d}'.format(x + 1)
-    ))
+    gb.index = pd.to_datetime({'year': gb.index + 1, 'month': 1, 'day': 1})
     return gb
 
+
 def make_zipcode_plot(df: pd.DataFrame,
                       plot_what: str = 'AssessedValue',
-                      index: Union[str, None] = 'UrbanShelterIndex') -> None:
+                      index: Union[str, None] = 'UrbanShelterIndex',
+                      base: str = INFLATION_BASE,
+                      density: bool = False,
+                      zips: Union[List[int], None] = None,
+                      filename: Union[str, None] = None) -> None:
     """
 
     Parameters
@@ -70,44 +275,74 @@ def make_zipcode_plot(df: pd.DataFrame,
         'AssessedValue'.
     index : str
         Which inflation index to use.  Usually 'LAGoodsIndex' or
-        'UrbanShelterIndex'.
+        'UrbanShelterIndex'.  None plots nominal dollars.
+    base : str
+        The month whose dollars to plot in, e.g. '2019-06'.
+    density : bool
+        Shade a 2D histogram of the sales (see density_mesh) instead of
+        drawing a marker per sale.
+    zips : List[int]
+        The zip codes to plot, FACET_PAGE_SIZE to a figure (see
+        facet_figure).  The current region's if None.
+    filename : str
+        Save the figure here instead of showing it, see page_filenames.
 
     Returns
     -------
     Nothing.
     """
-    if index is None:
-        divisor = df['ZipCode'].copy(deep=False).values.fill(1)
-    else:
-        divisor = df[index]
+    if zips is None:
+        zips = get_region().zips
+    divisor = inflation_divisor(df, index, base)
     x = df['RecordingDate']
     y = 100 * df[plot_what] / divisor
+    # the positions of each zip code's rows, found in one pass
+    rows = positions_by_zip(df['ZipCode'], df[plot_what] > 1000)
 
     colors = ['r', 'b', 'm']
-    fig, axs = plt.subplots(len(DEFAULT_ZIPS), 1, sharex='col', figsize=(8, 8))
-    for zipcode, color, ax in zip(DEFAULT_ZIPS, colors, axs):
-        strzc = str(zipcode)
-        mask = (df['ZipCode'] == zipcode) & (df[plot_what] > 1000)
-        ax.scatter(x[mask], y[mask], s=1, c=color, marker='.', label=strzc)
-        ax.set_yscale('log')
-        ax.set_ylabel('June 2019 Dollars')
-        ax.set_title(strzc + ' : ' + index)
-        if ax == axs[-1]:
-            ax.set_xlabel('RecordingDate')
-    plt.show()
-
-
-def make_bedroom_plots(df: pd.DataFrame,
+    pages = facet_pages(zips)
+    for page_zips, page_file in zip(pages,
+                                    page_filenames(filename, len(pages))):
+        fig, axs, bottom = facet_figure(len(page_zips))
+        for i, (zipcode, ax) in enumerate(zip(page_zips, axs)):
+            color = colors[i % len(colors)]
+            strzc = str(zipcode)
+            mask = rows.get(zipcode, [])
+            if density:
+                density_mesh(ax, x.iloc[mask], y.iloc[mask], color,
+                             label=strzc)
+            else:
+                ax.scatter(x.iloc[mask], y.iloc[mask], s=1, c=color,
+                           marker='.', label=strzc)
+            ax.set_yscale('log')
+            ax.set_ylabel(dollars_label(index, base))
+            ax.set_title(strzc + ' : ' + str(index))
+            if bottom[i]:
+                ax.set_xlabel('RecordingDate')
+        show_or_save(fig, page_file)
+
+
+def make_bedroom_plots(df: Union[pd.DataFrame, None] = None,
                        beds: List[int] = [1, 2, 3],
                        plot_what: str = 'DTTSalePrice',
                        index: Union[str, None] = 'CPI-WIndex',
-                       logplot: bool = True) -> None:
+                       logplot: bool = True,
+                       base: str = INFLATION_BASE,
+                       cube: Union[AggregateCube, None] = None,
+                       density: bool = False,
+                       zips: Union[List[int], None] = None,
+                       filename: Union[str, None] = None) -> None:
     """
+    The sales of each number of bedrooms in each zip code, with their
+    yearly median as a step.  The medians come from an aggregate cube (see
+    real/cube.py), so without df the monthly medians are plotted in place
+    of the sales and no rows are read.
 
     Parameters
     ----------
     df : pandas dataframe
-        Dataframe of housing information produced by json_reader.
+        Dataframe of housing information produced by json_reader.  None
+        plots from the cube alone.
     beds : List[int]
         Make the plot for these numbers of bedrooms.
     plot_what : str
@@ -118,58 +353,94 @@ def make_bedroom_plots(df: pd.DataFrame,
         'UrbanShelterIndex'.
     logplot : bool
         Whether the vertical scale should be log (True) or linear (False).
+    base : str
+        The month whose dollars to plot in, e.g. '2000-01'.
+    cube : AggregateCube
+        The cube to read medians from.  If None it is built from df, or the
+        saved cube is used if there is no df.
+    density : bool
+        Shade a 2D histogram of the sales (see density_mesh) instead of
+        drawing a marker per sale.
+    zips : List[int]
+        The zip codes to plot, FACET_PAGE_SIZE to a figure (see
+        facet_figure).  The current region's if None.
+    filename : str
+        Save the figure here instead of showing it, see page_filenames.
 
     Returns
     -------
     Nothing.
     """
-    if index is None:
-        df['divisor'] = pd.Series(1, df.index, name='divisor')
-    else:
-        df['divisor'] = df[index]
-
-    price_mask = (df[plot_what] < 1e7) & (df[plot_what] > 1e5)
-    df2 = df[price_mask]
+    import pandas as pd
+    from .real.cube import AggregateCube, get_cube
+    if zips is None:
+        zips = get_region().zips
+    if cube is None:
+        if df is None:
+            cube = get_cube()
+        else:
+            cube = AggregateCube.build(df, columns=[plot_what])
+    if df is not None:
+        df['divisor'] = inflation_divisor(df, index, base)
+        price_mask = (df[plot_what] < 1e7) & (df[plot_what] > 1e5)
+        df2 = df[price_mask]
+    years = pd.to_datetime(['2006', '2020'])
 
     colors = ['r', 'b', 'm']
     markers = ['o', 's', 'x']
-    fig, axs = plt.subplots(len(DEFAULT_ZIPS), 1, sharex='col', figsize=(8, 8))
-    for bed in beds:
-        subdf = df2[df2['NumOfBeds'] == bed].dropna(inplace=False,
-                                                    subset=[plot_what])
-        xy = pd.DataFrame({'time': subdf['RecordingDate'],
-                           'value': 100 * subdf[plot_what] / subdf['divisor']})
-        color = colors[bed % len(colors)]
-        marker = markers[bed % len(markers)]
-        for zipcode, ax in zip(DEFAULT_ZIPS, axs):
-            strzc = str(zipcode)
-            mask = subdf['ZipCode'] == zipcode
-            meds = []
-            for year in [2006, 2020]:
-                year_mask = pd.DatetimeIndex(xy['time']).year == year
-                meds.append(xy[mask & year_mask].loc[:, 'value'].median())
-            aprec = 100 * (meds[1] - meds[0]) / meds[0]
-            label = str(bed) + ' beds ' + '{: 3.1f}%'.format(aprec)
-            ax.scatter(xy[mask].loc[:, 'time'],
-                       xy[mask].loc[:, 'value'],
-                       s=2, c=color, marker=marker,
-                       label=label, alpha=0.3)
-            # the following makes the plot too busy
-            # ax.axhline(meds[0],
-            #            color=color, linestyle='dashed')
-            trend = median_by_year(xy[mask])
-            ax.step(x=trend.index, y=trend['value'],
-                    color=color, linestyle='solid')
-            if logplot:
-                ax.set_yscale('log')
-            ax.set_ylabel(plot_what)
-            ax.set_title(strzc + ' : ' + str(index) +
-                         ' : ' + 'Jan 2000 Dollars')
-            ax.legend(loc='upper left')
-            if ax == axs[-1]:
-                ax.set_xlabel('RecordingDate')
-    plt.show()
-
-
-
-
+    sales = {}  # each number of bedrooms' (sales, their rows by zip code)
+    if df is not None:
+        for bed in beds:
+            subdf = df2[df2['NumOfBeds'] == bed].dropna(inplace=False,
+                                                        subset=[plot_what])
+            xy = pd.DataFrame({'time': subdf['RecordingDate'],
+                               'value': 100 * subdf[plot_what] /
+                               subdf['divisor']})
+            sales[bed] = xy, positions_by_zip(subdf['ZipCode'])
+    pages = facet_pages(zips)
+    for page_zips, page_file in zip(pages,
+                                    page_filenames(filename, len(pages))):
+        fig, axs, bottom = facet_figure(len(page_zips))
+        for bed in beds:
+            color = colors[bed % len(colors)]
+            marker = markers[bed % len(markers)]
+            for i, (zipcode, ax) in enumerate(zip(page_zips, axs)):
+                strzc = str(zipcode)
+                trend = cube.select(plot_what, index, 'Y', zipcode, bed,
+                                    base)
+                meds = trend['median'].reindex(years).to_numpy()
+                aprec = 100 * (meds[1] - meds[0]) / meds[0]
+                label = str(bed) + ' beds ' + '{: 3.1f}%'.format(aprec)
+                if df is not None:
+                    xy, rows = sales[bed]
+                    zip_xy = xy.iloc[rows.get(zipcode, [])]
+                if df is not None and density:
+                    density_mesh(ax, zip_xy['time'], zip_xy['value'], color,
+                                 logy=logplot)
+                elif df is not None:
+                    ax.scatter(zip_xy['time'], zip_xy['value'],
+                               s=2, c=color, marker=marker,
+                               label=label, alpha=0.3)
+                else:
+                    monthly = cube.select(plot_what, index, 'M', zipcode,
+                                          bed, base)
+                    ax.scatter(monthly.index + pd.Timedelta(days=14),
+                               monthly['median'], s=2, c=color,
+                               marker=marker, label=label, alpha=0.6)
+                # the following makes the plot too busy
+                # ax.axhline(meds[0],
+                #            color=color, linestyle='dashed')
+                # a year's median is drawn up to the start of the next year,
+                # see median_by_year
+                ax.step(x=trend.index + pd.DateOffset(years=1),
+                        y=trend['median'], color=color, linestyle='solid',
+                        label=label if density and df is not None else None)
+                if logplot:
+                    ax.set_yscale('log')
+                ax.set_ylabel(plot_what)
+                ax.set_title(strzc + ' : ' + str(index) +
+                             ' : ' + dollars_label(index, base))
+                ax.legend(loc='upper left')
+                if bottom[i]:
+                    ax.set_xlabel('RecordingDate')
+        show_or_save(fig, page_file)
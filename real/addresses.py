@@ -1,9 +1,23 @@
+# numpy and pandas are imported when a function needs them, so that
+# importing the address helpers is quick
+from __future__ import annotations
 
-import numpy as np
-import pandas as pd
-from typing import List, Generator
+import os
+import hashlib
+import importlib.util
 
-from ..resources.defaults import ADDRESS_FILE, DEFAULT_ZIPS, ROW_ELEMENTS
+from typing import TYPE_CHECKING, List, Generator, Union
+
+from ..resources.defaults import (ADDRESS_FILE, ROW_ELEMENTS,
+                                  ADDRESS_COLUMNS, ADDRESS_CHUNK_ROWS,
+                                  ADDRESS_CACHE_LOC, SEARCH_URL)
+from .region import get_region
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# kinds of UNIT_RANGE, see parse_unit_ranges
+UNIT_NONE, UNIT_NUMBERS, UNIT_LETTERS, UNIT_ODD = range(4)
 
 
 def get_address_csv(af: str = ADDRESS_FILE) -> pd.DataFrame:
@@ -19,11 +33,12 @@ def get_address_csv(af: str = ADDRESS_FILE) -> pd.DataFrame:
     -------
     pandas dataframe
     """
+    import pandas as pd
     return pd.read_csv(af)
 
 
 def prune_by_zipcode(df: pd.DataFrame,
-                     zipcodes: List[int] = DEFAULT_ZIPS) -> pd.DataFrame:
+                     zipcodes: Union[List[int], None] = None) -> pd.DataFrame:
     """
     Masks the dataframe to only contain the desired zip codes.
     Parameters
@@ -31,18 +46,122 @@ def prune_by_zipcode(df: pd.DataFrame,
     df : pd.DataFrame
         The dataframe to mask
     zipcodes : List[int]
-        The zip codes to keep.
+        The zip codes to keep.  The current region's if None (see
+        region.get_region).
 
     Returns
     -------
     pandas dataframe
     """
-    mask = pd.Series([False] * df.shape[0], name='zip_mask', dtype=bool)
-    for zipcode in zipcodes:
-        new = df['ZIP_CD'] == zipcode
-        mask = mask | new
+    if zipcodes is None:
+        zipcodes = get_region().zips
+    return df[df['ZIP_CD'].isin(list(zipcodes))].copy()
+
+
+def read_address_csv(af: str = ADDRESS_FILE,
+                     zipcodes: Union[List[int], None] = None,
+                     columns: List[str] = ADDRESS_COLUMNS,
+                     chunk_rows: int = ADDRESS_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Reads the addresses in zipcodes out of the address book a chunk at a
+    time, so only one chunk of the city is in memory at once.  Only columns
+    are read, all as text except ZIP_CD, and the index is the row number in
+    the csv.
+
+    Parameters
+    ----------
+    af : str
+        The address file.
+    zipcodes : List[int]
+        The zip codes to keep.  The current region's if None (see
+        region.get_region).
+    columns : List[str]
+        The columns to keep, ZIP_CD is always kept.
+    chunk_rows : int
+        Rows of the csv to read at a time.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    import pandas as pd
+    if 'ZIP_CD' not in columns:
+        columns = list(columns) + ['ZIP_CD']
+    zipcodes = list(get_region().zips if zipcodes is None else zipcodes)
+    kept = []
+    with pd.read_csv(af, usecols=columns, dtype=str,
+                     chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            zips = pd.to_numeric(chunk['ZIP_CD'], errors='coerce')
+            mask = zips.isin(zipcodes)
+            chunk = chunk[mask]
+            chunk['ZIP_CD'] = zips[mask].astype('int64')
+            kept.append(chunk[list(columns)])
+    return pd.concat(kept)
+
+
+def _cache_name(af: str, zipcodes: List[int], columns: List[str],
+                cache_loc: str) -> str:
+    """ the cache file for these zip codes, columns and version of af """
+    st = os.stat(af)
+    key = '{:s}:{:d}:{:d}:{}:{}'.format(os.path.abspath(af), st.st_mtime_ns,
+                                        st.st_size, sorted(set(zipcodes)),
+                                        list(columns))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    # a columnar file if pyarrow is installed, else a pickle
+    if importlib.util.find_spec('pyarrow') is not None:
+        extension = 'parquet'
+    else:
+        extension = 'pkl'
+    return os.sep.join([cache_loc, 'addresses-' + digest + '.' + extension])
+
+
+def load_addresses(zipcodes: Union[List[int], None] = None,
+                   af: str = ADDRESS_FILE,
+                   columns: List[str] = ADDRESS_COLUMNS,
+                   cache_loc: Union[str, None] = ADDRESS_CACHE_LOC
+                   ) -> pd.DataFrame:
+    """
+    The addresses in zipcodes, from the cache if they've been read before
+    or else read with read_address_csv and cached.  The cache is keyed by
+    the zip codes, the columns and the size and modification time of af,
+    so a new address book is read again.
 
-    return df[mask].copy()
+    Parameters
+    ----------
+    zipcodes : List[int]
+        The zip codes to keep.  The current region's if None (see
+        region.get_region).
+    af : str
+        The address file.
+    columns : List[str]
+        The columns to keep.
+    cache_loc : str
+        The cache directory.  None doesn't cache.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    import pandas as pd
+    if zipcodes is None:
+        zipcodes = get_region().zips
+    if cache_loc is None:
+        return read_address_csv(af, zipcodes, columns)
+    filename = _cache_name(af, zipcodes, columns, cache_loc)
+    if os.path.isfile(filename):
+        if filename.endswith('.parquet'):
+            return pd.read_parquet(filename)
+        return pd.read_pickle(filename)
+    df = read_address_csv(af, zipcodes, columns)
+    os.makedirs(cache_loc, exist_ok=True)
+    tmp = filename + '.tmp'
+    if filename.endswith('.parquet'):
+        df.to_parquet(tmp)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, filename)
+    return df
 
 
 def yield_units(row: pd.Series) -> Generator[str, None, None]:
@@ -77,10 +196,70 @@ def yield_units(row: pd.Series) -> Generator[str, None, None]:
             yield str(n)
 
 
+def parse_unit_ranges(ranges: pd.Series):
+    """
+    Parses UNIT_RANGE the way yield_units does, all at once.
+
+    Parameters
+    ----------
+    ranges : pd.Series
+        The UNIT_RANGE column.
+
+    Returns
+    -------
+    (starts, counts, kinds) numpy arrays, one entry per row: the first unit
+    number (or the character code of the first letter), how many units
+    there are, and UNIT_NONE for rows without units (one row, no UNIT),
+    UNIT_NUMBERS, UNIT_LETTERS, or UNIT_ODD for ranges that are left to
+    yield_units, e.g. with non-ASCII digits or that will raise in it.
+    """
+    import numpy as np
+    import pandas as pd
+    values = ranges.to_numpy(dtype=object)
+    n = values.shape[0]
+    starts = np.zeros(n, dtype=np.int64)
+    counts = np.ones(n, dtype=np.int64)
+    kinds = np.full(n, UNIT_NONE, dtype=np.int8)
+    is_str = np.fromiter((isinstance(v, str) for v in values), bool, n)
+    if not is_str.any():
+        return starts, counts, kinds
+    ur = pd.Series(values[is_str], dtype=object)
+    # sometimes there are leading ( and trailing ), strip them
+    ur = ur.str.split('(').str[-1].str.split(')').str[0]
+    parts = ur.str.split('-')
+    pair = (parts.str.len() == 2).to_numpy()
+    first = np.where(pair, parts.str[0], ur).astype(object)
+    last = np.where(pair, parts.str[1], ur).astype(object)
+    first, last = pd.Series(first), pd.Series(last)
+
+    digits = r'[0-9]{1,18}'  # fits in an int64
+    numbers = (first.str.fullmatch(digits) & last.str.fullmatch(digits))\
+        .to_numpy(dtype=bool)
+    # a single character int() won't take is a letter to yield_units
+    letters = ((first.str.len() == 1) & (last.str.len() == 1) &
+               ~first.str.isdecimal()).to_numpy(dtype=bool)
+    n_starts = np.zeros(ur.shape[0], dtype=np.int64)
+    n_ends = np.full(ur.shape[0], -1, dtype=np.int64)
+    n_starts[numbers] = first[numbers].astype(np.int64)
+    n_ends[numbers] = last[numbers].astype(np.int64)
+    n_starts[letters] = first[letters].map(ord).astype(np.int64)
+    n_ends[letters] = last[letters].map(ord).astype(np.int64)
+    n_kinds = np.full(ur.shape[0], UNIT_ODD, dtype=np.int8)
+    n_kinds[numbers] = UNIT_NUMBERS
+    n_kinds[letters] = UNIT_LETTERS
+
+    starts[is_str] = n_starts
+    # a range that ends before it starts has no units, the row is dropped
+    counts[is_str] = np.maximum(n_ends - n_starts + 1, 0)
+    kinds[is_str] = n_kinds
+    return starts, counts, kinds
+
+
 def split_up_units(df: pd.DataFrame) -> pd.DataFrame:
     """
     Splits up the addresses to include the units (apartments) as
-    separate entries.
+    separate entries.  UNIT_RANGE is parsed once for all the rows (see
+    parse_unit_ranges) and each row is repeated once per unit.
 
     Parameters
     ----------
@@ -91,21 +270,35 @@ def split_up_units(df: pd.DataFrame) -> pd.DataFrame:
     -------
     pandas dataframe
     """
+    import numpy as np
+    import pandas as pd
     df['UNIT'] = pd.Series(dtype=str)  # adds the UNIT column to the df
 
-    rows = []  # this is going to grow really large
-    # rows are tuples (index, columns), throw away the index
-    for row in df.iterrows():
-        try:
-            _ = np.isnan(row[1]['UNIT_RANGE'])
-        except TypeError:  # UNIT_RANGE is a string, just what we want
-            for unit in yield_units(row[1]):
-                t = row[1]
-                t['UNIT'] = unit
-                rows.append(t.copy())
-        else:  # nan means no units in the building, just append
-            rows.append(row[1].copy())
-    return pd.DataFrame(rows).reset_index(drop=True)
+    starts, counts, kinds = parse_unit_ranges(df['UNIT_RANGE'])
+    odd = np.flatnonzero(kinds == UNIT_ODD)
+    odd_units = [list(yield_units({'UNIT_RANGE': df['UNIT_RANGE'].iat[i]}))
+                 for i in odd]
+    counts[odd] = [len(units) for units in odd_units]
+
+    rows = np.repeat(np.arange(df.shape[0]), counts)
+    # position of each unit within its building
+    offsets = np.arange(rows.shape[0]) - np.repeat(np.cumsum(counts) - counts,
+                                                   counts)
+    codes = starts[rows] + offsets
+    row_kinds = kinds[rows]
+    units = np.full(rows.shape[0], np.nan, dtype=object)
+    mask = row_kinds == UNIT_NUMBERS
+    units[mask] = codes[mask].astype(str)
+    mask = row_kinds == UNIT_LETTERS
+    units[mask] = codes[mask].astype(np.uint32).view('U1')
+    mask = row_kinds == UNIT_ODD
+    if mask.any():
+        units[mask] = [unit for group in odd_units for unit in group]
+
+    out = df.iloc[rows].reset_index(drop=True)
+    out['UNIT'] = units
+    # types as if rebuilt from the rows, e.g. an all NaN column is float
+    return out.astype(object).infer_objects()
 
 
 def make_address_dict(row: pd.Series) -> dict:
@@ -152,3 +345,109 @@ def make_address_string(row: pd.Series) -> str:
             #     t = 'UNIT ' + str(t)
             adr.append(str(t))
     return ' '.join(adr).replace('  ', ' ')
+
+
+def _element_text(values: pd.Series) -> pd.Series:
+    """ the strings make_address_dict makes of a column """
+    import pandas as pd
+    if values.dtype.kind == 'f':
+        return pd.Series('', index=values.index, dtype=object)
+    if values.dtype.kind in 'iub':
+        return values.astype(str).astype(object)
+    # NaNs are floats
+    return pd.Series(['' if isinstance(t, float) else str(t)
+                      for t in values.to_numpy(dtype=object)],
+                     index=values.index, dtype=object)
+
+
+def address_elements(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    make_address_dict for every row of an address dataframe at once: the
+    ROW_ELEMENTS columns as strings, with '' for NaNs.
+    """
+    import pandas as pd
+    return pd.DataFrame({elem: _element_text(df[elem])
+                         for elem in ROW_ELEMENTS}, index=df.index)
+
+
+def address_search_strings(df: pd.DataFrame,
+                           elements: Union[pd.DataFrame, None] = None
+                           ) -> pd.Series:
+    """
+    scraper.make_address_search_string for every row of an address
+    dataframe at once.  elements is address_elements(df) if already made.
+    """
+    if elements is None:
+        elements = address_elements(df)
+    joined = elements[ROW_ELEMENTS[0]]
+    for elem in ROW_ELEMENTS[1:]:
+        joined = joined + '%20' + elements[elem]
+    return (SEARCH_URL + joined).rename('SearchString')
+
+
+def address_keys(df: pd.DataFrame,
+                 elements: Union[pd.DataFrame, None] = None) -> pd.Series:
+    """
+    coverage.address_key for every row of an address dataframe at once,
+    comparable to situs_keys of the SitusStreet and SitusZipCode the
+    Assessor returns.  elements is address_elements(df) if already made.
+    """
+    from .coverage import situs_keys
+    if elements is None:
+        elements = address_elements(df)
+    street = None
+    for elem in ROW_ELEMENTS:
+        if elem != 'ZIP_CD':
+            street = elements[elem] if street is None \
+                else street + ' ' + elements[elem]
+    return situs_keys(street, elements['ZIP_CD']).rename('AddressKey')
+
+
+def canonicalize_addresses(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the AddressKey and SearchString columns to an address dataframe
+    (see address_keys and address_search_strings), so searches and joins
+    with an AIN dataframe don't need to rebuild them row by row.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The address dataframe.
+
+    Returns
+    -------
+    df, with the columns added
+    """
+    elements = address_elements(df)
+    df['AddressKey'] = address_keys(df, elements)
+    df['SearchString'] = address_search_strings(df, elements)
+    return df
+
+
+def canonicalize_results(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the AddressKey column to an AIN dataframe, from SitusStreet and
+    SitusZipCode normalized as in canonicalize_addresses, so that it can be
+    merged with an address dataframe on AddressKey.  Rows without a
+    SitusStreet get no key, and only rows without a key yet (rows added
+    since the last call) are worked out again.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The AIN dataframe.
+
+    Returns
+    -------
+    df, with the column added
+    """
+    from .coverage import situs_keys
+    streets = df['SitusStreet']
+    known = streets.map(lambda street: isinstance(street, str)).astype(bool)
+    if 'AddressKey' in df.columns:
+        known &= df['AddressKey'].isna()
+    keys = situs_keys(streets[known], df['SitusZipCode'][known])
+    if 'AddressKey' in df.columns:
+        keys = df['AddressKey'].fillna(keys)
+    df['AddressKey'] = keys
+    return df
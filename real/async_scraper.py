@@ -0,0 +1,431 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from typing import List, Set, Union, Tuple
+
+from ..resources.defaults import (TYPES, COLUMNS, DEFAULT_LOC,
+                                  ASYNC_CONCURRENCY, ASYNC_RATE)
+from .addresses import make_address_dict, make_address_string
+from .scraper import (AINData,
+                      make_ain_url,
+                      make_address_search_string,
+                      add_matching_parcels,
+                      save_json
+                      )
+from .store import RecordStore
+from .client import get_client, AssessorError, CircuitOpenError
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter shared by every request the async scraper
+    makes.  Tokens are added at rate per second up to burst tokens, and each
+    request consumes one.
+    """
+    def __init__(self, rate: float = ASYNC_RATE, burst: int = 1):
+        """
+
+        Parameters
+        ----------
+        rate : float
+            Requests per second allowed on average.
+        burst : int
+            The most requests that can be sent back-to-back after an idle
+            period.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self) -> None:
+        """ waits until a token is available and then takes it """
+        # the lock makes waiters queue up in order instead of racing
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+async def fetch_json(url: str,
+                     limiter: TokenBucket,
+                     semaphore: asyncio.Semaphore) -> dict:
+    """
+    Fetches and decodes a url once the limiter allows it.  The blocking
+    request goes through the shared client.AssessorClient, which retries and
+    backs off on its own, in the event loop's thread pool.  Cached responses
+    are returned straight away, without waiting for the limiter.
+
+    Parameters
+    ----------
+    url : str
+        The url to fetch.
+    limiter : TokenBucket
+        The rate limiter shared by all requests.
+    semaphore : asyncio.Semaphore
+        Bounds the number of requests in flight.
+
+    Returns
+    -------
+    dict of json information
+    """
+    client = get_client()
+    data = client.cached_json(url)
+    if data is not None:
+        return data
+    async with semaphore:
+        await limiter.acquire()
+        return await asyncio.to_thread(client.fetch_json, url)
+
+
+async def async_scrape(ain: int,
+                       limiter: TokenBucket,
+                       semaphore: asyncio.Semaphore,
+                       infos: List[str] = list(TYPES.keys())) -> dict:
+    """
+    Scrapes the LA Assessor's API for all information requested in infos,
+    with all of the infos in flight at once.
+
+    Parameters
+    ----------
+    ain : int
+        The Assessor's ID Number (AIN) for the property.
+    limiter : TokenBucket
+        The rate limiter shared by all requests.
+    semaphore : asyncio.Semaphore
+        Bounds the number of requests in flight.
+    infos : List[str]
+        The list of keys in TYPES variable to fetch from the server.
+
+    Returns
+    -------
+    dict of json information
+    """
+    infos = [info for info in infos if make_ain_url(ain, info) is not None]
+    results = await asyncio.gather(*[
+        fetch_json(make_ain_url(ain, info), limiter, semaphore)
+        for info in infos
+    ])
+    return dict(zip(infos, results))
+
+
+async def async_scrape_ains(address_df: pd.DataFrame,
+                            limiter: TokenBucket,
+                            semaphore: asyncio.Semaphore,
+                            results_df: Union[pd.DataFrame, None] = None,
+                            number: Union[int, None] = None,
+                            failed: Union[Set, None] = None
+                            ) -> Tuple[bool, pd.DataFrame, pd.DataFrame]:
+    """
+    Asynchronous version of scraper.scrape_ains.  Searches for the AINs of
+    "number" of the un-searched entries in address_df concurrently.  If the
+    circuit opens the searches already answered are kept and the rest are
+    left un-searched.
+
+    Parameters
+    ----------
+    address_df : pd.DataFrame
+        Pandas dataframe with addresses to scrape for.
+    limiter : TokenBucket
+        The rate limiter shared by all requests.
+    semaphore : asyncio.Semaphore
+        Bounds the number of requests in flight.
+    results_df : pd.DataFrame
+        Dataframe to add discovered addresses to.
+    number : int
+        The number of previously un-scraped rows to scrape.
+    failed : set
+        Index labels of rows whose searches failed earlier in the run.  They
+        are skipped, and the rows that fail now are added, so a run of
+        failing rows can't hold up the rows after them.
+
+    Returns
+    -------
+    bool that is True if any search succeeded and the circuit didn't open,
+    and the pandas dataframe with new AINs added
+    """
+    if 'Searched' not in address_df.columns:
+        address_df['Searched'] = False
+    if results_df is None:  # create a new dataframe if necessary
+        results_df = pd.DataFrame(columns=COLUMNS)
+    if failed is None:
+        failed = set()
+
+    pending = address_df.index[~address_df['Searched'].astype(bool)]
+    if failed:
+        pending = pending[~pending.isin(list(failed))]
+    if number is not None:
+        pending = pending[:number]
+
+    async def search(index) -> Union[dict, None, CircuitOpenError]:
+        addr = make_address_dict(address_df.loc[index])
+        print('Searching for ({:d}/{:d}): {:s}'.format(
+            index + 1, address_df.shape[0], make_address_string(addr)))
+        try:
+            return await fetch_json(make_address_search_string(addr),
+                                    limiter, semaphore)
+        except CircuitOpenError as e:
+            return e  # the server is down, keep the other answers
+        except AssessorError as e:
+            print('Search failed for row {:d}'.format(index))
+            print(e)
+            return None
+
+    results = await asyncio.gather(*[search(index) for index in pending])
+
+    new_rows = {c: [] for c in COLUMNS}
+    succeeded = circuit_open = False
+    for index, result in zip(pending, results):
+        if isinstance(result, CircuitOpenError):
+            circuit_open = True  # left un-searched, not counted as failed
+            continue
+        if result is None:
+            failed.add(index)  # un-searched, so the next run tries again
+            continue
+        new_rows = add_matching_parcels(new_rows, result)
+        address_df.loc[index, 'Searched'] = True  # mark it searched
+        succeeded = True
+    if circuit_open:
+        print('Circuit open, stopping with what was found')
+
+    results_df = pd.concat([results_df, pd.DataFrame(new_rows)])\
+        .drop_duplicates('AIN').reset_index(drop=True)
+    return succeeded and not circuit_open, address_df, results_df
+
+
+async def async_scrape_data_for_ains(ain_df: pd.DataFrame,
+                                     limiter: TokenBucket,
+                                     semaphore: asyncio.Semaphore,
+                                     number: int = 100,
+                                     location: Union[str, None] = None,
+                                     infos: List[str] = list(TYPES.keys()),
+                                     store: Union[RecordStore, None] = None,
+                                     failed: Union[Set, None] = None
+                                     ) -> bool:
+    """
+    Asynchronous version of scraper.scrape_data_for_ains.  Scrapes the data
+    requested in infos for "number" of the un-scraped rows in ain_df
+    concurrently.  If the circuit opens the data already scraped is kept.
+
+    Parameters
+    ----------
+    ain_df : pd.DataFrame
+        Dataframe with Assessor's ID Numbers to search for.
+    limiter : TokenBucket
+        The rate limiter shared by all requests.
+    semaphore : asyncio.Semaphore
+        Bounds the number of requests in flight.
+    number : int
+        The number of records to scrape.
+    location : str
+        Directory where to store the scraped data.
+    infos : dict
+        dictionary of types to scrape for.  See defaults.py
+    store : RecordStore
+        If given, the data is saved to this store instead of location.
+    failed : set
+        Index labels of rows whose scrapes failed earlier in the run.  They
+        are skipped, and the rows that fail now are added.
+
+    Returns
+    -------
+    Boolean: true if any data was scraped and the circuit didn't open
+    """
+    if 'Scraped' not in ain_df.columns:
+        ain_df['Scraped'] = False
+    if location is None:
+        location = DEFAULT_LOC
+    if failed is None:
+        failed = set()
+
+    pending = ain_df.index[ain_df['Scraped'] != True]  # noqa: E712
+    if failed:
+        pending = pending[~pending.isin(list(failed))]
+    pending = pending[:number]
+
+    async def scrape_row(index) -> Union[dict, None, CircuitOpenError]:
+        row = ain_df.loc[index]
+        rs = '{:s}, {:s}'.format(row['AIN'], row['SitusStreet'])
+        print('scraping info for ({:d}/{:d}): {:s}'.format(
+            index + 1, ain_df.shape[0], rs))
+        try:
+            return await async_scrape(row['AIN'], limiter, semaphore, infos)
+        except CircuitOpenError as e:
+            return e  # the server is down, keep the other answers
+        except AssessorError as e:
+            print('Scrape failed for AIN {}'.format(row['AIN']))
+            print(e)
+            return None
+
+    results = await asyncio.gather(*[scrape_row(index) for index in pending])
+
+    scraped = circuit_open = False
+    for index, data in zip(pending, results):
+        if isinstance(data, CircuitOpenError):
+            circuit_open = True
+            continue
+        if data is None:
+            failed.add(index)
+            continue
+        save_json(data=data,
+                  name=str(ain_df.loc[index, 'AIN']),
+                  location=location,
+                  store=store)
+        ain_df.loc[index, 'Scraped'] = True
+        scraped = True
+    if circuit_open:
+        print('Circuit open, stopping with what was scraped')
+    return scraped and not circuit_open
+
+
+def _run(coroutine_function, concurrency: int, rate: float, burst: int):
+    """
+    Runs coroutine_function(limiter, semaphore) in a fresh event loop whose
+    thread pool is large enough for concurrency blocking requests.
+    """
+    async def main():
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=concurrency))
+        limiter = TokenBucket(rate=rate, burst=burst)
+        semaphore = asyncio.Semaphore(concurrency)
+        return await coroutine_function(limiter, semaphore)
+    return asyncio.run(main())
+
+
+def async_scrape_ains_for_file(address_file: str,
+                               results_file: Union[str, None] = None,
+                               chunk_size: int = 100,
+                               chunks: Union[int, None] = None,
+                               concurrency: int = ASYNC_CONCURRENCY,
+                               rate: float = ASYNC_RATE,
+                               burst: int = 1
+                               ) -> None:
+    """
+    Asynchronous alternative to scraper.scrape_ains_for_file.  Keeps up to
+    concurrency searches in flight while a single token bucket holds the
+    request rate to at most rate per second.
+
+    Parameters
+    ----------
+    address_file : str
+        File to open and scrape with.  Pandas data pickle file.
+    results_file : str
+        File to add discovered AINs to.  Pandas data pickle file.
+    chunk_size : int
+        How many addresses to search between saves.
+    chunks : int
+        How many times to run chunk_size searches and then save.
+    concurrency : int
+        The most requests in flight at once.
+    rate : float
+        Requests per second allowed on average.
+    burst : int
+        The most requests that can be sent back-to-back.
+
+    Returns
+    -------
+    Nothing.
+    """
+    if chunks is None:
+        chunks = 999999999999999999
+
+    async def work(limiter, semaphore):
+        chunk = 0
+        failed: set = set()
+        with AINData(address_file, 'address') as add, \
+                AINData(results_file, 'results') as res:
+            while chunk < chunks:
+                searched = add.flags('Searched')
+                found = res.df.shape[0]
+                n_failed = len(failed)
+                keep_scraping, add.df, res.df = await async_scrape_ains(
+                    address_df=add.df, limiter=limiter, semaphore=semaphore,
+                    results_df=res.df, number=chunk_size, failed=failed)
+                res.checkpoint(n_rows=found)
+                add.checkpoint('Searched', searched)
+                chunk += 1
+                print('results_df is now {:d} long'.format(res.df.shape[0]))
+                if not keep_scraping and len(failed) == n_failed:
+                    break  # all done, or the circuit opened
+        if failed:
+            print('{:d} searches failed and were left for the next '
+                  'run'.format(len(failed)))
+
+    _run(work, concurrency, rate, burst)
+
+
+def async_scrape_chunks_for_ains(ain_df: str,
+                                 chunk_size: int = 100,
+                                 chunks: Union[int, None] = None,
+                                 location: Union[str, None] = None,
+                                 infos: List[str] = list(TYPES.keys()),
+                                 concurrency: int = ASYNC_CONCURRENCY,
+                                 rate: float = ASYNC_RATE,
+                                 burst: int = 1,
+                                 store: Union[RecordStore, None] = None
+                                 ) -> None:
+    """
+    Asynchronous alternative to scraper.scrape_chunks_for_ains.  Keeps up to
+    concurrency requests in flight while a single token bucket holds the
+    request rate to at most rate per second.
+
+    Parameters
+    ----------
+    ain_df : str
+        File of AINs to scrape.  Pandas data pickle file.
+    chunk_size : int
+        How many AINs to scrape between saves.
+    chunks : int
+        How many times to run chunk_size scrapes and then save.
+    location : str
+        Directory where to store the scraped data.
+    infos : List[str]
+        The list of keys in TYPES variable to fetch from the server.
+    concurrency : int
+        The most requests in flight at once.
+    rate : float
+        Requests per second allowed on average.
+    burst : int
+        The most requests that can be sent back-to-back.
+    store : RecordStore
+        If given, the data is saved to this store instead of location.
+
+    Returns
+    -------
+    Nothing.
+    """
+    if chunks is None:
+        chunks = 999999999999999999
+
+    async def work(limiter, semaphore):
+        chunk = 0
+        failed: set = set()
+        with AINData(ain_df) as ain:
+            while chunk < chunks:
+                scraped = ain.flags('Scraped')
+                n_failed = len(failed)
+                keep_scraping = await async_scrape_data_for_ains(
+                    ain_df=ain.df, limiter=limiter, semaphore=semaphore,
+                    number=chunk_size, location=location, infos=infos,
+                    store=store, failed=failed)
+                ain.checkpoint('Scraped', scraped)
+                chunk += 1
+                if not keep_scraping and len(failed) == n_failed:
+                    break  # all done, or the circuit opened
+        if failed:
+            print('{:d} scrapes failed and were left for the next '
+                  'run'.format(len(failed)))
+
+    _run(work, concurrency, rate, burst)
@@ -0,0 +1,143 @@
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from typing import Dict, Tuple, Union
+
+from ..resources.defaults import CACHE_FILE, CACHE_TTLS, CACHE_MAX_BYTES
+from .decoding import loads
+
+
+def cache_key(url: str) -> Tuple[str, str]:
+    """
+    Splits an Assessor's API url into its endpoint type (the last part of the
+    path, e.g. 'search' or 'parceldetail') and a normalized key made of the
+    endpoint and its sorted query parameters.
+
+    Parameters
+    ----------
+    url : str
+        The url to make a key for.
+
+    Returns
+    -------
+    (endpoint, key) tuple of strings
+    """
+    parts = urlsplit(url)
+    endpoint = parts.path.rstrip('/').split('/')[-1]
+    params = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    return endpoint, endpoint + '?' + urlencode(params)
+
+
+class ResponseCache:
+    """
+    An on-disk cache of decoded API responses, stored zlib-compressed in an
+    SQLite file.  Entries expire after a per-endpoint time-to-live and the
+    least recently used entries are evicted once the cache grows past
+    max_bytes.
+    """
+    def __init__(self,
+                 filename: str = CACHE_FILE,
+                 ttls: Union[Dict[str, Union[float, None]], None] = None,
+                 max_bytes: int = CACHE_MAX_BYTES,
+                 offline: bool = False):
+        """
+
+        Parameters
+        ----------
+        filename : str
+            The SQLite file holding the cache.  Created if missing.
+        ttls : dict
+            Seconds each endpoint type stays fresh, None for forever.
+            Endpoints missing from ttls use the 'default' entry.
+        max_bytes : int
+            The most compressed bytes to keep before evicting.
+        offline : bool
+            Serve only from the cache: stale entries are returned rather than
+            expired and nothing is fetched.
+        """
+        self.filename = filename
+        self.ttls = dict(CACHE_TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, endpoint TEXT, body BLOB, size INTEGER, '
+            'fetched REAL, accessed REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed '
+                           'ON responses (accessed)')
+        self._conn.commit()
+        self._size = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _ttl(self, endpoint: str) -> Union[float, None]:
+        return self.ttls.get(endpoint, self.ttls.get('default'))
+
+    def get(self, url: str) -> Union[dict, None]:
+        """
+        Returns the cached response for url, or None if it is missing or
+        expired.
+        """
+        endpoint, key = cache_key(url)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, fetched FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            ttl = self._ttl(endpoint)
+            if row is None or (not self.offline and ttl is not None and
+                               time.time() - row[1] > ttl):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                'UPDATE responses SET accessed = ? WHERE key = ?',
+                (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return loads(zlib.decompress(row[0]))
+
+    def put(self, url: str, data: dict) -> None:
+        """ stores the decoded response for url, evicting if necessary """
+        endpoint, key = cache_key(url)
+        body = zlib.compress(json.dumps(data).encode())
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                'SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, endpoint, body, len(body), now, now))
+            self._size += len(body) - (0 if old is None else old[0])
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """ drops least recently used entries until under max_bytes """
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT key, size FROM responses ORDER BY accessed LIMIT 100'
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute('DELETE FROM responses WHERE key = ?',
+                                   (key,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
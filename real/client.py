@@ -0,0 +1,351 @@
+import time
+import threading
+from random import random
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from typing import Union
+
+from ..resources.defaults import (CLIENT_POOL_SIZE, CLIENT_TIMEOUT,
+                                  CLIENT_MAX_RETRIES, CLIENT_BACKOFF,
+                                  CLIENT_MAX_BACKOFF, CLIENT_TARGET_LATENCY,
+                                  CLIENT_MAX_DELAY, CLIENT_BREAKER_FAILURES,
+                                  CLIENT_BREAKER_COOLDOWN, CACHE_OFFLINE)
+from .cache import ResponseCache
+from .decoding import loads
+
+# status codes worth trying again, everything else 4xx is the caller's fault
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AssessorError(Exception):
+    """ raised when the Assessor's API can't give a usable answer """
+
+
+class CircuitOpenError(AssessorError):
+    """ raised instead of sending a request while the circuit is open """
+
+
+class AdaptiveThrottle:
+    """
+    Spaces out requests by a delay that grows quickly when the server is
+    struggling (errors or slow responses) and shrinks slowly when it is
+    healthy: the delay doubles on trouble and decays by 10% on each healthy
+    response.
+    """
+    def __init__(self,
+                 target_latency: float = CLIENT_TARGET_LATENCY,
+                 max_delay: float = CLIENT_MAX_DELAY,
+                 min_delay: float = 0.0):
+        """
+
+        Parameters
+        ----------
+        target_latency : float
+            Responses slower than this, in seconds, count as trouble.
+        max_delay : float
+            The longest the throttle will wait between requests.
+        min_delay : float
+            The shortest the throttle will wait between requests.
+        """
+        self.target_latency = target_latency
+        self.max_delay = max_delay
+        self.min_delay = min_delay
+        self.delay = min_delay
+        self.latency = 0.0  # exponentially weighted moving averages
+        self.error_rate = 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """ blocks until the next request is allowed to go """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.delay
+        time.sleep(start - now)
+
+    def record(self, latency: Union[float, None], ok: bool) -> None:
+        """
+        Updates the delay with the outcome of a request.
+
+        Parameters
+        ----------
+        latency : float
+            How long the request took, None if it never got an answer.
+        ok : bool
+            Whether the response was usable.
+        """
+        with self._lock:
+            self.error_rate = 0.9 * self.error_rate + 0.1 * (not ok)
+            if latency is not None:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+            if not ok or self.latency > self.target_latency:
+                self.delay = min(self.max_delay,
+                                 max(2 * self.delay, 0.5))
+            elif self.error_rate < 0.05:
+                self.delay = max(self.min_delay, 0.9 * self.delay)
+                if self.delay < 0.01:
+                    self.delay = self.min_delay
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests after failures consecutive failures.  After
+    cooldown seconds a single trial request is let through: success closes
+    the circuit, failure opens it for another cooldown.
+    """
+    def __init__(self,
+                 failures: int = CLIENT_BREAKER_FAILURES,
+                 cooldown: float = CLIENT_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at: Union[float, None] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """ True if a request may be sent now """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = time.monotonic()  # half-open: one trial
+                return True
+            return False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.consecutive = 0
+                self.opened_at = None
+            else:
+                self.consecutive += 1
+                if self.consecutive >= self.failures:
+                    if self.opened_at is None:
+                        print('Circuit opened after {:d} failures'.format(
+                            self.consecutive))
+                    self.opened_at = time.monotonic()
+
+
+def retry_after_seconds(value: Union[str, None]) -> Union[float, None]:
+    """ parses a Retry-After header, which is either seconds or a date """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class AssessorClient:
+    """
+    A pooled, self-throttling client for the LA Assessor's API.
+    """
+    def __init__(self,
+                 pool_size: int = CLIENT_POOL_SIZE,
+                 timeout: float = CLIENT_TIMEOUT,
+                 max_retries: int = CLIENT_MAX_RETRIES,
+                 backoff: float = CLIENT_BACKOFF,
+                 max_backoff: float = CLIENT_MAX_BACKOFF,
+                 throttle: Union[AdaptiveThrottle, None] = None,
+                 breaker: Union[CircuitBreaker, None] = None,
+                 cache: Union[ResponseCache, None] = None):
+        """
+
+        Parameters
+        ----------
+        pool_size : int
+            The number of connections kept open to the server.
+        timeout : float
+            Seconds to wait for the server before giving up on a request.
+        max_retries : int
+            How many times a failed request is retried.
+        backoff : float
+            The base of the exponential backoff between retries, in seconds.
+        max_backoff : float
+            The longest wait between retries, in seconds.
+        throttle : AdaptiveThrottle
+            Spaces out requests according to how the server is doing.
+        breaker : CircuitBreaker
+            Stops requests entirely when failures persist.
+        cache : ResponseCache
+            Responses are served from and saved to this cache.  With
+            cache.offline set, nothing is ever fetched.
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.throttle = AdaptiveThrottle() if throttle is None else throttle
+        self.breaker = CircuitBreaker() if breaker is None else breaker
+        self.cache = cache
+        self._local = threading.local()  # see last_cached
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _backoff(self, attempt: int) -> float:
+        """ full-jitter exponential backoff """
+        return random() * min(self.max_backoff, self.backoff * 2 ** attempt)
+
+    @property
+    def last_cached(self) -> bool:
+        """ True if this thread's last get_json was answered by the cache """
+        return getattr(self._local, 'cached', False)
+
+    def get_json(self, url: str) -> dict:
+        """
+        The decoded json of url, from the cache if it's there and otherwise
+        fetched with fetch_json.
+
+        Parameters
+        ----------
+        url : str
+            The url to fetch.
+
+        Returns
+        -------
+        dict of json information
+        """
+        data = self.cached_json(url)
+        self._local.cached = data is not None
+        if data is None:
+            data = self.fetch_json(url)
+        return data
+
+    def cached_json(self, url: str) -> Union[dict, None]:
+        """
+        The cached response for url, or None if it has to be fetched.
+        Raises AssessorError if it isn't cached and the cache is offline.
+        """
+        if self.cache is None:
+            return None
+        data = self.cache.get(url)
+        if data is None and self.cache.offline:
+            raise AssessorError('Offline and not cached: ' + url)
+        return data
+
+    def fetch_json(self, url: str) -> dict:
+        """
+        Fetches url and decodes the json it returns, retrying on throttling,
+        server errors, network errors and non-json (e.g. HTML error) pages.
+        The response is saved to the cache.
+
+        Parameters
+        ----------
+        url : str
+            The url to fetch.
+
+        Returns
+        -------
+        dict of json information
+        """
+        error: Union[str, None] = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError('Circuit open, not requesting ' + url)
+            self.throttle.wait()
+            wait = None
+            t0 = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.throttle.record(None, ok=False)
+                self.breaker.record(ok=False)
+                error = repr(e)
+            else:
+                latency = time.monotonic() - t0
+                if response.status_code in RETRY_STATUSES:
+                    error = 'HTTP {:d}'.format(response.status_code)
+                    wait = retry_after_seconds(
+                        response.headers.get('Retry-After'))
+                elif response.status_code >= 400:
+                    self.throttle.record(latency, ok=True)
+                    self.breaker.record(ok=True)
+                    raise AssessorError('HTTP {:d} for {:s}'.format(
+                        response.status_code, url))
+                else:
+                    try:
+                        data = loads(response.content)
+                    except ValueError:  # an HTML error page, probably
+                        error = 'Non-json response'
+                    else:
+                        self.throttle.record(latency, ok=True)
+                        self.breaker.record(ok=True)
+                        if self.cache is not None:
+                            self.cache.put(url, data)
+                        return data
+                self.throttle.record(latency, ok=False)
+                self.breaker.record(ok=False)
+            if attempt < self.max_retries:
+                if wait is None:
+                    wait = self._backoff(attempt)
+                print('{:s} for {:s}, retrying in {:3.1f} s'.format(
+                    error, url, wait))
+                time.sleep(wait)
+        raise AssessorError('{:s} for {:s} after {:d} attempts'.format(
+            error, url, self.max_retries + 1))
+
+
+_DEFAULT_CLIENT: Union[AssessorClient, None] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_client() -> AssessorClient:
+    """ returns the client shared by the scraping functions """
+    global _DEFAULT_CLIENT
+    with _DEFAULT_LOCK:
+        if _DEFAULT_CLIENT is None:
+            _DEFAULT_CLIENT = AssessorClient(
+                cache=ResponseCache(offline=CACHE_OFFLINE))
+        return _DEFAULT_CLIENT
+
+
+def set_client(client: AssessorClient) -> None:
+    """ replaces the client shared by the scraping functions """
+    global _DEFAULT_CLIENT
+    with _DEFAULT_LOCK:
+        _DEFAULT_CLIENT = client
+
+
+def set_cache(offline: bool = False,
+              max_age: Union[float, None] = None,
+              enabled: bool = True) -> AssessorClient:
+    """
+    Changes how the shared client uses its response cache.
+
+    Parameters
+    ----------
+    offline : bool
+        Answer only from the cache, however old the entries, and fail
+        requests that aren't cached.
+    max_age : float
+        Seconds a cached response stays fresh for every endpoint, instead
+        of CACHE_TTLS.  None keeps the cache's time-to-lives.
+    enabled : bool
+        False sends every request to the server and caches nothing.
+
+    Returns
+    -------
+    the shared client
+    """
+    client = get_client()
+    if not enabled:
+        client.cache = None
+        return client
+    if client.cache is None:
+        client.cache = ResponseCache()
+    client.cache.offline = offline
+    if max_age is not None:
+        client.cache.ttls = {'default': max_age}
+    return client
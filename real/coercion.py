@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from ..resources.defaults import (TYPE_COERCION, SALE_COERCION,
+                                  coerce_date, yn_to_bool, zipcode_to_int)
+
+# detail fields that assessed_values_from_dict throws away
+DROPPED_DETAILS = ['SubPartNumber', 'SubParts', 'LandAcres']
+# Y/N detail fields, where a null is False (see yn_to_bool) rather than
+# missing
+YN_DETAILS = [key for key, func in TYPE_COERCION.items()
+              if func is yn_to_bool]
+
+
+def _scalar(func: Callable) -> Callable:
+    """
+    The scalar coercion of one value, with the sentinels coerce_details
+    uses when func raises a ValueError.  Used for the values the vectorized
+    parsers can't handle, so the two paths always agree.
+    """
+    if func is int:
+        failed = -1
+    elif func is float:
+        failed = -1.0
+    elif func is yn_to_bool:
+        failed = None
+    else:
+        return func  # coerce_date and zipcode_to_int never raise
+
+    def coerce(x):
+        try:
+            return func(x)
+        except ValueError:
+            return failed
+    return coerce
+
+
+def _finish(values: pd.Series, present: np.ndarray, parsed: pd.Series,
+            fast: pd.Series, func: Callable,
+            typed: Callable[[object], bool]) -> pd.Series:
+    """
+    Fills in the values fast parsing missed with the scalar coercion.  When
+    every filled-in value is of the parsed type (typed(value) is True) the
+    result keeps the parsed dtype, otherwise pandas picks the column type,
+    as it would for a column of scalars.  Ints parsed as floats go back to
+    ints (typed is _exact_int) among the scalars.
+    """
+    fast = fast.to_numpy() & present
+    slow = present & ~fast
+    fill = [_scalar(func)(x) for x in values.to_numpy()[slow]]
+    if all(typed(x) for x in fill):
+        out = parsed.where(fast)
+        if any(x == x for x in fill):  # not all nan, already there
+            out[slow] = fill
+        return out
+    out = np.full(values.shape[0], np.nan, dtype=object)
+    if typed is _exact_int:
+        out[fast] = parsed.to_numpy()[fast].astype(np.int64).astype(object)
+    else:
+        out[fast] = parsed.to_numpy(dtype=object)[fast]
+    out[slow] = fill
+    return pd.Series(out, index=values.index).infer_objects()
+
+
+def _exact_int(x) -> bool:
+    return type(x) is int and abs(x) < 2 ** 53
+
+
+def _is_float(x) -> bool:
+    return type(x) is float
+
+
+def _is_nan(x) -> bool:
+    return x != x
+
+
+def _parse_ints(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Parses the strings of only decimal digits, the bulk of the ints, that
+    are small enough to be exact as floats.
+
+    Returns
+    -------
+    (parsed floats, True where parsed)
+    """
+    digits = values.str.isdecimal().fillna(False).astype(bool).to_numpy()
+    parsed = np.full(values.shape[0], np.nan)
+    try:
+        parsed[digits] = values.to_numpy()[digits].astype(np.int64)
+    except OverflowError:
+        parsed[digits] = values.to_numpy()[digits].astype(float)
+    parsed = pd.Series(parsed, index=values.index)
+    return parsed, digits & (parsed.abs() < 2 ** 53)
+
+
+def _empty(values: pd.Series) -> pd.Series:
+    return (values == '').fillna(False).astype(bool)
+
+
+def _int_dtype(out: pd.Series, present: np.ndarray) -> pd.Series:
+    """
+    ints parsed as floats go back to ints unless a record was missing the
+    field.  Columns that aren't all numbers (zip codes that aren't ZIP+4,
+    say) are left as they are.
+    """
+    if present.all() and out.dtype.kind == 'f':
+        return out.astype('int64')
+    return out
+
+
+def coerce_int_column(values: pd.Series) -> pd.Series:
+    present = values.notna().to_numpy()
+    parsed, fast = _parse_ints(values)
+    empty = _empty(values)  # int('') fails
+    parsed[empty] = -1
+    out = _finish(values, present, parsed, fast | empty, int, _exact_int)
+    return _int_dtype(out, present)
+
+
+def coerce_float_column(values: pd.Series) -> pd.Series:
+    present = values.notna().to_numpy()
+    parsed = pd.to_numeric(values, errors='coerce')
+    empty = _empty(values)  # float('') fails
+    parsed[empty] = -1.0
+    return _finish(values, present, parsed, parsed.notna() | empty, float,
+                   _is_float)
+
+
+def coerce_date_column(values: pd.Series) -> pd.Series:
+    present = values.notna().to_numpy()
+    parsed = pd.to_datetime(values, format='%m/%d/%Y', errors='coerce')
+    # '' and other failures are NaN, just as NaT
+    out = _finish(values, present, parsed, parsed.notna() | _empty(values),
+                  coerce_date, _is_nan)
+    if out.dtype != object and out.isna().all():
+        return pd.Series(np.nan, index=values.index)  # a column of nan
+    return out
+
+
+def coerce_yn_column(values: pd.Series) -> pd.Series:
+    out = np.where(values == 'Y', True,
+                   np.where(values == 'None', None, False)).astype(object)
+    out[values.isna().to_numpy()] = np.nan
+    return pd.Series(out, index=values.index).infer_objects()
+
+
+def coerce_zipcode_column(values: pd.Series) -> pd.Series:
+    present = values.notna().to_numpy()
+    parsed, fast = _parse_ints(values.str[:-5])
+    out = _finish(values, present, parsed, fast, zipcode_to_int, _exact_int)
+    return _int_dtype(out, present)
+
+
+# the columnar equivalent of each scalar coercion function
+COLUMN_COERCION: Dict[Callable, Callable] = {
+    int: coerce_int_column,
+    float: coerce_float_column,
+    coerce_date: coerce_date_column,
+    yn_to_bool: coerce_yn_column,
+    zipcode_to_int: coerce_zipcode_column}
+
+
+def coerce_frame(df: pd.DataFrame, table: Dict[str, Callable]) -> pd.DataFrame:
+    """
+    Coerces every column of df named in table, a TYPE_COERCION style table
+    of scalar functions, with the matching columnar function.  Missing
+    values (fields a record didn't have) stay missing.
+    """
+    for key, func in table.items():
+        if key in df.columns:
+            # as objects, since pandas' string columns are slow to check
+            # for nan
+            df[key] = COLUMN_COERCION[func](df[key].astype(object))
+    return df
+
+
+def split_records(records: Iterable[dict],
+                  keys: Union[List[str], None] = None
+                  ) -> Tuple[pd.DataFrame, pd.DataFrame, List[int]]:
+    """
+    Pulls the uncoerced parcel details and sales out of decoded records,
+    skipping the records assessed_values_from_dict would and those without
+    sales, whose details would be dropped anyway but could change the
+    column types.  If the records' keys are given they go in a RecordKey
+    column of the details.
+
+    Returns
+    -------
+    (details dataframe with one row per record with sales,
+     sales dataframe with one row per sale,
+     the details row of each sale)
+    """
+    details: list = []
+    sales: list = []
+    owners: list = []
+    for i, dd in enumerate(records):
+        try:
+            history = dd["ownership"]["Parcel_OwnershipHistory"]
+            parcel = dict(dd["details"]["Parcel"])
+            if 'ZipCode' not in parcel:
+                parcel['ZipCode'] = parcel['SitusZipCode']
+            for key in DROPPED_DETAILS:
+                parcel.pop(key, None)
+            for key in YN_DETAILS:
+                # a null would be nan in the dataframe, like a missing field
+                if key in parcel and parcel[key] is None:
+                    parcel[key] = False
+        except KeyError:
+            continue
+        if not history:
+            continue
+        if keys is not None:
+            parcel['RecordKey'] = keys[i]
+        owners.extend([len(details)] * len(history))
+        sales.extend(history)
+        details.append(parcel)
+    return pd.DataFrame(details), pd.DataFrame(sales), owners
+
+
+def records_to_sales(records: Iterable[dict],
+                     keys: Union[List[str], None] = None) -> pd.DataFrame:
+    """
+    The columnar version of assessed_values_from_dict over many records:
+    one row per sale, holding the coerced parcel details and sale fields.
+    """
+    details, sales, owners = split_records(records, keys)
+    details = coerce_frame(details, TYPE_COERCION)
+    sales = coerce_frame(sales, SALE_COERCION)
+    df = details.iloc[owners].reset_index(drop=True)
+    for col in sales.columns:  # sale fields win, as in dict.update
+        df[col] = sales[col].to_numpy()
+    return df
+
+
+def check_coercion(records: List[dict]) -> bool:
+    """
+    Compares records_to_sales with the scalar coerce_details / coerce_sale
+    path on the same records, printing any difference.  Run it over a
+    sample of scraped records after changing either path, e.g.
+    check_coercion(list(itertools.islice(iter_json_records(loc), 5000)))
+
+    Returns
+    -------
+    True if the two agree
+    """
+    from copy import deepcopy
+    from .json_reader import assessed_values_from_dict
+    avs: list = []
+    for dd in deepcopy(records):
+        avs.extend(assessed_values_from_dict(dd))
+    expected = pd.DataFrame(avs)
+    actual = records_to_sales(records)
+    try:
+        pd.testing.assert_frame_equal(actual, expected, check_like=True)
+    except AssertionError as e:
+        print(e)
+        return False
+    print('Columnar coercion matches on {:d} sales from {:d} records'.format(
+        expected.shape[0], len(records)))
+    return True
@@ -0,0 +1,126 @@
+import re
+
+import pandas as pd
+
+from typing import Union
+
+from ..resources.defaults import ROW_ELEMENTS
+
+# unit designators at the end of a situs street, e.g. '123 MAIN ST UNIT 4'
+UNIT_PATTERN = re.compile(r'\s+(UNIT|APT|STE|SPC|#)\s*\S*$')
+SPACES = re.compile(r'\s+')
+
+
+def normalize_street(street: str) -> str:
+    """
+    Normalizes a street address for comparison: upper case, no
+    punctuation, single spaces and no unit designator.
+    """
+    street = SPACES.sub(' ', str(street).upper().replace('.', ' ')
+                        .replace(',', ' ')).strip()
+    return UNIT_PATTERN.sub('', street)
+
+
+def situs_key(street: str, zipcode: str) -> str:
+    """ the coverage key of a parcel's SitusStreet and SitusZipCode """
+    return normalize_street(street) + ' ' + str(zipcode)[:5]
+
+
+def normalize_streets(streets: pd.Series) -> pd.Series:
+    """ normalize_street for a whole column of street addresses at once """
+    streets = streets.astype(object).map(str).str.upper()\
+        .str.replace('.', ' ', regex=False)\
+        .str.replace(',', ' ', regex=False)\
+        .str.replace(SPACES, ' ', regex=True).str.strip()
+    return streets.str.replace(UNIT_PATTERN, '', regex=True)
+
+
+def situs_keys(streets: pd.Series, zipcodes: pd.Series) -> pd.Series:
+    """ situs_key for whole columns of streets and zip codes at once """
+    zipcodes = zipcodes.astype(object).map(str).str[:5].to_numpy()
+    return normalize_streets(streets) + ' ' + zipcodes
+
+
+def address_key(addr: dict) -> str:
+    """ the coverage key of an address from .addresses.make_address_dict """
+    street = ' '.join(addr[elem] for elem in ROW_ELEMENTS
+                      if elem != 'ZIP_CD')
+    return situs_key(street, addr['ZIP_CD'])
+
+
+class CoverageIndex:
+    """
+    Remembers every search query issued and every parcel address returned,
+    so that addresses already answered by an earlier search (because a search
+    also returns neighboring parcels and units, or because several address
+    book rows collapse to the same query) are not searched again.
+    """
+    def __init__(self,
+                 results_df: Union[pd.DataFrame, None] = None):
+        """
+
+        Parameters
+        ----------
+        results_df : pd.DataFrame
+            An AIN dataframe whose parcel addresses are already known.
+        """
+        self.queries: set = set()
+        self.situs: set = set()
+        self.saved = 0  # searches skipped thanks to the index
+        if results_df is not None:
+            self.add_results_df(results_df)
+
+    def is_covered(self, query: str, addr: dict) -> bool:
+        """
+        True if query has been issued before or the parcels at addr have
+        already been returned by some search.
+
+        Parameters
+        ----------
+        query : str
+            The search string from scraper.make_address_search_string.
+        addr : dict
+            The address from .addresses.make_address_dict.
+        """
+        return self.covers(query, address_key(addr))
+
+    def covers(self, query: str, key: str) -> bool:
+        """
+        is_covered for an address whose key is already known, e.g. from the
+        AddressKey column added by .addresses.canonicalize_addresses.
+        """
+        return query in self.queries or key in self.situs
+
+    def add_query(self, query: str) -> None:
+        self.queries.add(query)
+
+    def add_result(self, result: dict) -> None:
+        """ records the parcel addresses in a decoded search result """
+        for parcel in result.get('Parcels') or []:
+            try:
+                self.situs.add(situs_key(parcel['SitusStreet'],
+                                         parcel['SitusZipCode']))
+            except KeyError:
+                pass
+
+    def add_results_df(self, results_df: pd.DataFrame) -> None:
+        """
+        records the parcel addresses already in an AIN dataframe, using its
+        AddressKey column (see .addresses.canonicalize_results) where set
+        """
+        if 'AddressKey' in results_df.columns:
+            keys = results_df['AddressKey']
+            self.situs.update(keys[keys.notna()])
+            results_df = results_df[keys.isna()]
+        streets = results_df['SitusStreet']
+        known = streets.map(lambda street: isinstance(street, str))\
+            .astype(bool)
+        self.situs.update(situs_keys(streets[known],
+                                     results_df['SitusZipCode'][known]))
+
+    def report(self) -> str:
+        return 'Coverage index saved {:d} searches ({:d} queries, ' \
+               '{:d} parcel addresses known)'.format(self.saved,
+                                                     len(self.queries),
+                                                     len(self.situs))
+
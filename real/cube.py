@@ -0,0 +1,197 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from typing import List, Tuple, Union
+
+from ..resources.defaults import (CUBE_FILE, CUBE_COLUMNS, CUBE_QUANTILES,
+                                  CUBE_PRICE_RANGE, INFLATION_BASE)
+from .inflation import get_inflation
+
+NOMINAL = 'Nominal'  # the 'index' of undeflated prices
+PERIODS = {'Y': 'year', 'M': 'month'}
+KEYS = ['ZipCode', 'NumOfBeds']
+
+
+def quantile_name(q: float) -> str:
+    """ the cube column of a quantile, e.g. 0.25 -> 'q25' """
+    return 'q{:g}'.format(100 * q)
+
+
+class AggregateCube:
+    """
+    Sale counts, medians and quantiles of each price column by zip code,
+    number of bedrooms and month or year, in nominal dollars and deflated
+    by each inflation series, made in one grouped pass over the housing
+    data.  Deflated prices are held in base month dollars and rescaled when
+    another base is asked for, which leaves medians and quantiles exact
+    since it multiplies every price by the same number.
+    """
+    def __init__(self, data: pd.DataFrame, base: str = INFLATION_BASE):
+        """
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            Indexed by Column, Index, Period, ZipCode, NumOfBeds and Date
+            (the first day of the month or year), with count, median and
+            quantile columns.  Made by AggregateCube.build.
+        base : str
+            The month whose dollars data is in.
+        """
+        self.data = data
+        self.base = base
+
+    @classmethod
+    def build(cls, df: pd.DataFrame,
+              columns: List[str] = CUBE_COLUMNS,
+              quantiles: List[float] = CUBE_QUANTILES,
+              price_range: Tuple[float, float] = CUBE_PRICE_RANGE,
+              base: str = INFLATION_BASE) -> 'AggregateCube':
+        """
+        Aggregates the housing dataframe.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Dataframe of housing information produced by json_reader, or
+            the ZipCode, NumOfBeds, RecordingDate and columns of it.
+        columns : List[str]
+            The price columns to aggregate.
+        quantiles : List[float]
+            Quantiles to keep besides the median.
+        price_range : (float, float)
+            Nominal prices at or outside these bounds are left out.
+        base : str
+            The month whose dollars deflated prices are in.
+
+        Returns
+        -------
+        AggregateCube
+        """
+        inflation = get_inflation()
+        dates = pd.to_datetime(df['RecordingDate'])
+        low, high = price_range
+        values = {}
+        for col in columns:
+            price = pd.to_numeric(df[col], errors='coerce')\
+                .to_numpy(dtype='float64', na_value=np.nan, copy=True)
+            price[~((price > low) & (price < high))] = np.nan
+            values[(col, NOMINAL)] = price
+            for series in inflation.series:
+                values[(col, series)] = \
+                    price * 100 / inflation.index(series, dates, base)
+        wide = pd.DataFrame(values, index=df.index)
+        wide.columns.names = ['Column', 'Index']
+        qs = [0.5] + list(quantiles)
+        names = ['median'] + [quantile_name(q) for q in quantiles]
+
+        parts = []
+        for period, freq in PERIODS.items():
+            when = dates.dt.to_period(period).dt.start_time.rename('Date')
+            groups = wide.groupby([df[k] for k in KEYS] + [when],
+                                  observed=True)
+            stats = {'count': groups.count()}
+            quants = groups.quantile(qs)  # the quantile is the last level
+            for q, name in zip(qs, names):
+                stats[name] = quants.xs(q, level=-1)
+            part = pd.concat({name: stat.stack(['Column', 'Index'],
+                                               future_stack=True)
+                              for name, stat in stats.items()}, axis=1)
+            part = part[part['count'] > 0]
+            parts.append(pd.concat({period: part}, names=['Period']))
+        data = pd.concat(parts)\
+            .reorder_levels(['Column', 'Index', 'Period'] + KEYS + ['Date'])\
+            .sort_index()
+        data['count'] = data['count'].astype('int64')
+        return cls(data, base)
+
+    def save(self, filename: str = CUBE_FILE) -> None:
+        tmp = filename + '.tmp'
+        pd.to_pickle({'data': self.data, 'base': self.base}, tmp)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename: str = CUBE_FILE) -> 'AggregateCube':
+        saved = pd.read_pickle(filename)
+        return cls(saved['data'], saved['base'])
+
+    def select(self, column: str,
+               index: Union[str, None] = None,
+               period: str = 'Y',
+               zipcode: Union[int, None] = None,
+               beds: Union[int, None] = None,
+               base: Union[str, None] = None) -> pd.DataFrame:
+        """
+        One slice of the cube.
+
+        Parameters
+        ----------
+        column : str
+            The price column, e.g. 'DTTSalePrice'.
+        index : str
+            The inflation series, e.g. 'CPI-W' (or 'CPI-WIndex', the column
+            name in the housing dataframe).  None for nominal prices.
+        period : str
+            'Y' for years or 'M' for months.
+        zipcode : int
+            Just this zip code, else the Date index keeps a ZipCode level.
+        beds : int
+            Just this number of bedrooms, else the Date index keeps a
+            NumOfBeds level.
+        base : str
+            The month whose dollars to use, e.g. '2019-06'.  The cube's base
+            if None.
+
+        Returns
+        -------
+        pandas dataframe of count, median and quantiles indexed by Date (and
+        ZipCode and NumOfBeds if they aren't given), empty if there were no
+        sales
+        """
+        if index is None:
+            index = NOMINAL
+        elif index.endswith('Index'):
+            index = index[:-len('Index')]
+        levels = ['Column', 'Index', 'Period']
+        key = [column, index, period]
+        if zipcode is not None:
+            levels.append('ZipCode')
+            key.append(zipcode)
+        if beds is not None:
+            levels.append('NumOfBeds')
+            key.append(beds)
+        try:
+            out = self.data.xs(tuple(key), level=levels)
+        except KeyError:
+            out = self.data.iloc[:0].droplevel(levels)
+        if index != NOMINAL and base is not None and base != self.base:
+            inflation = get_inflation()
+            scale = inflation.level(index, base) / \
+                inflation.level(index, self.base)
+            out = out.copy()
+            stats = [c for c in out.columns if c != 'count']
+            out[stats] = out[stats] * scale
+        return out
+
+
+_cube: Union[AggregateCube, None] = None
+
+
+def get_cube(filename: str = CUBE_FILE) -> AggregateCube:
+    """
+    The aggregate cube saved by build-dataset, loaded the first time it's
+    asked for.  If it hasn't been saved it's built from the partitioned
+    dataset (see dataset.load) and saved.
+    """
+    global _cube
+    if _cube is None:
+        if os.path.isfile(filename):
+            _cube = AggregateCube.load(filename)
+        else:
+            from .dataset import load
+            _cube = AggregateCube.build(
+                load(columns=KEYS + ['RecordingDate'] + CUBE_COLUMNS))
+            _cube.save(filename)
+    return _cube
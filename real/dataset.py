@@ -0,0 +1,144 @@
+import os
+import shutil
+
+import pandas as pd
+
+from typing import List, Union
+
+from ..resources.defaults import DATASET_LOC, DATASET_FORMAT
+
+# optional, needed to write and load the partitioned dataset
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:
+    pa = None
+
+PARTITIONS = ['ZipCode', 'RecordingYear']
+EXTENSIONS = {'parquet': 'parquet', 'feather': 'feather'}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError('The partitioned dataset needs pyarrow, '
+                          'pip install pyarrow')
+
+
+def _file_format(file_format: str):
+    if file_format == 'parquet':
+        return ds.ParquetFileFormat()
+    elif file_format == 'feather':
+        return ds.IpcFileFormat()
+    raise ValueError('Unknown dataset format ' + file_format)
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([('ZipCode', pa.int64()),
+                                      ('RecordingYear', pa.int64())]),
+                           flavor='hive')
+
+
+def write_dataset(df: pd.DataFrame,
+                  location: str = DATASET_LOC,
+                  file_format: str = DATASET_FORMAT) -> None:
+    """
+    Writes the housing dataframe as a columnar dataset partitioned by zip
+    code and recording year, i.e. location/ZipCode=90025/RecordingYear=2006/.
+    The old dataset at location is replaced once the new one is written.
+    ZipCodes that aren't numbers are written as -1.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe of housing information produced by json_reader.
+    location : str
+        The dataset directory.
+    file_format : str
+        'parquet' (compressed) or 'feather' (uncompressed Arrow IPC, fastest
+        to memory map).
+    """
+    _require_pyarrow()
+    df = df.copy(deep=False)
+    df['ZipCode'] = pd.to_numeric(df['ZipCode'], errors='coerce')\
+        .fillna(-1).astype('int64')
+    df['RecordingYear'] = pd.to_datetime(df['RecordingDate']).dt.year\
+        .fillna(-1).astype('int64')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = location + '.tmp'
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    options = None
+    if file_format == 'feather':
+        options = ds.IpcFileFormat().make_write_options(compression=None)
+    ds.write_dataset(table, tmp, format=_file_format(file_format),
+                     file_options=options,
+                     partitioning=_partitioning(),
+                     basename_template='part-{i}.' + EXTENSIONS[file_format])
+    if os.path.isdir(location):
+        old = location + '.old'
+        os.replace(location, old)
+        os.replace(tmp, location)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, location)
+    print('Wrote {:d} sales to {:s}'.format(df.shape[0], location))
+
+
+def load(zips: Union[List[int], None] = None,
+         since: Union[int, str, pd.Timestamp, None] = None,
+         until: Union[int, str, pd.Timestamp, None] = None,
+         columns: Union[List[str], None] = None,
+         location: str = DATASET_LOC,
+         file_format: str = DATASET_FORMAT) -> pd.DataFrame:
+    """
+    Loads part of the housing dataset written by write_dataset.  Only the
+    partitions for the requested zip codes and years are opened, only the
+    requested columns are read, and the files are memory mapped.
+
+    Parameters
+    ----------
+    zips : List[int]
+        Zip codes to load.  All if None.
+    since : int, str or timestamp
+        A year, e.g. 2006, or a date to load sales from, inclusive.
+    until : int, str or timestamp
+        A year or a date to load sales until, inclusive.
+    columns : List[str]
+        Columns to load.  All if None.
+    location : str
+        The dataset directory.
+    file_format : str
+        'parquet' or 'feather', as written.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(location, format=_file_format(file_format),
+                         partitioning=_partitioning(),
+                         filesystem=pafs.LocalFileSystem(use_mmap=True))
+    year = ds.field('RecordingYear')
+    conditions = []
+    if zips is not None:
+        conditions.append(ds.field('ZipCode').isin([int(z) for z in zips]))
+    if since is not None:
+        if isinstance(since, int):
+            conditions.append(year >= since)
+        else:
+            since = pd.Timestamp(since)
+            conditions.append(year >= since.year)
+            conditions.append(ds.field('RecordingDate') >= since)
+    if until is not None:
+        if isinstance(until, int):
+            conditions.append(year <= until)
+        else:
+            until = pd.Timestamp(until)
+            conditions.append(year <= until.year)
+            conditions.append(ds.field('RecordingDate') <= until)
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+    table = dataset.to_table(columns=columns, filter=condition)
+    return table.to_pandas()
@@ -0,0 +1,181 @@
+import gzip
+import json
+import time
+
+from typing import Any, Callable, Dict, List, Optional, TypedDict, Union
+
+from ..resources.defaults import (DECODER_BACKEND, COLUMNS, TYPE_COERCION,
+                                  SALE_COERCION)
+
+# optional, faster json libraries.  msgspec can also skip unused fields
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the fields of details.Parcel and ownership.Parcel_OwnershipHistory the
+# reader uses, everything else in a record is never materialized
+PARCEL_FIELDS = [key for key in TYPE_COERCION
+                 if key not in ('ZipCode', 'LandAcres')] + \
+                [key for key in COLUMNS + ['UseType']
+                 if key not in TYPE_COERCION]
+SALE_FIELDS = list(SALE_COERCION)
+
+Parcel = TypedDict('Parcel', {key: Optional[str] for key in PARCEL_FIELDS},
+                   total=False)
+Sale = TypedDict('Sale', {key: Optional[str] for key in SALE_FIELDS},
+                 total=False)
+Details = TypedDict('Details', {'Parcel': Parcel}, total=False)
+Ownership = TypedDict('Ownership', {'Parcel_OwnershipHistory': List[Sale]},
+                      total=False)
+Record = TypedDict('Record', {'details': Details, 'ownership': Ownership},
+                   total=False)
+
+
+def _gunzip(raw: bytes) -> bytes:
+    if raw[:2] == b'\x1f\x8b':  # a RecordStore member
+        return gzip.decompress(raw)
+    return raw
+
+
+def project_record(dd: dict) -> Record:
+    """
+    Cuts a fully decoded record down to the fields in the Record schema,
+    the same shape the typed decoder produces.
+    """
+    record: dict = {}
+    try:
+        parcel = dd['details']['Parcel']
+    except (KeyError, TypeError):
+        pass
+    else:
+        record['details'] = {'Parcel': {k: parcel[k] for k in PARCEL_FIELDS
+                                        if k in parcel}}
+    try:
+        sales = dd['ownership']['Parcel_OwnershipHistory']
+    except (KeyError, TypeError):
+        pass
+    else:
+        record['ownership'] = {'Parcel_OwnershipHistory': [
+            {k: sale[k] for k in SALE_FIELDS if k in sale}
+            for sale in sales]}
+    return record
+
+
+class Decoder:
+    """
+    Decodes json with one of the available backends: 'msgspec', 'orjson' or
+    the standard library's 'json'.  decode_record returns only the fields
+    in the Record schema; with msgspec the rest are skipped while parsing,
+    the others decode everything and then cut it down.
+    """
+    def __init__(self, backend: Union[str, None] = DECODER_BACKEND):
+        """
+
+        Parameters
+        ----------
+        backend : str
+            'msgspec', 'orjson' or 'json'.  The fastest one installed if
+            None.
+        """
+        if backend is None:
+            backend = available_backends()[0]
+        if backend not in available_backends():
+            raise ValueError('JSON backend {:s} is not available'.format(
+                str(backend)))
+        self.backend = backend
+        self._typed: Union[Callable, None] = None
+        if backend == 'msgspec':
+            self._loads = msgspec.json.Decoder().decode
+            self._typed = msgspec.json.Decoder(Record).decode
+        elif backend == 'orjson':
+            self._loads = orjson.loads
+        else:
+            self._loads = json.loads
+
+    def loads(self, raw: Union[bytes, str]) -> Any:
+        """ decodes any json, raising ValueError if it isn't json """
+        try:
+            return self._loads(raw)
+        except ValueError:
+            raise
+        except Exception as e:  # msgspec.DecodeError
+            raise ValueError(str(e))
+
+    def decode_record(self, raw: bytes) -> Record:
+        """
+        Decodes a scraped record, a json file or a RecordStore member,
+        into the Record schema.
+        """
+        raw = _gunzip(raw)
+        if self._typed is not None:
+            try:
+                return self._typed(raw)
+            except msgspec.ValidationError:
+                pass  # a field isn't a string, fall back to projecting
+        return project_record(self.loads(raw))
+
+
+def available_backends() -> List[str]:
+    """ the installed backends, fastest first """
+    backends = ['json']
+    if orjson is not None:
+        backends.insert(0, 'orjson')
+    if msgspec is not None:
+        backends.insert(0, 'msgspec')
+    return backends
+
+
+_decoders: Dict[Union[str, None], Decoder] = {}
+
+
+def get_decoder(backend: Union[str, None] = DECODER_BACKEND) -> Decoder:
+    """ a shared decoder for backend, made the first time it's asked for """
+    if backend not in _decoders:
+        _decoders[backend] = Decoder(backend)
+    return _decoders[backend]
+
+
+def loads(raw: Union[bytes, str]) -> Any:
+    """ decodes any json with the default backend """
+    return get_decoder().loads(raw)
+
+
+def benchmark_decoders(raws: List[bytes],
+                       repeat: int = 3) -> Dict[str, float]:
+    """
+    Times decode_record on each available backend, plus a full stdlib
+    decode for reference, and prints records per second.  For example
+    benchmark_decoders(list(islice(json_reader.iter_raw_records(loc), 2000)))
+
+    Parameters
+    ----------
+    raws : list of bytes
+        Undecoded records, from json_reader.iter_raw_records.
+    repeat : int
+        Runs per backend, the fastest is kept.
+
+    Returns
+    -------
+    dict of backend name to seconds for all of raws
+    """
+    raws = [_gunzip(raw) for raw in raws]  # time decoding, not gzip
+    runs = {'json (full)': json.loads}
+    for backend in available_backends():
+        runs[backend] = Decoder(backend).decode_record
+    results = {}
+    for name, decode in runs.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for raw in raws:
+                decode(raw)
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+        print('{:12s} {:8.3f} s {:10.0f} records/s'.format(
+            name, best, len(raws) / best if best else float('inf')))
+    return results
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+from datetime import datetime
+from typing import Dict, Union
+
+from ..resources.defaults import INFLATION_FILE, INFLATION_BASE
+
+# data from: https://data.bls.gov/pdq/SurveyOutputServlet
+# CWUR0000SAH1 = CPI for Urban Wage Earners and Clerical Workers (CPI-W)
+# CWSR0000SAH1 = Shelter in U.S. city average, urban wage earners and clerical
+# workers, seasonally adjusted
+# CWURS49ASA0 = All items in Los Angeles-Long Beach-Anaheim, CA,
+# urban wage earners and clerical workers, not seasonally adjusted
+SERIES = {'CWUR0000SAH1': 'CPI-W',
+          'CWSR0000SAH1': 'UrbanShelter',
+          'CWURS49ASA0': 'LAGoods'}
+
+
+def month_offsets(dates) -> np.ndarray:
+    """
+    Months since January 1970 of an array of dates, or of a single date or
+    'YYYY-MM' string.  Missing dates come back as the smallest int64.
+    """
+    return np.asarray(pd.to_datetime(dates), dtype='datetime64[M]')\
+        .astype(np.int64)
+
+
+class InflationIndex:
+    """
+    The BLS price series in inflation.txt, each held as a dense array of
+    levels indexed by month, so looking up the index of a date is an
+    offset into an array.  Months the file leaves blank (e.g. one not yet
+    published) carry the previous month forward.
+    """
+    def __init__(self, filename: str = INFLATION_FILE):
+        """
+
+        Parameters
+        ----------
+        filename : str
+            A BLS csv download with one row per series and one column per
+            month (Annual and HALF columns are ignored).
+        """
+        self.filename = filename
+        with open(filename) as f:
+            header = f.readline().strip().split(',')
+            rows = [line.strip().split(',') for line in f if line.strip()]
+        months = {}  # column -> months since January 1970
+        for i, label in enumerate(header[1:], 1):
+            try:
+                dt = datetime.strptime(label.strip(), '%b %Y')
+            except ValueError:
+                continue  # Annual or HALF
+            months[i] = (dt.year - 1970) * 12 + dt.month - 1
+        self.start = min(months.values())
+        size = max(months.values()) - self.start + 1
+        self.levels: Dict[str, np.ndarray] = {}
+        for row in rows:
+            name = SERIES.get(row[0], row[0])
+            levels = np.full(size, np.nan)
+            for i, month in months.items():
+                try:
+                    levels[month - self.start] = float(row[i])
+                except (ValueError, IndexError):
+                    pass  # blank
+            self.levels[name] = pd.Series(levels).ffill().to_numpy()
+
+    @property
+    def series(self):
+        return list(self.levels)
+
+    def level(self, series: str, dates) -> np.ndarray:
+        """ the raw level of series at each date, NaN outside the data """
+        levels = self.levels[series]
+        offsets = month_offsets(dates) - self.start
+        valid = (offsets >= 0) & (offsets < levels.shape[0])
+        out = np.full(offsets.shape, np.nan)
+        out[valid] = levels[offsets[valid]]
+        return out
+
+    def index(self, series: str, dates,
+              base: str = INFLATION_BASE) -> np.ndarray:
+        """
+        The series at each date, rebased so the base month is 100.
+
+        Parameters
+        ----------
+        series : str
+            'CPI-W', 'UrbanShelter' or 'LAGoods'.
+        dates : array-like of dates
+            e.g. the RecordingDate column.
+        base : str
+            The month that is 100, e.g. '2000-01'.
+
+        Returns
+        -------
+        numpy array of floats
+        """
+        return 100 * self.level(series, dates) / self.level(series, base)
+
+    def deflate(self, prices, dates, series: str = 'CPI-W',
+                base: str = INFLATION_BASE) -> np.ndarray:
+        """ prices paid on dates, in base month dollars """
+        prices = pd.Series(prices).astype('float64').to_numpy()
+        return prices * 100 / self.index(series, dates, base)
+
+    def to_frame(self, base: str = INFLATION_BASE) -> pd.DataFrame:
+        """ every series rebased to base, indexed by month """
+        months = pd.period_range(
+            pd.Period(year=1970 + self.start // 12,
+                      month=self.start % 12 + 1, freq='M'),
+            periods=len(next(iter(self.levels.values()))), freq='M')
+        dates = months.to_timestamp()
+        return pd.DataFrame({name: self.index(name, dates, base)
+                             for name in self.levels}, index=months)
+
+
+_inflation: Union[InflationIndex, None] = None
+
+
+def get_inflation() -> InflationIndex:
+    """ the inflation index, loaded the first time it's asked for """
+    global _inflation
+    if _inflation is None:
+        _inflation = InflationIndex()
+    return _inflation
+
+
+def deflate(prices, dates, series: str = 'CPI-W',
+            base: str = INFLATION_BASE) -> np.ndarray:
+    """
+    Converts prices paid on dates to base month dollars.
+
+    Parameters
+    ----------
+    prices : array-like of numbers
+        e.g. the DTTSalePrice column.
+    dates : array-like of dates
+        e.g. the RecordingDate column.
+    series : str
+        'CPI-W', 'UrbanShelter' or 'LAGoods'.
+    base : str
+        The month whose dollars to use, e.g. '2000-01'.
+
+    Returns
+    -------
+    numpy array of floats, NaN where a date is outside the series
+    """
+    return get_inflation().deflate(prices, dates, series, base)
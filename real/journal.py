@@ -0,0 +1,101 @@
+import os
+import json
+
+import pandas as pd
+
+from typing import List, Union
+
+
+class ProgressJournal:
+    """
+    An append-only journal of scraping progress kept next to a pickled
+    dataframe.  Each chunk appends one json line holding the index labels
+    whose flag column (e.g. 'Searched' or 'Scraped') was set and any rows
+    that were added, so a checkpoint costs O(chunk) instead of rewriting the
+    whole pickle.  Replaying the journal over the pickle recovers the state
+    after the last complete line; a line torn by a crash is ignored.
+    """
+    def __init__(self, filename: str):
+        """
+
+        Parameters
+        ----------
+        filename : str
+            The journal file.  Usually the pickle file name + '.journal'.
+        """
+        self.filename = filename
+        self.entries = 0
+
+    def record(self,
+               flag: Union[str, None] = None,
+               index: Union[List, pd.Index, None] = None,
+               new_rows: Union[pd.DataFrame, None] = None) -> None:
+        """
+        Appends one chunk's worth of progress and syncs it to disk.
+
+        Parameters
+        ----------
+        flag : str
+            The boolean column that was set to True.
+        index : list
+            The index labels of the rows the flag was set on.
+        new_rows : pd.DataFrame
+            Rows appended to the dataframe during the chunk.
+        """
+        entry: dict = {}
+        if flag is not None and index is not None and len(index) > 0:
+            entry['flag'] = flag
+            entry['index'] = [int(i) for i in index]
+        if new_rows is not None and new_rows.shape[0] > 0:
+            entry['rows'] = new_rows.to_dict('list')
+        if not entry:
+            return
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries += 1
+
+    def replay(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Applies every complete journal entry to df, in order.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            The dataframe loaded from the base pickle file.
+
+        Returns
+        -------
+        pandas dataframe
+        """
+        self.entries = 0
+        if not os.path.isfile(self.filename):
+            return df
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # torn by a crash mid-write
+                    print('Ignoring incomplete journal entry in ' +
+                          self.filename)
+                    break
+                if 'rows' in entry:
+                    df = pd.concat([df, pd.DataFrame(entry['rows'])])\
+                        .drop_duplicates('AIN').reset_index(drop=True)
+                if 'flag' in entry:
+                    flag = entry['flag']
+                    if flag not in df.columns:
+                        df[flag] = False
+                    df.loc[entry['index'], flag] = True
+                self.entries += 1
+        if self.entries:
+            print('Replayed {:d} journal entries from {:s}'.format(
+                self.entries, self.filename))
+        return df
+
+    def clear(self) -> None:
+        """ empties the journal, once its entries are in the base file """
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+        self.entries = 0
@@ -1,99 +1,459 @@
 
 import os
+import gzip
 import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import pandas as pd
 
-from ..resources.defaults import (DEFAULT_LOC, coerce_details, coerce_sale)
+from ..resources.defaults import (DEFAULT_LOC, INFLATION_BASE,
+                                  coerce_details, coerce_sale)
+from .coercion import records_to_sales
+from .cube import AggregateCube
+from .dataset import write_dataset
+from .inflation import get_inflation
+from .decoding import get_decoder
+from .manifest import BuildManifest
+from .schema import compact_dataframe, memory_report
+from .spatial import SpatialIndex
+from .store import RecordStore, is_store
+
+from typing import Dict, Generator, Iterable, List, Tuple, Union
 
 
 TEST_FILE = "4248001002.json"
 JSON_LOC = DEFAULT_LOC
-ASSESSED_VALUES = []
-FILE_COUNT = 0
 # this variable is used to filter out NaN columns in the values we care about
 NUMBER_COLUMNS = ['AIN', 'Longitude', 'Latitude', 'NumOfUnits', 'YearBuilt',
                   'SqftMain', 'SqftLot', 'NumOfBeds', 'NumOfBaths',
                   'LandWidth', 'LandDepth', 'SaleNumber',
                   'AssessedValue']
 
-def make_year_month(x: str) -> str:
-    """ changes a time format of %b %Y to %Y-%m """
-    if x == 'Series ID':
-        return x
-    dt = datetime.strptime(x, '%b %Y')
-    return '{:d}-{:02d}'.format(dt.year, dt.month)
-
-# data from: https://data.bls.gov/pdq/SurveyOutputServlet
-# create an inflation dataframe from January 1975 to November 2021
-# CWUR0000SAH1 = CPI for Urban Wage Earners and Clerical Workers (CPI-W)
-# CWSR0000SAH1 = Shelter in U.S. city average, urban wage earners and clerical workers, seasonally adjusted
-# CWURS49ASA0 = All items in Los Angeles-Long Beach-Anaheim, CA,
-# urban wage earners and clerical workers, not seasonally adjusted
-inflation_df = pd.read_csv(os.sep.join([DEFAULT_LOC, 'inflation.txt']))
-inflation_df.drop(
-    list(inflation_df.filter(regex='Annual|HALF')),
-    axis=1, inplace=True)
-inflation_df = inflation_df.T
-inflation_df.drop(index='Series ID', inplace=True)  # delete the series names
-inflation_df.rename(columns={0: 'CPI-W', 1: 'UrbanShelter', 2: 'LAGoods'},
-                    inplace=True)
-inflation_df.index = inflation_df.index.map(make_year_month)
-inflation_df.loc['2021-12'] = inflation_df.loc['2021-11']  # use Nov for Dec 21
-# re-index inflation to Jan 2000
-# this is the same as the Los Angeles Case-Schiller
-# https://fred.stlouisfed.org/series/LXXRSA
-for col in inflation_df.columns:
-    inflation_df[col] = 100 * inflation_df[col] / \
-                        inflation_df.loc['2000-01', col]
+def assessed_values_from_dict(dd: dict) -> list:
+    """ turns one scraped record into a list of sales with parcel details """
+    avs: list = []
+    try:
+        sales = dd["ownership"]["Parcel_OwnershipHistory"]
+        details = coerce_details(dd["details"]["Parcel"])
+        details.pop("SubPartNumber", None)  # don't care about SubParts
+        details.pop("SubParts", None)
+        details.pop("LandAcres", None)  # almost always NaN
+    except KeyError:
+        return []  # some might not have an ownership history
+    else:
+        for sale in sales:  # sales is a list
+            ds = {}
+            try:
+                ds.update(details)
+                ds.update(coerce_sale(sale))
+            except KeyError:
+                pass
+            else:
+                avs.append(ds)
+    return avs
 
 
 def get_assessed_values(filename: str, loc: str = DEFAULT_LOC) -> list:
-    avs: list = []
     fn = os.sep.join([loc, filename])
     with open(fn) as f:
-        dd = json.load(f)
-        try:
-            sales = dd["ownership"]["Parcel_OwnershipHistory"]
-            details = coerce_details(dd["details"]["Parcel"])
-            del details["SubPartNumber"]  # don't care about SubParts
-            del details["SubParts"]
-            del details["LandAcres"]  # almost always NaN
-        except KeyError:
-            return []  # some might not have an ownership history
-        else:
-            for sale in sales:  # sales is a list
-                ds = {}
-                try:
-                    ds.update(details)
-                    ds.update(coerce_sale(sale))
-                except KeyError:
-                    pass
-                else:
-                    avs.append(ds)
-    return avs
+        return assessed_values_from_dict(json.load(f))
+
+
+def iter_json_records(loc: str = DEFAULT_LOC) -> Generator[dict, None, None]:
+    """
+    Streams the scraped records in loc, which is either a RecordStore or a
+    directory of one json file per AIN.
+    """
+    for raw in iter_raw_records(loc):
+        yield decode_record(raw)
+
+
+def iter_raw_records(loc: str = DEFAULT_LOC) -> Generator[bytes, None, None]:
+    """
+    Streams the undecoded scraped records in loc, which is either a
+    RecordStore (gzip members) or a directory of one json file per AIN.
+    """
+    for _, raw in iter_keyed_records(loc):
+        yield raw
+
+
+def iter_keyed_records(loc: str = DEFAULT_LOC,
+                       keys: Union[Iterable[str], None] = None
+                       ) -> Generator[Tuple[str, bytes], None, None]:
+    """
+    Streams (key, undecoded record) pairs from loc.  The key is the AIN the
+    record was saved under.
+
+    Parameters
+    ----------
+    loc : str
+        A RecordStore or a directory of json files.
+    keys : iterable of str
+        Only read these records.  Every record if None.
+    """
+    if is_store(loc):
+        with RecordStore(loc) as store:
+            if keys is None:
+                yield from store.iter_raw()
+            else:
+                for key in keys:
+                    member = store.get_raw(key)
+                    if member is not None:
+                        yield key, member
+    else:
+        if keys is None:
+            keys = [file_name[:-len('.json')]
+                    for file_name in os.listdir(loc)
+                    if file_name.endswith('.json')]
+        for key in keys:
+            try:
+                with open(os.sep.join([loc, key + '.json']), 'rb') as f:
+                    yield key, f.read()
+            except FileNotFoundError:
+                continue  # removed since it was listed
+
+
+def record_stamps(loc: str = DEFAULT_LOC) -> Dict[str, str]:
+    """
+    A stamp for each record in loc that changes whenever the record is
+    rewritten, without reading any records: the modification time and size
+    of each json file, or the position of each record in a RecordStore.
+    """
+    if is_store(loc):
+        with RecordStore(loc) as store:
+            return store.stamps()
+    stamps = {}
+    for entry in os.scandir(loc):
+        if entry.name.endswith('.json'):
+            st = entry.stat()
+            stamps[entry.name[:-len('.json')]] = '{:d}:{:d}'.format(
+                st.st_mtime_ns, st.st_size)
+    return stamps
+
+
+def record_hash(raw: bytes) -> str:
+    """
+    A hash of a record's content.  Store records are hashed decompressed,
+    as the gzip header carries a timestamp.
+    """
+    if raw[:2] == b'\x1f\x8b':
+        raw = gzip.decompress(raw)
+    return hashlib.sha1(raw).hexdigest()
+
+
+def decode_record(raw: bytes) -> dict:
+    """ decodes a record from iter_raw_records, every field of it """
+    if raw[:2] == b'\x1f\x8b':  # gzip magic number
+        raw = gzip.decompress(raw)
+    return get_decoder().loads(raw)
+
+
+def records_to_frame(raws: List[bytes],
+                     keys: Union[List[str], None] = None) -> pd.DataFrame:
+    """
+    Decodes, coerces and filters a batch of raw records into a dataframe of
+    sales.  This is the unit of work handed to each process in the pool.
+    If the records' keys are given, a RecordKey column says which record
+    each sale came from.
+    """
+    decoder = get_decoder()
+    df = records_to_sales([decoder.decode_record(raw) for raw in raws], keys)
+    if any(c not in df.columns for c in NUMBER_COLUMNS):
+        return df.iloc[0:0]  # every row would have a NaN
+    df = df.dropna(subset=NUMBER_COLUMNS)
+    # only go back to 1980
+    date_mask = pd.to_datetime(df['RecordingDate']) > \
+        datetime(year=1979, month=12, day=31)
+    return df[date_mask]
+
+
+def batched(iterable: Iterable, size: int) -> Generator[list, None, None]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_frame_chunks(loc: str = JSON_LOC,
+                      processes: Union[int, None] = None,
+                      batch_size: int = 500,
+                      records: Union[Iterable[Tuple[str, bytes]], None] = None
+                      ) -> Generator[pd.DataFrame, None, None]:
+    """
+    Streams dataframe chunks of sales built from the records in loc.
+    Batches of records are parsed across a process pool with only a few
+    batches in flight at once, so memory stays bounded no matter how many
+    records there are.  Chunks come out in record order.
 
+    Parameters
+    ----------
+    loc : str
+        A RecordStore or a directory of json files.
+    processes : int
+        Worker processes.  The number of CPUs if None; 1 parses in this
+        process.
+    batch_size : int
+        Records per batch.
+    records : iterable of (key, raw record)
+        Parse these records, from iter_keyed_records, instead of every
+        record in loc.  The chunks then carry a RecordKey column.
 
-for idx, file_name in enumerate(os.listdir(JSON_LOC)):
-    if '.json' in file_name:
-        ASSESSED_VALUES.extend(get_assessed_values(file_name, JSON_LOC))
-        FILE_COUNT += 1
+    Returns
+    -------
+    generator of pandas dataframes
+    """
+    if records is None:
+        batches = ((batch, None) for batch in
+                   batched(iter_raw_records(loc), batch_size))
+    else:
+        batches = (([raw for _, raw in batch], [key for key, _ in batch])
+                   for batch in batched(records, batch_size))
+    if processes == 1:
+        for raws, keys in batches:
+            yield records_to_frame(raws, keys)
+        return
+    if processes is None:
+        processes = os.cpu_count() or 1
+    with ProcessPoolExecutor(processes) as pool:
+        window = 2 * processes
+        pending: deque = deque()
+        for raws, keys in batches:
+            pending.append(pool.submit(records_to_frame, raws, keys))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
-print('Processed {:d} json files.'.format(FILE_COUNT))
+def concat_chunks(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    pd.concat(list(chunks), ignore_index=True), without holding every chunk
+    and the result at once.  Each chunk is split into its columns as it
+    arrives and dropped, and the columns are joined one at a time at the
+    end, so peak memory is about one copy of the result instead of two.
+    """
+    pieces: Dict[str, list] = {}
+    lengths: List[int] = []
+    for chunk in chunks:
+        for column in chunk.columns:
+            if column not in pieces:  # NaN in the chunks before
+                pieces[column] = [None] * len(lengths)
+            pieces[column].append(chunk[column].copy())
+        for column, parts in pieces.items():
+            if len(parts) == len(lengths):  # NaN in this chunk
+                parts.append(None)
+        lengths.append(chunk.shape[0])
+        del chunk
+    if not lengths:
+        return pd.DataFrame()
+    columns = {}
+    for column in list(pieces):
+        parts = pieces.pop(column)
+        # all-missing stretches take the column's type, as with pd.concat
+        empty = next(part for part in parts if part is not None).iloc[0:0]
+        parts = [empty.reindex(range(n)) if part is None else part
+                 for part, n in zip(parts, lengths)]
+        columns[column] = pd.concat(parts, ignore_index=True)
+        del parts
+    return pd.DataFrame(columns, copy=False)
+
+
+def add_inflation_indexes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    adds an index column for each inflation series, e.g. CPI-WIndex, with
+    INFLATION_BASE (January 2000) as 100
+    """
+    inflation = get_inflation()
+    for series in inflation.series:
+        df[series + 'Index'] = inflation.index(series, df['RecordingDate'],
+                                               INFLATION_BASE)
+    return df
+
+
+def _parse_records(records: Iterable[Tuple[str, bytes]],
+                   stamps: Dict[str, str],
+                   manifest: BuildManifest,
+                   processes: Union[int, None],
+                   batch_size: int) -> pd.DataFrame:
+    """
+    Parses keyed records into a dataframe of sales, noting each record's
+    stamp, hash and rows in the manifest.
+    """
+    hashes: Dict[str, str] = {}
+
+    def hashed():
+        for key, raw in records:
+            hashes[key] = record_hash(raw)
+            yield key, raw
+
+    produced: Dict[str, list] = {}
+
+    def noted(chunks):
+        # a record's rows are all in one chunk
+        for chunk in chunks:
+            if chunk.shape[0] > 0:
+                produced.update(
+                    chunk.groupby('RecordKey')['AIN'].unique().to_dict())
+            yield chunk.drop(columns='RecordKey', errors='ignore')
+
+    df = concat_chunks(noted(iter_frame_chunks(processes=processes,
+                                               batch_size=batch_size,
+                                               records=hashed())))
+    for key, content_hash in hashes.items():
+        manifest.set(key, stamps.get(key, ''), content_hash,
+                     produced.get(key, []))
+    return df
+
+
+def _save(df: pd.DataFrame, output: str, manifest: BuildManifest) -> None:
+    """ pickles df atomically, then writes its manifest """
+    tmp = output + '.tmp'
+    df.to_pickle(tmp)
+    os.replace(tmp, output)
+    manifest.save()
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    compact_df = compact_dataframe(df)
+    memory_report(compact_df, before=df)
+    return compact_df
+
+
+def manifest_name(output: str) -> str:
+    return output + '.manifest'
+
+
+def build_dataframe(loc: str = JSON_LOC,
+                    output: Union[str, None] = None,
+                    processes: Union[int, None] = None,
+                    batch_size: int = 500,
+                    compact: bool = True) -> pd.DataFrame:
+    """
+    Builds the housing dataframe from the scraped records in loc.
+
+    Parameters
+    ----------
+    loc : str
+        A RecordStore or a directory of json files.
+    output : str
+        If given, the dataframe is pickled here, along with a manifest
+        that lets rebuild_dataframe update it later.
+    processes : int
+        Worker processes.  The number of CPUs if None.
+    batch_size : int
+        Records per batch handed to a worker.
+    compact : bool
+        Convert to the compact types of schema.compact_dataframe and print
+        a memory report.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    if output is None:
+        df = concat_chunks(iter_frame_chunks(loc, processes, batch_size))
+    else:
+        # stamp before reading, so a record rewritten mid-build is
+        # picked up by the next rebuild
+        stamps = record_stamps(loc)
+        manifest = BuildManifest(manifest_name(output))
+        manifest.source = loc
+        manifest.base = INFLATION_BASE
+        df = _parse_records(iter_keyed_records(loc), stamps, manifest,
+                            processes, batch_size)
+    print('Built {:d} sales from {:s}'.format(df.shape[0], loc))
+    df = add_inflation_indexes(df)
+    if compact:
+        df = _compact(df)
+    if output is not None:
+        _save(df, output, manifest)
+    return df
+
+
+def rebuild_dataframe(loc: str = JSON_LOC,
+                      output: str = os.sep.join([DEFAULT_LOC,
+                                                 'wla_housing_df.pkl']),
+                      processes: Union[int, None] = None,
+                      batch_size: int = 500,
+                      compact: bool = True) -> pd.DataFrame:
+    """
+    Brings the pickled housing dataframe up to date with the records in
+    loc, parsing only the records that are new or have changed since it was
+    built.  The rows of changed and removed records are dropped and the
+    changed records' new rows, with their inflation indexes, are appended.
+    Records that were rewritten with the same content are not parsed.
+    Falls back to build_dataframe if there is no dataframe or manifest, or
+    they were built from somewhere else or with another INFLATION_BASE.
+
+    Parameters
+    ----------
+    loc : str
+        A RecordStore or a directory of json files.
+    output : str
+        The pickled dataframe to update.
+    processes : int
+        Worker processes.  None uses the number of CPUs, unless there is
+        only one batch of records to parse.
+    batch_size : int
+        Records per batch handed to a worker.
+    compact : bool
+        Convert to the compact types of schema.compact_dataframe and print
+        a memory report.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    manifest = BuildManifest(manifest_name(output))
+    if not os.path.isfile(output) or not manifest.load() or \
+            manifest.source != loc or manifest.base != INFLATION_BASE:
+        return build_dataframe(loc, output, processes, batch_size, compact)
+    stamps = record_stamps(loc)
+    changed, removed = manifest.diff(stamps)
+    if not changed and not removed:
+        print('{:s} is up to date'.format(output))
+        return pd.read_pickle(output)
+
+    records = []
+    for key, raw in iter_keyed_records(loc, changed):
+        if record_hash(raw) == manifest.content_hash(key):
+            manifest.entries[key][0] = stamps[key]  # touched, not changed
+        else:
+            records.append((key, raw))
+    stale = manifest.ains([key for key, _ in records] + removed)
+    for key in removed:
+        del manifest.entries[key]
+    if processes is None and len(records) <= batch_size:
+        processes = 1  # not worth starting a pool
+    new_df = _parse_records(records, stamps, manifest, processes,
+                            batch_size)
+    if new_df.shape[0] > 0:
+        new_df = add_inflation_indexes(new_df)
 
-df: pd.DataFrame = pd.DataFrame(ASSESSED_VALUES)
-print('Shape before dropna: ', df.shape)
-df.dropna(subset=NUMBER_COLUMNS, inplace=True)
-print('Shape after dropna: ', df.shape)
-# only go back to 1980
-date_mask = df['RecordingDate'] > datetime(year=1979, month=12, day=31)
-df = df[date_mask]
-period_series = pd.to_datetime(df['RecordingDate']
-                               ).dt.to_period('M').astype(str).tolist()
-for col in inflation_df.columns:
-    df[col + 'Index'] = inflation_df.loc[period_series, col].values
+    df = pd.read_pickle(output)
+    keep = ~df['AIN'].isin(stale)
+    df = pd.concat([df[keep], new_df], ignore_index=True)
+    if compact:  # categories of the old and new rows differ
+        df = _compact(df)
+    print('Reparsed {:d} of {:d} records ({:d} removed): {:d} sales '
+          'dropped, {:d} added'.format(len(records), len(stamps),
+                                       len(removed), int((~keep).sum()),
+                                       new_df.shape[0]))
+    _save(df, output, manifest)
+    return df
 
-df.to_pickle(os.sep.join([DEFAULT_LOC, 'wla_housing_df.pkl']))
 
+if __name__ == '__main__':
+    housing_df = rebuild_dataframe(JSON_LOC,
+                                   os.sep.join([DEFAULT_LOC,
+                                                'wla_housing_df.pkl']))
+    write_dataset(housing_df)
+    AggregateCube.build(housing_df).save()
+    SpatialIndex(housing_df).save()
@@ -0,0 +1,82 @@
+import os
+import json
+
+from typing import Dict, Iterable, List, Tuple, Union
+
+
+class BuildManifest:
+    """
+    Remembers what went into a built housing dataframe: for every scraped
+    record (keyed by AIN) a stamp that changes whenever the record is
+    rewritten, a hash of its content and the AINs of the sales rows it
+    produced.  Comparing the stamps against the records on disk tells
+    json_reader.rebuild_dataframe which records to parse again and which
+    rows to drop.
+    """
+    def __init__(self, filename: str):
+        """
+
+        Parameters
+        ----------
+        filename : str
+            The manifest file.  Usually the pickle file name + '.manifest'.
+        """
+        self.filename = filename
+        self.source: Union[str, None] = None
+        # the month the inflation index columns are 100 in
+        self.base: Union[str, None] = None
+        # key -> [stamp, content hash, [AINs of the rows produced]]
+        self.entries: Dict[str, list] = {}
+
+    def load(self) -> bool:
+        """ reads the manifest, returning False if there isn't one """
+        if not os.path.isfile(self.filename):
+            return False
+        with open(self.filename) as f:
+            data = json.load(f)
+        self.source = data['source']
+        self.base = data.get('base', '2000-01')  # the base before it was set
+        self.entries = data['entries']
+        return True
+
+    def save(self) -> None:
+        """ writes the manifest atomically """
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'source': self.source, 'base': self.base,
+                       'entries': self.entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+
+    def stamp(self, key: str) -> Union[str, None]:
+        entry = self.entries.get(key)
+        return None if entry is None else entry[0]
+
+    def content_hash(self, key: str) -> Union[str, None]:
+        entry = self.entries.get(key)
+        return None if entry is None else entry[1]
+
+    def ains(self, keys: Iterable[str]) -> List[int]:
+        """ the AINs of every row produced by the records in keys """
+        ains: list = []
+        for key in keys:
+            if key in self.entries:
+                ains.extend(self.entries[key][2])
+        return ains
+
+    def set(self, key: str, stamp: str, content_hash: str,
+            ains: List[int]) -> None:
+        self.entries[key] = [stamp, content_hash, [int(a) for a in ains]]
+
+    def diff(self, stamps: Dict[str, str]) -> Tuple[List[str], List[str]]:
+        """
+        Compares the manifest with the current record stamps.
+
+        Returns
+        -------
+        (keys that are new or whose stamp changed, keys no longer present)
+        """
+        changed = [k for k, s in stamps.items() if self.stamp(k) != s]
+        removed = [k for k in self.entries if k not in stamps]
+        return changed, removed
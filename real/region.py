@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import os
+import json
+
+from typing import TYPE_CHECKING, Iterable, List, Union
+
+from ..resources.defaults import DEFAULT_ZIPS, REGION, REGIONS_LOC
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Region:
+    """
+    A named set of zip codes to scrape and plot, kept in order (the order
+    addresses are searched and zip codes are plotted in) and as a set for
+    membership tests that don't slow down with the number of zip codes.
+    """
+    def __init__(self, name: str, zips: Iterable[int]):
+        """
+
+        Parameters
+        ----------
+        name : str
+            e.g. 'West LA'.
+        zips : iterable of int
+            The zip codes, duplicates are dropped.
+        """
+        self.name = name
+        self.zips: List[int] = list(dict.fromkeys(int(z) for z in zips))
+        self.zip_set = frozenset(self.zips)
+
+    def __contains__(self, zipcode) -> bool:
+        """ zipcode may be an int or a string like '90025' or '90025-1234' """
+        if not isinstance(zipcode, int):
+            try:
+                zipcode = int(str(zipcode)[:5])
+            except ValueError:
+                return False  # not a valid zip code
+        return zipcode in self.zip_set
+
+    def __len__(self) -> int:
+        return len(self.zips)
+
+    def __repr__(self) -> str:
+        return 'Region({!r}, {:d} zip codes)'.format(self.name, len(self))
+
+    def isin(self, zipcodes: pd.Series) -> pd.Series:
+        """ a mask of the zip codes (numbers or strings) in the region """
+        import pandas as pd
+        numbers = pd.to_numeric(zipcodes.astype(object).map(
+            lambda z: str(z)[:5] if isinstance(z, str) else z),
+            errors='coerce')
+        return numbers.isin(self.zips)
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'Region':
+        """
+        Loads a region file, either json like
+        {"name": "West LA", "zips": [90025, 90064, 90049]}
+        or text with zip codes separated by commas, spaces or new lines,
+        where # starts a comment and the name is the file name.
+        """
+        with open(filename) as f:
+            text = f.read()
+        if filename.endswith('.json'):
+            data = json.loads(text)
+            return cls(data.get('name', _stem(filename)), data['zips'])
+        zips = []
+        for line in text.splitlines():
+            line = line.split('#')[0]
+            zips.extend(z for z in line.replace(',', ' ').split())
+        return cls(_stem(filename), zips)
+
+    def save(self, filename: str) -> None:
+        """ writes a json region file """
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'name': self.name, 'zips': self.zips}, f, indent=1)
+        os.replace(tmp, filename)
+
+
+def _stem(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def load_region(region: Union[str, None] = REGION) -> Region:
+    """
+    The region of a name (a .json or .txt file in REGIONS_LOC) or of a
+    region file, or DEFAULT_ZIPS if None.
+    """
+    if region is None:
+        return Region('West LA', DEFAULT_ZIPS)
+    if os.path.isfile(region):
+        return Region.from_file(region)
+    for extension in ('.json', '.txt'):
+        filename = os.sep.join([REGIONS_LOC, region + extension])
+        if os.path.isfile(filename):
+            return Region.from_file(filename)
+    raise FileNotFoundError('No region file for {:s} in {:s}'.format(
+        region, REGIONS_LOC))
+
+
+_region: Union[Region, None] = None
+
+
+def get_region() -> Region:
+    """ the region being scraped and plotted, REGION unless set_region """
+    global _region
+    if _region is None:
+        _region = load_region()
+    return _region
+
+
+def set_region(region: Union[Region, str]) -> Region:
+    """ makes region (or the region of a name or file) the current one """
+    global _region
+    _region = region if isinstance(region, Region) else load_region(region)
+    return _region
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Dict, Union
+
+from ..resources.defaults import (TYPE_COERCION, SALE_COERCION,
+                                  coerce_date, yn_to_bool, zipcode_to_int)
+
+# nullable integer types, smallest first
+INT_TYPES = [('Int8', np.int8), ('Int16', np.int16), ('Int32', np.int32),
+             ('Int64', np.int64)]
+# string columns with at most this fraction of distinct values become
+# categoricals
+CATEGORY_RATIO = 0.5
+
+
+def small_int_dtype(values: pd.Series) -> str:
+    """ the smallest nullable integer type that holds every value """
+    low, high = values.min(), values.max()
+    if pd.isna(low):
+        return 'Int8'
+    for name, np_type in INT_TYPES:
+        info = np.iinfo(np_type)
+        if info.min <= low and high <= info.max:
+            return name
+    return 'Int64'
+
+
+def _to_int(values: pd.Series) -> pd.Series:
+    numbers = pd.to_numeric(values, errors='coerce')  # bad zip codes -> NA
+    return numbers.astype('Int64').astype(small_int_dtype(numbers))
+
+
+def _to_bool(values: pd.Series) -> pd.Series:
+    return values.astype('boolean')
+
+
+def _to_date(values: pd.Series) -> pd.Series:
+    return pd.to_datetime(values, errors='coerce').astype('datetime64[ns]')
+
+
+def _to_float(values: pd.Series) -> pd.Series:
+    return values.astype('float64')
+
+
+def _to_text(values: pd.Series) -> pd.Series:
+    if values.nunique() <= CATEGORY_RATIO * values.shape[0]:
+        return values.astype('category')
+    return values.astype('string')
+
+
+# the compact type for each scalar coercion function
+COMPACT_TYPES: Dict[Callable, Callable] = {
+    int: _to_int,
+    float: _to_float,
+    coerce_date: _to_date,
+    yn_to_bool: _to_bool,
+    zipcode_to_int: _to_int}
+
+
+def _recategorize(values: pd.Series) -> pd.Series:
+    # e.g. after an incremental rebuild dropped the rows of some categories
+    return _to_text(values.cat.remove_unused_categories())
+
+
+def _untyped(values: pd.Series) -> Union[Callable, None]:
+    """ the compact type for a column that isn't in the coercion tables """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return _recategorize
+    if values.dtype != object and not pd.api.types.is_string_dtype(
+            values.dtype):
+        return None  # already typed
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind == 'string':
+        return _to_text
+    elif kind in ('floating', 'integer', 'mixed-integer-float'):
+        return _to_float  # e.g. the inflation indexes
+    return None
+
+
+def compact_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the housing dataframe to compact types chosen from the
+    TYPE_COERCION and SALE_COERCION tables: the smallest nullable integer
+    that fits, datetime64 dates and nullable booleans.  The -1 sentinels
+    are kept, missing values become <NA>.  Other text columns become
+    categoricals if their values repeat (e.g. SitusCity, UseType) or
+    strings otherwise.  Columns that won't convert are left as they are.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe of housing information produced by json_reader.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    table = dict(TYPE_COERCION)
+    table.update(SALE_COERCION)
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if col in table:
+            convert = COMPACT_TYPES[table[col]]
+        else:
+            convert = _untyped(df[col])
+            if convert is None:
+                continue
+        try:
+            df[col] = convert(df[col])
+        except (TypeError, ValueError) as e:
+            print('Leaving {:s} as {:s}: {:s}'.format(col, str(df[col].dtype),
+                                                     str(e)))
+    return df
+
+
+def memory_report(df: pd.DataFrame,
+                  before: Union[pd.DataFrame, None] = None) -> pd.DataFrame:
+    """
+    The memory used by each column of df, including the strings held by
+    object columns, and by the same column of before if given.
+
+    Returns
+    -------
+    pandas dataframe indexed by column, with a 'Total' row, and printed
+    """
+    report = pd.DataFrame({'dtype': df.dtypes.astype(str),
+                           'MB': df.memory_usage(index=False, deep=True)
+                           / 1024 ** 2})
+    if before is not None:
+        report['MB before'] = before.memory_usage(index=False, deep=True)\
+            .reindex(report.index) / 1024 ** 2
+    report.loc['Total'] = report.sum(numeric_only=True)
+    report.loc['Total', 'dtype'] = ''
+    print(report.to_string(float_format='{:0.2f}'.format))
+    return report
@@ -1,19 +1,30 @@
 
-import requests
+import os
 import json
 import time
 from random import random
+import numpy as np
 import pandas as pd
 
-from typing import List, Union, Tuple
+from typing import List, Set, Union, Tuple
 
-from ..resources.defaults import TYPES, COLUMNS, DEFAULT_ZIPS, DEFAULT_LOC
+from ..resources.defaults import (TYPES, COLUMNS, DEFAULT_LOC,
+                                  JOURNAL_COMPACT_EVERY, SEARCH_URL)
 from .addresses import (make_address_dict,
-                        make_address_string
+                        make_address_string,
+                        canonicalize_addresses,
+                        canonicalize_results
                         )
-
-def basic_scrape(ain: int, info: str = 'details') -> Union[dict, None]:
-    """ scrapes the LA Assessor's API for a particular piece of info """
+from .store import RecordStore
+from .journal import ProgressJournal
+from .coverage import CoverageIndex
+from .region import get_region
+from .work_queue import (WorkQueue, SEARCH, DETAILS,
+                         queue_addresses, queue_ains)
+from .client import get_client, AssessorError, CircuitOpenError
+
+def make_ain_url(ain: int, info: str = 'details') -> Union[str, None]:
+    """ builds the LA Assessor's API url for a particular piece of info """
     base_url = 'https://portal.assessor.lacounty.gov/api/'
     ain_url = '?ain='
     try:
@@ -23,8 +34,24 @@ def basic_scrape(ain: int, info: str = 'details') -> Union[dict, None]:
         print('Known types are {}'.format(list(TYPES.keys())))
         print(e)
     else:
-        url = base_url + type_url + ain_url + str(ain)
-        return requests.get(url).json()
+        return base_url + type_url + ain_url + str(ain)
+    return None
+
+
+def pause(base_sleep: float) -> None:
+    """
+    Sleeps (random.random() + 1) * base_sleep after an API call, unless it
+    was answered from the response cache.
+    """
+    if not get_client().last_cached:
+        time.sleep((random() + 1) * base_sleep)
+
+
+def basic_scrape(ain: int, info: str = 'details') -> Union[dict, None]:
+    """ scrapes the LA Assessor's API for a particular piece of info """
+    url = make_ain_url(ain, info)
+    if url is not None:
+        return get_client().get_json(url)
     return None
 
 
@@ -42,7 +69,8 @@ def scrape(ain: int,
         The list of keys in TYPES variable to fetch from the server.
     base_sleep : float
         How long to sleep after an API call.  Prevents hammering the server.
-        Time between calls is (random.random() + 1) * base_sleep
+        Time between calls is (random.random() + 1) * base_sleep, and there
+        is no sleep after a cached response.
 
     Returns
     -------
@@ -51,11 +79,12 @@ def scrape(ain: int,
     data = {}
     for info in infos:
         data[info] = basic_scrape(ain, info)
-        time.sleep((random() + 1) * base_sleep)
+        pause(base_sleep)
     return data
 
 
-def save_json(data: dict, name: str, location: str) -> None:
+def save_json(data: dict, name: str, location: str,
+              store: Union[RecordStore, None] = None) -> None:
     """
     Dumps data to the json file.  Will overwrite the target file.
 
@@ -67,7 +96,13 @@ def save_json(data: dict, name: str, location: str) -> None:
         What to name the file.  .json will be appended.
     location: str
         Where to put the data.
+    store : RecordStore
+        If given, the data is appended to this store under name instead of
+        being written to its own file in location.
     """
+    if store is not None:
+        store.append(name, data)
+        return
     fn = '/'.join([location, name + '.json'])
     with open(fn, 'w') as jf:
         json.dump(data, jf, indent=4)
@@ -87,23 +122,16 @@ def make_address_search_string(addr: dict) -> str:
     -------
     str
     """
-    base_url = 'https://portal.assessor.lacounty.gov/api/search?search='
-    return base_url + '%20'.join(list(addr.values()))
+    return SEARCH_URL + '%20'.join(list(addr.values()))
 
 
 def fuzzy_match(parcel: dict) -> bool:
-    zipcode = parcel['SitusZipCode'][:5]
-    try:
-        zc = int(zipcode)
-    except ValueError:
-        return False  # not a valid zip code
-    else:
-        if zc not in DEFAULT_ZIPS:
-            return False
-    return True
+    # invalid zip codes aren't in any region
+    return parcel['SitusZipCode'][:5] in get_region()
 
 
-def get_ain_from_address(new_rows: dict, addr: dict) -> dict:
+def get_ain_from_address(new_rows: dict, addr: dict,
+                         coverage: Union[CoverageIndex, None] = None) -> dict:
     """
     Looks through the results of an LA Assessor's website search and tries
     to get an Assessor's ID Number (AIN) for the address given.
@@ -114,13 +142,37 @@ def get_ain_from_address(new_rows: dict, addr: dict) -> dict:
         Dictionary to append the new ains to
     addr : dict
         Address from .addresses.make_address_dict
+    coverage : CoverageIndex
+        If given, the query and the parcels it returns are recorded here.
 
     Returns
     -------
     new_rows with possibly new information added
     """
     # search for the address in the LA Assessor's database
-    result = requests.get(make_address_search_string(addr)).json()
+    query = make_address_search_string(addr)
+    result = get_client().get_json(query)
+    if coverage is not None:
+        coverage.add_query(query)
+        coverage.add_result(result)
+    return add_matching_parcels(new_rows, result)
+
+
+def add_matching_parcels(new_rows: dict, result: dict) -> dict:
+    """
+    Appends the parcels in a search result that pass fuzzy_match to new_rows.
+
+    Parameters
+    ----------
+    new_rows : dict
+        Dictionary to append the new ains to
+    result : dict
+        The decoded json of an LA Assessor's website search.
+
+    Returns
+    -------
+    new_rows with possibly new information added
+    """
     for parcel in result['Parcels']:
         # do a fuzzy match on the address strings
         if fuzzy_match(parcel):
@@ -134,7 +186,9 @@ def get_ain_from_address(new_rows: dict, addr: dict) -> dict:
 def scrape_ains(address_df: pd.DataFrame,
                 results_df: Union[pd.DataFrame, None] = None,
                 number: Union[int, None] = None,
-                base_sleep: float = 1.0
+                base_sleep: float = 1.0,
+                coverage: Union[CoverageIndex, None] = None,
+                failed: Union[Set, None] = None
                 ) -> Tuple[bool, pd.DataFrame, pd.DataFrame]:
     """
     Scrapes the Assessor's ID numbers (AINs) for "number" of the entries in df.
@@ -146,57 +200,122 @@ def scrape_ains(address_df: pd.DataFrame,
     results_df : pd.DataFrame
         Dataframe to add discovered addresses to.
     number : int
-        The number of previously un-scraped rows to scrape.
+        The number of previously un-scraped rows to search, counting
+        failed searches.
     base_sleep : float
         How long to sleep after an API call.  Prevents hammering the server.
         Time between calls is (random.random() + 1) * base_sleep
+    coverage : CoverageIndex
+        If given, addresses it already covers are marked searched without
+        a request, and new searches are recorded in it.
+    failed : set
+        Index labels of rows whose searches failed earlier in the run.  They
+        are skipped, and rows that fail now are added.
 
     Returns
     -------
-    bool that is True if any scrapes were attempted and the pandas dataframe
-    with new AINs added
+    bool that is True if any searches succeeded and the circuit didn't
+    open, and the pandas dataframe with new AINs added.  If the circuit
+    opens the AINs found so far are still added.
     """
     # create the column for new dataframes
     if 'Searched' not in address_df.columns:
-        address_df['Searched'] = pd.Series([False] * address_df.shape[0],
-                                           dtype=bool)
+        address_df['Searched'] = False  # aligns with any index
     if results_df is None:  # create a new dataframe if necessary
         results_df = pd.DataFrame(columns=COLUMNS)
+    if failed is None:
+        failed = set()
 
     # start the counter and break conditions
     if number is None:
         number = 9999999999999999
     count = 0
-    scraped_any = False
+    scraped_any = circuit_open = False
     new_rows = {c: [] for c in COLUMNS}
+    if coverage is not None:  # stored by AINData, see canonical_columns
+        queries, keys = canonical_columns(address_df)
 
     for index, row in address_df.iterrows():
-        if row['Searched']:  # if this row has been searched already
+        if row['Searched'] or index in failed:  # searched already
             continue  # skip this row
         addr = make_address_dict(row)
+        if coverage is not None and \
+                coverage.covers(queries[index], keys[index]):
+            address_df.loc[index, 'Searched'] = True  # already answered
+            coverage.saved += 1
+            continue
         addr_str = make_address_string(addr)
         print('Searching for ({:d}/{:d}): {:s}'.format(index + 1,
                                                        address_df.shape[0],
                                                        addr_str))
-        new_rows = get_ain_from_address(new_rows, addr)
-        # update the address dataframe
-        address_df.loc[index, 'Searched'] = True  # mark it searched
+        try:
+            new_rows = get_ain_from_address(new_rows, addr, coverage)
+        except CircuitOpenError as e:
+            print(e)  # the server is down, stop and keep what we have
+            circuit_open = True
+            break
+        except AssessorError as e:
+            print(e)  # un-searched, so the next run tries again
+            failed.add(index)
+        else:
+            address_df.loc[index, 'Searched'] = True  # mark it searched
+            scraped_any = True
         count += 1
-        scraped_any = True
         if count >= number:
             break  # all done
-        time.sleep((random() + 1) * base_sleep)
+        pause(base_sleep)
 
     # add the new rows to results
     results_df = pd.concat([results_df, pd.DataFrame(new_rows)])\
         .drop_duplicates('AIN').reset_index(drop=True)
-    return scraped_any, address_df, results_df
+    if coverage is not None:
+        print(coverage.report())
+    return scraped_any and not circuit_open, address_df, results_df
+
+
+def build_coverage(address_df: pd.DataFrame,
+                   results_df: pd.DataFrame) -> CoverageIndex:
+    """
+    Rebuilds a CoverageIndex from the queries of the already 'Searched' rows
+    in address_df and the parcel addresses in results_df, so it doesn't need
+    to be saved between runs.
+    """
+    coverage = CoverageIndex(results_df)
+    if 'Searched' in address_df.columns:
+        searched = address_df['Searched'].fillna(False).astype(bool)
+        queries, _ = canonical_columns(address_df)
+        coverage.queries.update(queries[searched])
+    return coverage
+
+
+def canonical_columns(address_df: pd.DataFrame) -> Tuple[pd.Series,
+                                                          pd.Series]:
+    """
+    The SearchString and AddressKey columns of an address dataframe, added
+    by addresses.canonicalize_addresses if it doesn't have them yet (one
+    that AINData loaded always does).
+    """
+    if 'SearchString' not in address_df.columns or \
+            'AddressKey' not in address_df.columns:
+        canonicalize_addresses(address_df)
+    return address_df['SearchString'], address_df['AddressKey']
 
 
 class AINData:
     """
+    Context manager around a pickled dataframe of addresses or AINs.
+
+    Progress made inside the context is recorded with checkpoint() in an
+    append-only journal next to the pickle, which is replayed on entry and
+    compacted back into the pickle every compact_every checkpoints and on
+    exit.  Addresses get their SearchString and AddressKey columns on entry,
+    if they don't have them, and AINs their AddressKey on entry and when
+    compacted (see addresses.canonicalize_addresses and
+    canonicalize_results), so they are worked out once rather than on every
+    search.
     """
-    def __init__(self, filename: str, ain_type: str = 'results'):
+    def __init__(self, filename: str, ain_type: str = 'results',
+                 compact_every: int = JOURNAL_COMPACT_EVERY):
         """
 
         Parameters
@@ -206,9 +325,13 @@ class AINData:
         ain_type : str
             'results' for a results-type file: allows creation of an empty file
             'address' for an address-type file: must be populated before hand
+        compact_every : int
+            How many checkpoints to journal before rewriting the pickle.
         """
         self.filename = filename
         self.ain_type = ain_type
+        self.compact_every = compact_every
+        self.journal = ProgressJournal(filename + '.journal')
         self._df: Union[pd.DataFrame, None] = None
 
     def __enter__(self):
@@ -221,17 +344,67 @@ class AINData:
                 print('ain_type="address" must be created before scraping')
                 print(e)
                 raise FileNotFoundError
+        self.df = self.journal.replay(self.df)
+        if self.ain_type == 'address':
+            canonical_columns(self.df)
+        else:
+            self.df = canonicalize_results(self.df)
         return self
 
     def __exit__(self, etype, evalue, etraceback):
-        self.df.to_pickle(self.filename)
+        self.compact()
+
+    def flags(self, flag: str) -> np.ndarray:
+        """ a copy of the flag column, all False if it doesn't exist yet """
+        if flag not in self.df.columns:
+            return np.zeros(self.df.shape[0], dtype=bool)
+        return self.df[flag].fillna(False).to_numpy(dtype=bool, copy=True)
+
+    def checkpoint(self,
+                   flag: Union[str, None] = None,
+                   before: Union[np.ndarray, None] = None,
+                   n_rows: Union[int, None] = None) -> None:
+        """
+        Journals the progress made since a snapshot taken with flags() and/or
+        the number of rows in df at the time.
+
+        Parameters
+        ----------
+        flag : str
+            The flag column that may have been set, e.g. 'Searched'.
+        before : np.ndarray
+            The output of flags(flag) at the start of the chunk.
+        n_rows : int
+            The number of rows in df at the start of the chunk.  Rows after
+            these are journaled as new.
+        """
+        index = None
+        if flag is not None and before is not None:
+            now = self.flags(flag)[:len(before)]
+            index = self.df.index[:len(before)][now & ~before]
+        new_rows = None
+        if n_rows is not None:
+            new_rows = self.df.iloc[n_rows:]
+        self.journal.record(flag, index, new_rows)
+        if self.journal.entries >= self.compact_every:
+            self.compact()
+
+    def compact(self) -> None:
+        """ atomically rewrites the pickle and empties the journal """
+        if self.ain_type != 'address':  # keys for the AINs found since
+            self.df = canonicalize_results(self.df)
+        tmp = self.filename + '.tmp'
+        self.df.to_pickle(tmp)
+        os.replace(tmp, self.filename)
+        self.journal.clear()
 
 
 def scrape_ains_for_file(address_file: str,
                          results_file: Union[str, None] = None,
                          chunk_size: int = 100,
                          chunks: Union[int, None] = None,
-                         base_sleep: float = 1.0
+                         base_sleep: float = 1.0,
+                         skip_covered: bool = True
                          ) -> None:
     """
     Scrapes the LA Assessor's office website for Assessor's ID Numbers (AINs)
@@ -249,6 +422,9 @@ def scrape_ains_for_file(address_file: str,
     base_sleep : float
         How long to sleep after an API call.  Prevents hammering the server.
         Time between calls is (random.random() + 1) * base_sleep
+    skip_covered : bool
+        Skip addresses already answered by earlier searches.  See
+        coverage.CoverageIndex.
 
     Returns
     -------
@@ -257,24 +433,40 @@ def scrape_ains_for_file(address_file: str,
     if chunks is None:
         chunks = 999999999999999999
     chunk = 0
-    keep_scraping = True
+    failed: set = set()
     with AINData(address_file, 'address') as add, \
             AINData(results_file, 'results') as res:
-        while chunk < chunks and keep_scraping:
+        coverage = build_coverage(add.df, res.df) if skip_covered else None
+        while chunk < chunks:
+            searched = add.flags('Searched')
+            found = res.df.shape[0]
+            n_failed = len(failed)
             keep_scraping, add.df, res.df = scrape_ains(address_df=add.df,
                                                         results_df=res.df,
                                                         number=chunk_size,
-                                                        base_sleep=base_sleep
+                                                        base_sleep=base_sleep,
+                                                        coverage=coverage,
+                                                        failed=failed
                                                         )
+            # results first: a crash in between only repeats some searches
+            res.checkpoint(n_rows=found)
+            add.checkpoint('Searched', searched)
             chunk += 1
             print('results_df is now {:d} long'.format(res.df.shape[0]))
+            if not keep_scraping and len(failed) == n_failed:
+                break  # all done, or the circuit opened
+    if failed:
+        print('{:d} searches failed and were left for the next '
+              'run'.format(len(failed)))
 
 
 def scrape_data_for_ains(ain_df: pd.DataFrame,
                          number: int = 100,
                          location: Union[str, None] = None,
                          infos: List[str] = list(TYPES.keys()),
-                         base_sleep: float = 1
+                         base_sleep: float = 1,
+                         store: Union[RecordStore, None] = None,
+                         failed: Union[Set, None] = None
                          ) -> bool:
     """
     Scrapes the data requested in infos for the rows in ain_df.
@@ -285,7 +477,7 @@ def scrape_data_for_ains(ain_df: pd.DataFrame,
     ain_df : pd.DataFrame
         Dataframe with Assessor's ID Numbers to search for.
     number : int
-        The number of records to scrape.
+        The number of records to scrape, counting failed scrapes.
     location : str
         Directory where to store the scraped data.
     infos : dict
@@ -293,22 +485,30 @@ def scrape_data_for_ains(ain_df: pd.DataFrame,
     base_sleep : float
         How long to sleep after an API call.  Prevents hammering the server.
         Time between calls is (random.random() + 1) * base_sleep
+    store : RecordStore
+        If given, the data is saved to this store instead of location.
+    failed : set
+        Index labels of rows whose scrapes failed earlier in the run.  They
+        are skipped, and rows that fail now are added.
 
     Returns
     -------
-    Boolean: true if any data was scraped
+    Boolean: true if any data was scraped and the circuit didn't open
     """
     # create the column for new dataframes
     if 'Scraped' not in ain_df.columns:
-        ain_df['Scraped'] = pd.Series([False] * ain_df.shape[0], dtype=bool)
+        ain_df['Scraped'] = False
     if location is None:
         location = DEFAULT_LOC
+    if failed is None:
+        failed = set()
 
-    scraped = False
+    scraped = circuit_open = False
     count = 0
+    index = -1  # in case ain_df is empty
     for index, row in ain_df.iterrows():
         # if this row has been searched already
-        if row['Scraped'] is True:
+        if row['Scraped'] is True or index in failed:
             continue  # skip this row
         elif count >= number:
             print('Count reached.')
@@ -317,33 +517,245 @@ def scrape_data_for_ains(ain_df: pd.DataFrame,
         print('scraping info for ({:d}/{:d}): {:s}'.format(index + 1,
                                                            ain_df.shape[0],
                                                            rs))
-        data = scrape(row['AIN'], infos=infos, base_sleep=base_sleep)
+        try:
+            data = scrape(row['AIN'], infos=infos, base_sleep=base_sleep)
+        except CircuitOpenError as e:
+            print(e)  # the server is down, stop and keep what we have
+            circuit_open = True
+            break
+        except AssessorError as e:
+            print(e)  # un-scraped, so the next run tries again
+            failed.add(index)
+            count += 1
+            continue
         save_json(data=data,
                   name=str(row['AIN']),
-                  location=location)
+                  location=location,
+                  store=store)
         ain_df.loc[index, 'Scraped'] = True
         scraped = True
         count += 1
     print('Made it to index: {:d}'.format(index))
-    return scraped
+    return scraped and not circuit_open
 
 def scrape_chunks_for_ains(ain_df: str,
                            chunk_size: int = 100,
                            chunks: Union[int, None] = None,
                            location: Union[str, None] = None,
                            infos: List[str] = list(TYPES.keys()),
-                           base_sleep: float = 1
+                           base_sleep: float = 1,
+                           store: Union[RecordStore, None] = None
                            ) -> None:
     if chunks is None:
         chunks = 999999999999999999
     chunk = 0
-    keep_scraping = True
+    failed: set = set()
 
-    while chunk < chunks and keep_scraping:
-        with AINData(ain_df) as ain:
+    with AINData(ain_df) as ain:
+        while chunk < chunks:
+            scraped = ain.flags('Scraped')
+            n_failed = len(failed)
             keep_scraping = scrape_data_for_ains(ain_df=ain.df,
                                                  number=chunk_size,
                                                  location=location,
                                                  infos=infos,
-                                                 base_sleep=base_sleep)
-        chunk += 1
+                                                 base_sleep=base_sleep,
+                                                 store=store,
+                                                 failed=failed)
+            ain.checkpoint('Scraped', scraped)
+            chunk += 1
+            if not keep_scraping and len(failed) == n_failed:
+                break  # all done, or the circuit opened
+    if failed:
+        print('{:d} scrapes failed and were left for the next '
+              'run'.format(len(failed)))
+
+
+def scrape_ains_from_queue(address_file: str,
+                           results_file: str,
+                           queue: Union[WorkQueue, None] = None,
+                           chunk_size: int = 100,
+                           chunks: Union[int, None] = None,
+                           base_sleep: float = 1.0,
+                           skip_covered: bool = True
+                           ) -> None:
+    """
+    Queue-driven version of scrape_ains_for_file.  Pending addresses are
+    leased from a WorkQueue instead of being found by walking the whole
+    address dataframe each chunk, and addresses whose searches keep failing
+    end up in the queue's dead-letter list.
+
+    Parameters
+    ----------
+    address_file : str
+        File to open and scrape with.  Pandas data pickle file.
+    results_file : str
+        File to add discovered AINs to.  Pandas data pickle file.
+    queue : WorkQueue
+        The queue to work from.  Addresses not yet in it are added.
+    chunk_size : int
+        How many addresses to search between saves.
+    chunks : int
+        How many times to run chunk_size searches and then save.
+    base_sleep : float
+        How long to sleep after an API call.  Prevents hammering the server.
+        Time between calls is (random.random() + 1) * base_sleep
+    skip_covered : bool
+        Skip addresses already answered by earlier searches.  See
+        coverage.CoverageIndex.
+
+    Returns
+    -------
+    Nothing.
+    """
+    if queue is None:
+        queue = WorkQueue()
+    if chunks is None:
+        chunks = 999999999999999999
+    chunk = 0
+    with AINData(address_file, 'address') as add, \
+            AINData(results_file, 'results') as res:
+        queue_addresses(queue, add.df)
+        if 'Searched' not in add.df.columns:
+            add.df['Searched'] = False
+        coverage = build_coverage(add.df, res.df) if skip_covered else None
+        queries, addr_keys = canonical_columns(add.df)
+        failed: set = set()  # tried once this run, see queue.lease
+        while chunk < chunks:
+            keys = queue.lease(SEARCH, chunk_size, skip=failed)
+            if not keys:
+                break  # all done
+            searched = add.flags('Searched')
+            found = res.df.shape[0]
+            new_rows = {c: [] for c in COLUMNS}
+            done = []
+            circuit_open = False
+            for i, key in enumerate(keys):
+                index = int(key)
+                if index not in add.df.index:
+                    queue.fail(SEARCH, key, 'not in ' + address_file)
+                    failed.add(key)
+                    continue
+                addr = make_address_dict(add.df.loc[index])
+                if coverage is not None and coverage.covers(
+                        queries[index], addr_keys[index]):
+                    add.df.loc[index, 'Searched'] = True
+                    coverage.saved += 1
+                    done.append(key)
+                    continue
+                print('Searching for ({:d}/{:d}): {:s}'.format(
+                    index + 1, add.df.shape[0], make_address_string(addr)))
+                try:
+                    new_rows = get_ain_from_address(new_rows, addr, coverage)
+                except CircuitOpenError as e:
+                    print(e)  # the server is down, hand back the rest
+                    queue.release(SEARCH, keys[i:])
+                    circuit_open = True
+                    break
+                except AssessorError as e:
+                    print(e)
+                    queue.fail(SEARCH, key, str(e))
+                    failed.add(key)
+                else:
+                    add.df.loc[index, 'Searched'] = True
+                    done.append(key)
+                pause(base_sleep)
+            res.df = pd.concat([res.df, pd.DataFrame(new_rows)])\
+                .drop_duplicates('AIN').reset_index(drop=True)
+            res.checkpoint(n_rows=found)
+            add.checkpoint('Searched', searched)
+            queue.complete(SEARCH, done)
+            chunk += 1
+            print('results_df is now {:d} long'.format(res.df.shape[0]))
+            if circuit_open:
+                break
+    print('Search queue: {}'.format(queue.counts(SEARCH)))
+    if coverage is not None:
+        print(coverage.report())
+
+
+def scrape_data_from_queue(ain_file: str,
+                           queue: Union[WorkQueue, None] = None,
+                           chunk_size: int = 100,
+                           chunks: Union[int, None] = None,
+                           location: Union[str, None] = None,
+                           infos: List[str] = list(TYPES.keys()),
+                           base_sleep: float = 1,
+                           store: Union[RecordStore, None] = None
+                           ) -> None:
+    """
+    Queue-driven version of scrape_chunks_for_ains.  Pending AINs are leased
+    from a WorkQueue, and AINs whose scrapes keep failing end up in the
+    queue's dead-letter list.
+
+    Parameters
+    ----------
+    ain_file : str
+        File of AINs to scrape.  Pandas data pickle file.
+    queue : WorkQueue
+        The queue to work from.  AINs not yet in it are added.
+    chunk_size : int
+        How many AINs to scrape between saves.
+    chunks : int
+        How many times to run chunk_size scrapes and then save.
+    location : str
+        Directory where to store the scraped data.
+    infos : List[str]
+        The list of keys in TYPES variable to fetch from the server.
+    base_sleep : float
+        How long to sleep after an API call.  Prevents hammering the server.
+        Time between calls is (random.random() + 1) * base_sleep
+    store : RecordStore
+        If given, the data is saved to this store instead of location.
+
+    Returns
+    -------
+    Nothing.
+    """
+    if queue is None:
+        queue = WorkQueue()
+    if chunks is None:
+        chunks = 999999999999999999
+    if location is None:
+        location = DEFAULT_LOC
+    chunk = 0
+    with AINData(ain_file) as ain:
+        queue_ains(queue, ain.df)
+        if 'Scraped' not in ain.df.columns:
+            ain.df['Scraped'] = False
+        rows = {str(a): i for i, a in zip(ain.df.index, ain.df['AIN'])}
+        failed: set = set()  # tried once this run, see queue.lease
+        while chunk < chunks:
+            keys = queue.lease(DETAILS, chunk_size, skip=failed)
+            if not keys:
+                break  # all done
+            scraped = ain.flags('Scraped')
+            done = []
+            circuit_open = False
+            for i, key in enumerate(keys):
+                if key not in rows:
+                    queue.fail(DETAILS, key, 'not in ' + ain_file)
+                    failed.add(key)
+                    continue
+                print('scraping info for AIN {:s}'.format(key))
+                try:
+                    data = scrape(key, infos=infos, base_sleep=base_sleep)
+                except CircuitOpenError as e:
+                    print(e)  # the server is down, hand back the rest
+                    queue.release(DETAILS, keys[i:])
+                    circuit_open = True
+                    break
+                except AssessorError as e:
+                    print(e)
+                    queue.fail(DETAILS, key, str(e))
+                    failed.add(key)
+                    continue
+                save_json(data=data, name=key, location=location, store=store)
+                ain.df.loc[rows[key], 'Scraped'] = True
+                done.append(key)
+            ain.checkpoint('Scraped', scraped)
+            queue.complete(DETAILS, done)
+            chunk += 1
+            if circuit_open:
+                break
+    print('Details queue: {}'.format(queue.counts(DETAILS)))
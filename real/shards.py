@@ -0,0 +1,384 @@
+import os
+import glob
+import json
+import zlib
+
+import pandas as pd
+
+from typing import Callable, List, Union
+
+from ..resources.defaults import TYPES, STORE_LOC
+from .addresses import address_search_strings
+from .journal import ProgressJournal
+from .scraper import (AINData,
+                      scrape_ains_for_file,
+                      scrape_chunks_for_ains
+                      )
+from .store import RecordStore, is_store
+
+# the parts of a stage's files: each worker's slice of the stage's input, and
+# what it writes
+INPUT = 'input'
+OUTPUT = 'shard'
+# the progress flags carried over when an input shard is rebuilt
+FLAGS = ['Searched', 'Scraped']
+
+
+def stable_hash(key: str) -> int:
+    """
+    A hash of key that is the same in every process and on every host,
+    unlike the builtin hash() which is salted per process.
+    """
+    return zlib.crc32(str(key).encode())
+
+
+def shard_name(filename: str, shard: int, shards: int,
+               part: str = OUTPUT) -> str:
+    """
+    The name of one shard of filename, e.g. ain_dataframe.pkl ->
+    ain_dataframe.shard-002-of-008.pkl, or with part=INPUT
+    ain_dataframe.input-002-of-008.pkl
+    """
+    root, ext = os.path.splitext(filename)
+    return '{:s}.{:s}-{:03d}-of-{:03d}{:s}'.format(root, part, shard, shards,
+                                                   ext)
+
+
+def address_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    The shard keys of an address dataframe: the search strings, so that
+    addresses which collapse to the same search land in the same shard.
+    """
+    if 'SearchString' in df.columns:
+        return df['SearchString']
+    return address_search_strings(df)
+
+
+def ain_keys(df: pd.DataFrame) -> pd.Series:
+    """ the shard keys of an AIN dataframe """
+    return df['AIN'].astype(str)
+
+
+def shard_dataframe(df: pd.DataFrame,
+                    shard: int,
+                    shards: int,
+                    key: Callable[[pd.DataFrame], pd.Series]) -> pd.DataFrame:
+    """
+    The rows of df in shard (of shards) by the stable hash of their keys.
+    Index labels are kept so shards can be merged back in order.
+    """
+    hashes = key(df).map(stable_hash).to_numpy(dtype='int64')
+    return df[(hashes % shards) == shard].copy()
+
+
+def _modified(filename: str) -> float:
+    """ when a pickle or its journal (see scraper.AINData) last changed """
+    journal = filename + '.journal'
+    if os.path.isfile(journal):
+        return max(os.path.getmtime(filename), os.path.getmtime(journal))
+    return os.path.getmtime(filename)
+
+
+def make_shard_file(filename: str,
+                    shard: int,
+                    shards: int,
+                    key: Callable[[pd.DataFrame], pd.Series],
+                    ain_type: str = 'results') -> str:
+    """
+    Writes one input shard of a pickled dataframe next to it and returns its
+    name.  Every worker can build its own shard from a copy of the full
+    file.  An existing shard is only rebuilt when filename has changed since
+    it was made, and then the rows already 'Searched' or 'Scraped' in it,
+    matched by key, keep their flags.  ain_type is the kind of file, as for
+    scraper.AINData.
+    """
+    fn = shard_name(filename, shard, shards, INPUT)
+    if os.path.isfile(fn) and os.path.getmtime(fn) >= _modified(filename):
+        return fn
+    full = ProgressJournal(filename + '.journal').replay(
+        pd.read_pickle(filename))
+    df = shard_dataframe(full, shard, shards, key)
+    if not os.path.isfile(fn):
+        df.to_pickle(fn)
+        return fn
+    print('{:s} has changed, rebuilding {:s}'.format(filename, fn))
+    with AINData(fn, ain_type) as old:  # replays any unfinished journal
+        keys = key(df)
+        for flag in FLAGS:
+            if flag in old.df.columns:
+                if flag not in df.columns:
+                    df[flag] = False
+                done = key(old.df)[old.flags(flag)]
+                df.loc[keys.isin(done).to_numpy(), flag] = True
+        old.df = df  # written over the old shard on exit
+    return fn
+
+
+def run_search_shard(address_file: str,
+                     ain_file: str,
+                     shard: int,
+                     shards: int,
+                     chunk_size: int = 100,
+                     chunks: Union[int, None] = None,
+                     base_sleep: float = 1.0) -> None:
+    """
+    Searches for AINs for one shard of the address book.  Workers in other
+    processes or on other hosts handle the other shards; each writes only its
+    own shard files, so they never contend.  Combine the results with
+    merge_shards('search', ...).
+
+    Parameters
+    ----------
+    address_file : str
+        The full address dataframe pickle.
+    ain_file : str
+        The name of the merged AIN file.  This shard's results go to
+        shard_name(ain_file, shard, shards) and its addresses are read from
+        shard_name(address_file, shard, shards, INPUT).
+    shard : int
+        This worker's shard, 0 <= shard < shards.
+    shards : int
+        The total number of shards.
+    chunk_size : int
+        How many addresses to search between saves.
+    chunks : int
+        How many times to run chunk_size searches and then save.
+    base_sleep : float
+        How long to sleep after an API call.
+
+    Returns
+    -------
+    Nothing.
+    """
+    scrape_ains_for_file(make_shard_file(address_file, shard, shards,
+                                         address_keys, 'address'),
+                         shard_name(ain_file, shard, shards),
+                         chunk_size=chunk_size,
+                         chunks=chunks,
+                         base_sleep=base_sleep)
+
+
+def run_details_shard(ain_file: str,
+                      shard: int,
+                      shards: int,
+                      location: Union[str, None] = None,
+                      chunk_size: int = 100,
+                      chunks: Union[int, None] = None,
+                      infos: List[str] = list(TYPES.keys()),
+                      base_sleep: float = 1.0) -> None:
+    """
+    Scrapes the details of one shard of the merged AIN file into this
+    shard's own RecordStore.  Combine the stores, and the 'Scraped' flags,
+    with merge_shards('details', ...).
+
+    Parameters
+    ----------
+    ain_file : str
+        The merged AIN dataframe pickle from merge_ain_files.  This shard's
+        AINs are read from shard_name(ain_file, shard, shards, INPUT).
+    shard : int
+        This worker's shard, 0 <= shard < shards.
+    shards : int
+        The total number of shards.
+    location : str
+        The merged store.  This shard's records go to
+        shard_name(location, shard, shards).
+    chunk_size : int
+        How many AINs to scrape between saves.
+    chunks : int
+        How many times to run chunk_size scrapes and then save.
+    infos : List[str]
+        The list of keys in TYPES variable to fetch from the server.
+    base_sleep : float
+        How long to sleep after an API call.
+
+    Returns
+    -------
+    Nothing.
+    """
+    if location is None:
+        location = STORE_LOC
+    with RecordStore(shard_name(location, shard, shards)) as store:
+        scrape_chunks_for_ains(make_shard_file(ain_file, shard, shards,
+                                               ain_keys),
+                               chunk_size=chunk_size,
+                               chunks=chunks,
+                               infos=infos,
+                               base_sleep=base_sleep,
+                               store=store)
+
+
+def shard_files(filename: str, part: str = OUTPUT) -> List[str]:
+    """ every shard of filename on disk, in shard order """
+    root, ext = os.path.splitext(filename)
+    return sorted(glob.glob(glob.escape(root) + '.' + part + '-*-of-*' + ext))
+
+
+def merge_ain_files(ain_file: str,
+                    files: Union[List[str], None] = None) -> pd.DataFrame:
+    """
+    Deterministically combines the search stage's shard AIN files with the
+    AINs already in ain_file.  AINs are deduplicated (a row that has been
+    'Scraped' wins over one that has not) and sorted, so the result doesn't
+    depend on the order the shards finished in.
+
+    Parameters
+    ----------
+    ain_file : str
+        Where to write the merged AIN dataframe.
+    files : List[str]
+        The shard files.  All output shards of ain_file on disk if not
+        given.
+
+    Returns
+    -------
+    pandas dataframe
+    """
+    if files is None:
+        files = shard_files(ain_file)
+    with AINData(ain_file) as merged:
+        dfs = [merged.df]
+        for fn in files:
+            with AINData(fn) as ain:  # replays any unfinished journal
+                dfs.append(ain.df)
+        df = pd.concat(dfs, ignore_index=True)
+        if 'Scraped' in df.columns:
+            df['Scraped'] = df['Scraped'].fillna(False).astype(bool)
+            df = df.sort_values(['AIN', 'Scraped'], ascending=[True, False],
+                                kind='mergesort')
+        else:
+            df = df.sort_values('AIN', kind='mergesort')
+        # written on exit, which also drops the old file's journal
+        merged.df = df.drop_duplicates('AIN').reset_index(drop=True)
+    print('Merged {:d} shards into {:d} AINs'.format(len(files),
+                                                      merged.df.shape[0]))
+    return merged.df
+
+
+def merge_flags(filename: str,
+                flag: str,
+                key: Callable[[pd.DataFrame], pd.Series],
+                files: List[str],
+                ain_type: str = 'results') -> pd.DataFrame:
+    """
+    Copies flag (e.g. 'Searched') back from input shards into the full
+    file they were made from, matching rows by key.  ain_type is the kind
+    of file, as for scraper.AINData.
+    """
+    if not os.path.isfile(filename):
+        raise FileNotFoundError(filename)
+    with AINData(filename, ain_type) as full:
+        if flag not in full.df.columns:
+            full.df[flag] = False
+        keys = key(full.df)
+        for fn in files:
+            with AINData(fn, ain_type) as part:
+                if flag in part.df.columns:
+                    done = key(part.df)[part.flags(flag)]
+                    full.df.loc[keys.isin(done).to_numpy(), flag] = True
+        return full.df
+
+
+def merge_address_files(address_file: str,
+                        files: Union[List[str], None] = None) -> pd.DataFrame:
+    """
+    Copies the 'Searched' flags of the address shards back into the full
+    address file.
+    """
+    if files is None:
+        files = shard_files(address_file, INPUT)
+    return merge_flags(address_file, 'Searched', address_keys, files,
+                       'address')
+
+
+def merge_record_stores(location: str,
+                        locations: Union[List[str], None] = None) -> int:
+    """
+    Deterministically combines shard record stores, or directories of json
+    files, into the store at location.  Records are appended in AIN order;
+    an AIN found in several shards is taken from the first shard in
+    locations.  Records the store already holds unchanged are skipped, so
+    merging again after more shards have finished only appends what is
+    new.
+
+    Parameters
+    ----------
+    location : str
+        The merged RecordStore.
+    locations : List[str]
+        The shard stores.  All shards of location on disk if not given.
+
+    Returns
+    -------
+    int, the number of records in the merged store.
+    """
+    if locations is None:
+        locations = shard_files(location)
+    sources = {}
+    for loc in locations:
+        if is_store(loc):
+            with RecordStore(loc) as part:
+                ains = part.ains()
+        else:
+            ains = [fn[:-len('.json')] for fn in os.listdir(loc)
+                    if fn.endswith('.json')]
+        for ain in ains:
+            sources.setdefault(ain, loc)
+    opened = {}
+    added = 0
+    try:
+        with RecordStore(location) as store:
+            for ain in sorted(sources):
+                loc = sources[ain]
+                if is_store(loc):
+                    if loc not in opened:
+                        opened[loc] = RecordStore(loc)
+                    record = opened[loc].get(ain)
+                else:
+                    with open(os.sep.join([loc, ain + '.json'])) as f:
+                        record = json.load(f)
+                if ain in store and store.get(ain) == record:
+                    continue  # merged before
+                store.append(ain, record)
+                added += 1
+            count = len(store)
+    finally:
+        for part in opened.values():
+            part.close()
+    print('Merged {:d} shards into {:d} records ({:d} new or '
+          'changed)'.format(len(locations), count, added))
+    return count
+
+
+def merge_shards(stage: str,
+                 address_file: str,
+                 ain_file: str,
+                 location: Union[str, None] = None) -> None:
+    """
+    Combines what the workers of a stage wrote.  After 'search' the shard
+    AIN files are merged into ain_file and the 'Searched' flags go back into
+    address_file.  After 'details' the shard record stores are merged into
+    the store at location and the 'Scraped' flags go back into ain_file.
+
+    Parameters
+    ----------
+    stage : str
+        'search' or 'details'.
+    address_file : str
+        The full address dataframe pickle.
+    ain_file : str
+        The merged AIN dataframe pickle.
+    location : str
+        The merged record store.  STORE_LOC if None.
+    """
+    if stage == 'search':
+        merge_ain_files(ain_file)
+        merge_address_files(address_file)
+    elif stage == 'details':
+        if location is None:
+            location = STORE_LOC
+        merge_record_stores(location)
+        merge_flags(ain_file, 'Scraped', ain_keys,
+                    shard_files(ain_file, INPUT))
+    else:
+        raise ValueError('Unknown stage {:s}'.format(stage))
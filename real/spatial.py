@@ -0,0 +1,260 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from typing import List, Tuple, Union
+
+from ..resources.defaults import (SPATIAL_FILE, SPATIAL_CELL_METRES,
+                                  SPATIAL_COLUMNS)
+
+EARTH_RADIUS = 6371008.8  # metres, the mean radius
+
+
+def haversine(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """ great circle distances in metres between points in degrees """
+    lon1, lat1, lon2, lat2 = (np.radians(v) for v in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """
+    The sales in the housing dataframe bucketed by location on a uniform
+    grid, for finding sales within a distance of a point or the nearest
+    ones (comparables) without measuring the distance to every sale.
+
+    Longitudes and latitudes are projected to metres east and north of the
+    south west corner of the data.  Sales are sorted by grid cell, column
+    by column, so the cells of one grid column that a query touches are a
+    single slice of the sorted sales, found with a binary search.
+    Distances are then measured exactly, along the earth's surface.
+    """
+    def __init__(self, df: pd.DataFrame,
+                 cell: float = SPATIAL_CELL_METRES,
+                 columns: List[str] = SPATIAL_COLUMNS):
+        """
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Dataframe of housing information produced by json_reader, or
+            the Longitude, Latitude and columns of it.  Sales without a
+            location are left out.
+        cell : float
+            Width of a grid cell in metres.
+        columns : List[str]
+            Columns of df kept to be returned by queries.
+        """
+        lon = pd.to_numeric(df['Longitude'], errors='coerce')\
+            .to_numpy(dtype='float64', na_value=np.nan)
+        lat = pd.to_numeric(df['Latitude'], errors='coerce')\
+            .to_numpy(dtype='float64', na_value=np.nan)
+        located = np.isfinite(lon) & np.isfinite(lat) & \
+            (lon != 0) & (lat != 0)
+        self.cell = cell
+        self.sales = df.loc[located, [c for c in columns if c in df.columns]]\
+            .reset_index(drop=True)
+        self.sales['Longitude'] = lon[located]
+        self.sales['Latitude'] = lat[located]
+        self._dates = pd.to_datetime(self.sales['RecordingDate'])\
+            .to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        self._beds = pd.to_numeric(self.sales['NumOfBeds'], errors='coerce')\
+            .to_numpy(dtype='float64', na_value=np.nan)
+        self._lon = lon[located]
+        self._lat = lat[located]
+        if self._lon.shape[0] == 0:
+            self._lon0 = self._lat0 = 0.0
+            self._scale = 1.0
+        else:
+            self._lon0 = self._lon.min()
+            self._lat0 = self._lat.min()
+            # the scale at the northern edge, which is the smallest, so
+            # projected distances never exceed true ones
+            self._scale = np.cos(np.radians(self._lat.max()))
+        x, y = self._project(self._lon, self._lat)
+        cx = np.floor(x / cell).astype(np.int64)
+        cy = np.floor(y / cell).astype(np.int64)
+        self._nx = int(cx.max()) + 1 if cx.shape[0] else 0
+        self._ny = int(cy.max()) + 1 if cy.shape[0] else 0
+        keys = cx * self._ny + cy
+        self._order = np.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+
+    def __len__(self) -> int:
+        return self.sales.shape[0]
+
+    def _project(self, lon, lat) -> Tuple[np.ndarray, np.ndarray]:
+        """ metres east and north of the south west corner """
+        metres = np.radians(1.0) * EARTH_RADIUS  # per degree
+        return ((np.asarray(lon) - self._lon0) * self._scale * metres,
+                (np.asarray(lat) - self._lat0) * metres)
+
+    def _candidates(self, lon: float, lat: float,
+                    radius: float) -> np.ndarray:
+        """ positions of the sales in the grid cells around a circle """
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64)
+        x, y = self._project(lon, lat)
+        reach = radius * 1.01 + 1  # the projection isn't exact
+        x0 = max(int(np.floor((x - reach) / self.cell)), 0)
+        x1 = min(int(np.floor((x + reach) / self.cell)), self._nx - 1)
+        y0 = max(int(np.floor((y - reach) / self.cell)), 0)
+        y1 = min(int(np.floor((y + reach) / self.cell)), self._ny - 1)
+        if x0 > x1 or y0 > y1:
+            return np.zeros(0, dtype=np.int64)
+        columns = np.arange(x0, x1 + 1) * self._ny
+        starts = np.searchsorted(self._keys, columns + y0, 'left')
+        ends = np.searchsorted(self._keys, columns + y1, 'right')
+        return np.concatenate([self._order[s:e]
+                               for s, e in zip(starts, ends)])
+
+    def _filter(self, positions: np.ndarray,
+                beds: Union[int, List[int], None],
+                since, until) -> np.ndarray:
+        keep = np.ones(positions.shape[0], dtype=bool)
+        if beds is not None:
+            keep &= np.isin(self._beds[positions], np.atleast_1d(beds))
+        if since is not None:
+            keep &= self._dates[positions] >= pd.Timestamp(since).value
+        if until is not None:
+            keep &= (self._dates[positions] <= pd.Timestamp(until).value) & \
+                (self._dates[positions] != np.iinfo(np.int64).min)  # NaT
+        return positions[keep]
+
+    def _result(self, positions: np.ndarray,
+                distances: np.ndarray) -> pd.DataFrame:
+        order = np.argsort(distances, kind='stable')
+        out = self.sales.iloc[positions[order]].copy()
+        out['Distance'] = distances[order]
+        return out
+
+    def within(self, lon: float, lat: float, radius: float,
+               beds: Union[int, List[int], None] = None,
+               since=None, until=None) -> pd.DataFrame:
+        """
+        The sales within radius metres of a point.
+
+        Parameters
+        ----------
+        lon, lat : float
+            The point, in degrees.
+        radius : float
+            In metres.
+        beds : int or List[int]
+            Only sales with these numbers of bedrooms.
+        since, until : str or timestamp
+            Only sales recorded from / until these dates, inclusive.
+
+        Returns
+        -------
+        pandas dataframe of the sales with their Distance in metres,
+        nearest first
+        """
+        positions = self._filter(self._candidates(lon, lat, radius),
+                                 beds, since, until)
+        distances = haversine(lon, lat, self._lon[positions],
+                              self._lat[positions])
+        close = distances <= radius
+        return self._result(positions[close], distances[close])
+
+    def nearest(self, lon: float, lat: float, k: int,
+                beds: Union[int, List[int], None] = None,
+                since=None, until=None) -> pd.DataFrame:
+        """
+        The k sales nearest a point, searching rings of cells outward
+        until k are found.  Arguments are as for within.
+
+        Returns
+        -------
+        pandas dataframe of at most k sales with their Distance in metres,
+        nearest first
+        """
+        if len(self) == 0:
+            return self._result(np.zeros(0, dtype=np.int64), np.zeros(0))
+        x, y = self._project(lon, lat)
+        # a radius from the point that covers every cell
+        width, height = self._nx * self.cell, self._ny * self.cell
+        everything = np.hypot(max(abs(x), abs(width - x)),
+                              max(abs(y), abs(height - y))) * 1.01 + 1
+        radius = self.cell
+        while True:
+            found = self.within(lon, lat, radius, beds, since, until)
+            if found.shape[0] >= k or radius >= everything:
+                return found.head(k)
+            radius *= 2
+
+    def _ain_key(self, ain):
+        """ ain as the type of the AIN column, e.g. '4262001001' -> int """
+        if pd.api.types.is_integer_dtype(self.sales['AIN'].dtype):
+            return int(ain)
+        return str(ain)
+
+    def location(self, ain) -> Tuple[float, float]:
+        """ the longitude and latitude of an AIN """
+        match = np.flatnonzero(self.sales['AIN'].to_numpy()
+                               == self._ain_key(ain))
+        if match.shape[0] == 0:
+            raise KeyError('No located sales of AIN {}'.format(ain))
+        return float(self._lon[match[0]]), float(self._lat[match[0]])
+
+    def comparables(self, ain, radius: Union[float, None] = None,
+                    k: Union[int, None] = None,
+                    beds: Union[int, List[int], None] = None,
+                    since=None, until=None) -> pd.DataFrame:
+        """
+        Sales of other parcels near an AIN: those within radius metres, or
+        the k nearest (the k nearest within radius if both are given).
+        Other arguments are as for within.
+        """
+        if radius is None and k is None:
+            raise ValueError('Give a radius, a number of sales or both')
+        lon, lat = self.location(ain)
+        ain = self._ain_key(ain)
+        if k is None:
+            found = self.within(lon, lat, radius, beds, since, until)
+        else:
+            found = pd.DataFrame()
+            n = k
+            # the AIN's own sales are dropped, so ask for enough more
+            while found.shape[0] < k:
+                everything = self.nearest(lon, lat, n, beds, since, until)
+                if radius is not None:
+                    everything = everything[everything['Distance'] <= radius]
+                found = everything[everything['AIN'] != ain]
+                if everything.shape[0] < n:
+                    break  # there are no more
+                n *= 2
+            return found.head(k)
+        return found[found['AIN'] != ain]
+
+    def save(self, filename: str = SPATIAL_FILE) -> None:
+        tmp = filename + '.tmp'
+        pd.to_pickle(self, tmp)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename: str = SPATIAL_FILE) -> 'SpatialIndex':
+        return pd.read_pickle(filename)
+
+
+_spatial: Union[SpatialIndex, None] = None
+
+
+def get_spatial_index(filename: str = SPATIAL_FILE) -> SpatialIndex:
+    """
+    The spatial index saved by build-dataset, loaded the first time it's
+    asked for.  If it hasn't been saved it's built from the partitioned
+    dataset (see dataset.load) and saved.
+    """
+    global _spatial
+    if _spatial is None:
+        if os.path.isfile(filename):
+            _spatial = SpatialIndex.load(filename)
+        else:
+            from .dataset import load
+            _spatial = SpatialIndex(load(
+                columns=['Longitude', 'Latitude'] + SPATIAL_COLUMNS))
+            _spatial.save(filename)
+    return _spatial
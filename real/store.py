@@ -0,0 +1,218 @@
+import os
+import gzip
+import json
+import sqlite3
+
+from typing import Dict, Generator, List, Tuple, Union
+
+from ..resources.defaults import STORE_LOC, STORE_SHARD_BYTES
+
+INDEX_NAME = 'index.sqlite'
+
+
+def shard_name(shard: int) -> str:
+    return 'records-{:05d}.jsonl.gz'.format(shard)
+
+
+def is_store(location: str) -> bool:
+    """ True if location holds a RecordStore """
+    return os.path.isfile(os.sep.join([location, INDEX_NAME]))
+
+
+class RecordStore:
+    """
+    An append-only store of scraped records, one per AIN.
+
+    Records are appended to gzip-compressed JSON Lines shards, each record
+    as its own gzip member, so a shard is still a valid .jsonl.gz file that
+    can be streamed with gzip.open.  An SQLite index maps each AIN to the
+    shard, offset and length of its latest record for random access.
+
+    A record is written and fsynced to its shard before the index is
+    committed, so a crash leaves at most an unindexed tail on the last shard,
+    which is truncated the next time the store is opened.
+    """
+    def __init__(self,
+                 location: str = STORE_LOC,
+                 shard_bytes: int = STORE_SHARD_BYTES):
+        """
+
+        Parameters
+        ----------
+        location : str
+            Directory holding the shards and index.  Created if missing.
+        shard_bytes : int
+            Start a new shard once the current one is this large.
+        """
+        self.location = location
+        self.shard_bytes = shard_bytes
+        os.makedirs(location, exist_ok=True)
+        self._conn = sqlite3.connect(os.sep.join([location, INDEX_NAME]))
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS records ('
+            'ain TEXT PRIMARY KEY, shard INTEGER, offset INTEGER, '
+            'length INTEGER)')
+        self._conn.commit()
+        self.shard, end = self._conn.execute(
+            'SELECT COALESCE(MAX(shard), 0), '
+            'COALESCE(MAX(offset + length), 0) FROM records '
+            'WHERE shard = (SELECT MAX(shard) FROM records)').fetchone()
+        self._recover(end)
+
+    def _path(self, shard: int) -> str:
+        return os.sep.join([self.location, shard_name(shard)])
+
+    def _recover(self, end: int) -> None:
+        """ drops anything written to the last shard after its last index """
+        path = self._path(self.shard)
+        if os.path.isfile(path) and os.path.getsize(path) > end:
+            print('Truncating unindexed tail of {:s}'.format(path))
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        # a crash right after rolling over leaves a shard with no index
+        path = self._path(self.shard + 1)
+        if os.path.isfile(path):
+            print('Removing unindexed shard {:s}'.format(path))
+            os.remove(path)
+
+    def append(self, ain: Union[int, str], data: dict) -> None:
+        """
+        Appends the record for ain, replacing any earlier record for it.
+
+        Parameters
+        ----------
+        ain : int or str
+            The Assessor's ID Number (AIN) the data belongs to.
+        data : dict
+            The data to save.
+        """
+        member = gzip.compress(json.dumps(data).encode() + b'\n')
+        path = self._path(self.shard)
+        if os.path.isfile(path) and \
+                os.path.getsize(path) + len(member) > self.shard_bytes:
+            self.shard += 1
+            path = self._path(self.shard)
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+        self._conn.execute(
+            'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)',
+            (str(ain), self.shard, offset, len(member)))
+        self._conn.commit()
+
+    def get(self, ain: Union[int, str]) -> Union[dict, None]:
+        """ returns the latest record for ain, None if there isn't one """
+        member = self.get_raw(ain)
+        if member is None:
+            return None
+        return json.loads(gzip.decompress(member))
+
+    def get_raw(self, ain: Union[int, str]) -> Union[bytes, None]:
+        """ the gzip member holding the latest record for ain """
+        row = self._conn.execute(
+            'SELECT shard, offset, length FROM records WHERE ain = ?',
+            (str(ain),)).fetchone()
+        if row is None:
+            return None
+        with open(self._path(row[0]), 'rb') as f:
+            f.seek(row[1])
+            return f.read(row[2])
+
+    def stamps(self) -> Dict[str, str]:
+        """
+        A stamp for every AIN that changes whenever its record is replaced:
+        the shard, offset and length of the record.
+        """
+        return {ain: '{:d}:{:d}:{:d}'.format(shard, offset, length)
+                for ain, shard, offset, length in self._conn.execute(
+                    'SELECT ain, shard, offset, length FROM records')}
+
+    def __contains__(self, ain: Union[int, str]) -> bool:
+        return self._conn.execute('SELECT 1 FROM records WHERE ain = ?',
+                                  (str(ain),)).fetchone() is not None
+
+    def ains(self) -> List[str]:
+        """ every AIN in the store """
+        return [ain for ain, in self._conn.execute('SELECT ain FROM records')]
+
+    def __len__(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def __iter__(self) -> Generator[Tuple[str, dict], None, None]:
+        """
+        Streams (ain, record) tuples for the latest record of every AIN, in
+        the order they sit on disk.
+        """
+        for ain, member in self.iter_raw():
+            yield ain, json.loads(gzip.decompress(member))
+
+    def iter_raw(self) -> Generator[Tuple[str, bytes], None, None]:
+        """
+        Streams (ain, gzip member) tuples like __iter__ but without
+        decompressing or decoding, so that work can be farmed out.
+        """
+        rows = self._conn.execute(
+            'SELECT ain, shard, offset, length FROM records '
+            'ORDER BY shard, offset').fetchall()
+        f = None
+        shard = None
+        try:
+            for ain, row_shard, offset, length in rows:
+                if row_shard != shard:
+                    if f is not None:
+                        f.close()
+                    shard = row_shard
+                    f = open(self._path(shard), 'rb')
+                f.seek(offset)
+                yield ain, f.read(length)
+        finally:
+            if f is not None:
+                f.close()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, etraceback):
+        self.close()
+
+
+def migrate_json_directory(json_loc: str,
+                           store: RecordStore,
+                           remove: bool = False) -> int:
+    """
+    Copies a directory of one-json-file-per-AIN records, as written by
+    scraper.save_json, into a RecordStore.  AINs already in the store are
+    skipped so the migration can be re-run after an interruption.
+
+    Parameters
+    ----------
+    json_loc : str
+        The directory of .json files.
+    store : RecordStore
+        The store to copy into.
+    remove : bool
+        Delete each .json file once it is safely in the store.
+
+    Returns
+    -------
+    int, the number of records copied.
+    """
+    count = 0
+    for file_name in sorted(os.listdir(json_loc)):
+        if not file_name.endswith('.json'):
+            continue
+        ain = file_name[:-len('.json')]
+        fn = os.sep.join([json_loc, file_name])
+        if ain not in store:
+            with open(fn) as f:
+                store.append(ain, json.load(f))
+            count += 1
+        if remove:
+            os.remove(fn)
+    print('Migrated {:d} json files into {:s}'.format(count, store.location))
+    return count
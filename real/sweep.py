@@ -0,0 +1,237 @@
+import pandas as pd
+
+from typing import Union
+
+from ..resources.defaults import (COLUMNS, SWEEP_PAGE_PARAM, SWEEP_MAX_PAGES,
+                                  SEARCH_URL)
+from .client import get_client, AssessorError, CircuitOpenError
+from .coverage import CoverageIndex
+from .scraper import (AINData,
+                      add_matching_parcels,
+                      build_coverage,
+                      canonical_columns,
+                      pause,
+                      scrape_ains
+                      )
+
+STREET_COLUMNS = ['STR_NM', 'STR_SFX_CD', 'ZIP_CD']
+
+
+def make_street_search_string(street: str, suffix: str, zipcode: str,
+                              page: int = 1) -> str:
+    """
+    A street-level search, e.g. MAIN ST 90025, for one page of results.
+
+    Parameters
+    ----------
+    street : str
+        The street name, STR_NM in the address book.
+    suffix : str
+        The street suffix, STR_SFX_CD in the address book.  May be empty.
+    zipcode : str
+        The zip code.
+    page : int
+        The page of results to ask for.
+
+    Returns
+    -------
+    str
+    """
+    terms = [t for t in [street, suffix, zipcode] if t]
+    url = SEARCH_URL + '%20'.join(terms)
+    if page > 1:
+        url += '&{:s}={:d}'.format(SWEEP_PAGE_PARAM, page)
+    return url
+
+
+def sweep_street(new_rows: dict,
+                 coverage: CoverageIndex,
+                 street: str, suffix: str, zipcode: str,
+                 base_sleep: float = 1.0) -> int:
+    """
+    Searches a whole street, paging through the results until a page comes
+    back empty or adds no parcels we haven't seen (which is also what
+    happens if the API ignores the page parameter).
+
+    Parameters
+    ----------
+    new_rows : dict
+        Dictionary to append the new ains to
+    coverage : CoverageIndex
+        Records the queries and the parcels found.
+    street, suffix, zipcode : str
+        The street to search.
+    base_sleep : float
+        How long to sleep after an API call that wasn't cached.
+
+    Returns
+    -------
+    int, the number of requests made to the server (pages served from the
+    response cache aren't counted)
+    """
+    requests_made = 0
+    for page in range(1, SWEEP_MAX_PAGES + 1):
+        query = make_street_search_string(street, suffix, zipcode, page)
+        result = get_client().get_json(query)
+        if not get_client().last_cached:
+            requests_made += 1
+        known = len(coverage.situs)
+        coverage.add_query(query)
+        coverage.add_result(result)
+        add_matching_parcels(new_rows, result)
+        pause(base_sleep)
+        if not result.get('Parcels') or len(coverage.situs) == known:
+            break
+    return requests_made
+
+
+def sweep_ains_for_file(address_file: str,
+                        results_file: str,
+                        fallback: bool = True,
+                        chunk_size: int = 100,
+                        chunks: Union[int, None] = None,
+                        base_sleep: float = 1.0) -> dict:
+    """
+    Street-sweep discovery of AINs, an alternative to
+    scraper.scrape_ains_for_file.  The address book is grouped by street and
+    zip code and each street is searched as a whole; address book rows whose
+    parcels turn up are marked 'Searched', and every row of a street whose
+    sweep finished is marked 'Swept' so it isn't swept again by a later run.
+    The remaining gaps are then searched one address at a time, as before.
+    If the server's circuit opens the run stops, keeping what was found.
+
+    Parameters
+    ----------
+    address_file : str
+        File to open and scrape with.  Pandas data pickle file.
+    results_file : str
+        File to add discovered AINs to.  Pandas data pickle file.
+    fallback : bool
+        Search the addresses the sweep didn't cover one by one.
+    chunk_size : int
+        How many per-address searches to run between saves.
+    chunks : int
+        How many times to run chunk_size per-address searches and then
+        save.  Until every address is searched if None.  The sweeps
+        themselves save after each street.
+    base_sleep : float
+        How long to sleep after an API call.  Prevents hammering the server.
+        Time between calls is (random.random() + 1) * base_sleep, and there
+        is no sleep after a cached response.
+
+    Returns
+    -------
+    dict of coverage statistics for this run, which is also printed.
+    """
+    stats = {'addresses': 0, 'swept_streets': 0, 'swept_before': 0,
+             'sweep_requests': 0, 'covered_by_sweep': 0,
+             'fallback_requests': 0, 'uncovered': 0, 'ains': 0}
+    circuit_open = False
+    with AINData(address_file, 'address') as add, \
+            AINData(results_file, 'results') as res:
+        for flag in ['Searched', 'Swept']:
+            if flag not in add.df.columns:
+                add.df[flag] = False
+        coverage = build_coverage(add.df, res.df)
+        stats['addresses'] = add.df.shape[0]
+        _, keys = canonical_columns(add.df)
+        groups = add.df.groupby(STREET_COLUMNS, dropna=False, sort=True)
+        for (street, suffix, zipcode), group in groups:
+            done = group[['Searched', 'Swept']].fillna(False).astype(bool)
+            if done['Swept'].all() or done['Searched'].all():
+                stats['swept_before'] += 1
+                continue  # swept in an earlier run
+            searched = add.flags('Searched')
+            swept = add.flags('Swept')
+            found = res.df.shape[0]
+            new_rows = {c: [] for c in COLUMNS}
+            terms = ['' if pd.isnull(t) else str(t)
+                     for t in [street, suffix, zipcode]]
+            print('Sweeping {:s}'.format(' '.join(t for t in terms if t)))
+            try:
+                stats['sweep_requests'] += sweep_street(
+                    new_rows, coverage, *terms, base_sleep=base_sleep)
+            except CircuitOpenError as e:
+                print(e)  # the server is down, stop and keep what we have
+                circuit_open = True
+            except AssessorError as e:
+                print(e)  # the fallback will pick these addresses up
+                continue
+            if not circuit_open:
+                stats['swept_streets'] += 1
+                add.df.loc[group.index, 'Swept'] = True
+            covered = group.index[keys[group.index].isin(coverage.situs)]
+            add.df.loc[covered, 'Searched'] = True
+            res.df = pd.concat([res.df, pd.DataFrame(new_rows)])\
+                .drop_duplicates('AIN').reset_index(drop=True)
+            res.checkpoint(n_rows=found)
+            add.checkpoint('Searched', searched)
+            add.checkpoint('Swept', swept)
+            if circuit_open:
+                break
+        stats['covered_by_sweep'] = int(keys.isin(coverage.situs).sum())
+
+        if fallback and not circuit_open:
+            queries = len(coverage.queries)
+            failed: set = set()
+            if chunks is None:
+                chunks = 999999999999999999
+            chunk = 0
+            while chunk < chunks:
+                searched = add.flags('Searched')
+                found = res.df.shape[0]
+                n_failed = len(failed)
+                keep_scraping, add.df, res.df = scrape_ains(
+                    address_df=add.df, results_df=res.df, number=chunk_size,
+                    base_sleep=base_sleep, coverage=coverage, failed=failed)
+                res.checkpoint(n_rows=found)
+                add.checkpoint('Searched', searched)
+                chunk += 1
+                if not keep_scraping and len(failed) == n_failed:
+                    break  # all done, or the circuit opened
+            stats['fallback_requests'] = len(coverage.queries) - queries
+        stats['uncovered'] = int((~keys.isin(coverage.situs)).sum())
+        stats['ains'] = res.df.shape[0]
+    print(sweep_report(stats))
+    return stats
+
+
+def sweep_report(stats: dict) -> str:
+    """ a printable summary of the statistics from sweep_ains_for_file """
+    n = max(stats['addresses'], 1)
+    return '\n'.join([
+        'Address book rows:        {:d}'.format(stats['addresses']),
+        'Streets swept:            {:d} ({:d} requests, {:d} swept '
+        'before)'.format(stats['swept_streets'], stats['sweep_requests'],
+                         stats['swept_before']),
+        'Covered by the sweep:     {:d} ({:3.1f}%)'.format(
+            stats['covered_by_sweep'], 100 * stats['covered_by_sweep'] / n),
+        'Per-address searches:     {:d}'.format(stats['fallback_requests']),
+        'Never matched a parcel:   {:d} ({:3.1f}%)'.format(
+            stats['uncovered'], 100 * stats['uncovered'] / n),
+        'AINs found:               {:d}'.format(stats['ains'])])
+
+
+def compare_ains(sweep_df: pd.DataFrame,
+                 exhaustive_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The AINs an exhaustive, per-address run found that a sweep did not.
+    An empty result confirms the sweep lost nothing.
+
+    Parameters
+    ----------
+    sweep_df : pd.DataFrame
+        AIN dataframe from sweep_ains_for_file.
+    exhaustive_df : pd.DataFrame
+        AIN dataframe from scraper.scrape_ains_for_file on the same
+        addresses.
+
+    Returns
+    -------
+    pandas dataframe of the missing rows of exhaustive_df
+    """
+    missing = ~exhaustive_df['AIN'].astype(str).isin(
+        sweep_df['AIN'].astype(str))
+    print('Sweep missed {:d} of {:d} AINs'.format(int(missing.sum()),
+                                                   exhaustive_df.shape[0]))
+    return exhaustive_df[missing]
@@ -0,0 +1,230 @@
+import time
+import sqlite3
+
+import pandas as pd
+
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+from ..resources.defaults import (QUEUE_FILE, QUEUE_LEASE_SECONDS,
+                                  QUEUE_MAX_ATTEMPTS)
+from .region import get_region
+
+# work item kinds
+SEARCH = 'search'  # an address book row to search for AINs
+DETAILS = 'details'  # an AIN to scrape the details of
+
+
+class WorkQueue:
+    """
+    A persistent queue of scraping work backed by an SQLite file.
+
+    Items are leased rather than popped: a leased item that is neither
+    completed nor failed before its lease runs out (because the worker
+    crashed, say) goes back to the queue.  Items are handed out by priority
+    (lowest first) and, within a priority, never-attempted items come before
+    ones that have failed.  An item that fails, or whose lease runs out,
+    max_attempts times is moved to the dead-letter list, so an item that
+    crashes its worker isn't handed out forever.
+    """
+    def __init__(self,
+                 filename: str = QUEUE_FILE,
+                 lease_seconds: float = QUEUE_LEASE_SECONDS,
+                 max_attempts: int = QUEUE_MAX_ATTEMPTS):
+        """
+
+        Parameters
+        ----------
+        filename : str
+            The SQLite file holding the queue.  Created if missing.
+        lease_seconds : float
+            How long a worker has to finish a leased item.
+        max_attempts : int
+            Failures allowed before an item is dead-lettered.
+        """
+        self.filename = filename
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(filename)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'kind TEXT, key TEXT, priority INTEGER, state TEXT, '
+            'attempts INTEGER, lease_until REAL, last_error TEXT, '
+            'PRIMARY KEY (kind, key))')
+        # these make leasing an index walk instead of a table scan
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS items_next '
+            'ON items (kind, state, priority, attempts)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS items_leases '
+            'ON items (state, lease_until)')
+        self._conn.commit()
+
+    def add(self,
+            kind: str,
+            keys: Iterable[str],
+            priorities: Union[Iterable[int], None] = None,
+            done: Union[Iterable[bool], None] = None) -> None:
+        """
+        Adds items to the queue.  Items already in the queue are left as they
+        are.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of work, SEARCH or DETAILS.
+        keys : iterable of str
+            The keys identifying the items.
+        priorities : iterable of int
+            Lower numbers are handed out first.  All 0 if not given.
+        done : iterable of bool
+            Items that are already finished.
+        """
+        keys = [str(k) for k in keys]
+        priorities = [0] * len(keys) if priorities is None else priorities
+        done = [False] * len(keys) if done is None else done
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO items VALUES (?, ?, ?, ?, 0, NULL, NULL)',
+            [(kind, k, int(p), 'done' if d else 'pending')
+             for k, p, d in zip(keys, priorities, done)])
+        self._conn.commit()
+
+    def lease(self, kind: str, number: int = 1,
+              skip: Union[Set[str], None] = None) -> List[str]:
+        """
+        Leases up to number items of kind, reclaiming expired leases first.
+        Expired items that have used up their attempts are dead-lettered.
+        Keys in skip (those that already failed in this run, say) are left
+        in the queue.
+
+        Returns
+        -------
+        list of the leased keys
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET lease_until = NULL, "
+                "last_error = CASE WHEN attempts >= ? "
+                "THEN 'lease expired' ELSE last_error END, "
+                "state = CASE WHEN attempts >= ? THEN 'dead' "
+                "ELSE 'pending' END "
+                "WHERE state = 'leased' AND lease_until < ?",
+                (self.max_attempts, self.max_attempts, now))
+            skip = skip or set()
+            keys = [k for (k,) in self._conn.execute(
+                "SELECT key FROM items WHERE kind = ? AND state = 'pending' "
+                "ORDER BY priority, attempts LIMIT ?",
+                (kind, number + len(skip))) if k not in skip][:number]
+            self._conn.executemany(
+                "UPDATE items SET state = 'leased', lease_until = ?, "
+                "attempts = attempts + 1 WHERE kind = ? AND key = ?",
+                [(now + self.lease_seconds, kind, k) for k in keys])
+        return keys
+
+    def complete(self, kind: str, keys: Iterable[str]) -> None:
+        """ marks leased items as done """
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE items SET state = 'done', lease_until = NULL "
+                "WHERE kind = ? AND key = ?",
+                [(kind, str(k)) for k in keys])
+
+    def fail(self, kind: str, key: str, error: str = '') -> None:
+        """
+        Returns a leased item to the queue, or dead-letters it if it has used
+        up its attempts.
+        """
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET lease_until = NULL, last_error = ?, "
+                "state = CASE WHEN attempts >= ? THEN 'dead' "
+                "ELSE 'pending' END WHERE kind = ? AND key = ?",
+                (error, self.max_attempts, kind, str(key)))
+
+    def release(self, kind: str, keys: Iterable[str]) -> None:
+        """
+        Returns leased items to the queue without counting the attempt, for
+        work that was never tried (because the circuit opened, say).
+        """
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE items SET state = 'pending', lease_until = NULL, "
+                "attempts = MAX(attempts - 1, 0) "
+                "WHERE kind = ? AND key = ? AND state = 'leased'",
+                [(kind, str(k)) for k in keys])
+
+    def dead_letters(self, kind: str) -> List[Tuple[str, int, str]]:
+        """ (key, attempts, last error) of every dead-lettered item """
+        return self._conn.execute(
+            "SELECT key, attempts, last_error FROM items "
+            "WHERE kind = ? AND state = 'dead'", (kind,)).fetchall()
+
+    def retry_dead(self, kind: str) -> None:
+        """ puts every dead-lettered item back in the queue """
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET state = 'pending', attempts = 0 "
+                "WHERE kind = ? AND state = 'dead'", (kind,))
+
+    def counts(self, kind: str) -> Dict[str, int]:
+        """ the number of items of kind in each state """
+        return dict(self._conn.execute(
+            'SELECT state, COUNT(*) FROM items WHERE kind = ? '
+            'GROUP BY state', (kind,)).fetchall())
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, etraceback):
+        self.close()
+
+
+def queue_addresses(queue: WorkQueue,
+                    address_df: pd.DataFrame,
+                    zipcodes: Union[List[int], None] = None) -> None:
+    """
+    Adds every row of an address dataframe to the queue as SEARCH work,
+    keyed by index label.  Rows are prioritized by the position of their
+    zip code in zipcodes, and rows already 'Searched' are added as done.
+
+    Parameters
+    ----------
+    queue : WorkQueue
+        The queue to add to.
+    address_df : pd.DataFrame
+        Address dataframe, as used by scraper.scrape_ains.
+    zipcodes : List[int]
+        Zip codes in the order they should be searched.  Others go last.
+        The current region's if None (see region.get_region).
+    """
+    if zipcodes is None:
+        zipcodes = get_region().zips
+    order = {zc: i for i, zc in enumerate(zipcodes)}
+    priorities = address_df['ZIP_CD'].map(order).fillna(len(zipcodes))
+    if 'Searched' in address_df.columns:
+        done = address_df['Searched'].fillna(False).astype(bool)
+    else:
+        done = None
+    queue.add(SEARCH, address_df.index, priorities, done)
+
+
+def queue_ains(queue: WorkQueue, ain_df: pd.DataFrame) -> None:
+    """
+    Adds every AIN in an AIN dataframe to the queue as DETAILS work.  AINs
+    already 'Scraped' are added as done.
+
+    Parameters
+    ----------
+    queue : WorkQueue
+        The queue to add to.
+    ain_df : pd.DataFrame
+        AIN dataframe, as used by scraper.scrape_data_for_ains.
+    """
+    if 'Scraped' in ain_df.columns:
+        done = ain_df['Scraped'].fillna(False).astype(bool)
+    else:
+        done = None
+    queue.add(DETAILS, ain_df['AIN'], None, done)
@@ -1,7 +1,7 @@
 
 import os
 from datetime import datetime
-from numpy import nan
+from math import nan
 
 from typing import Union
 
@@ -13,12 +13,96 @@ ADDRESS_FILE = os.sep.join(ADDRESS_PARTS)
 
 DEFAULT_ZIPS = [90025, 90064, 90049]
 
+# the zip codes to scrape and plot, see real/region.py.  A region name (a
+# file in REGIONS_LOC) or the path of a region file; None is DEFAULT_ZIPS.
+REGION = None
+
 DEFAULT_LOC = os.sep.join(__file__.split(os.sep)[:-1])
+REGIONS_LOC = os.sep.join([DEFAULT_LOC, 'regions'])
+
+SEARCH_URL = 'https://portal.assessor.lacounty.gov/api/search?search='
+
+# street-sweep discovery, see real/sweep.py.  Pages are requested with
+# &page=N until one adds nothing new, so an API that ignores the parameter
+# costs one extra request per street.
+SWEEP_PAGE_PARAM = 'page'
+SWEEP_MAX_PAGES = 50
 
 TYPES = {'details': 'parceldetail',
          'ownership': 'parcel_ownershiphistory',
          'assessment': 'parcel_assessmenthistory'}
 
+# the async scraper keeps this many requests in flight at once
+ASYNC_CONCURRENCY = 8
+# requests per second allowed by the async scraper's token bucket.  The
+# synchronous scraper sleeps (random() + 1) * base_sleep between calls, which
+# averages 1.5 seconds for base_sleep = 1, so this matches that request rate.
+ASYNC_RATE = 1 / 1.5
+
+# settings for the pooled, self-throttling API client in real/client.py
+CLIENT_POOL_SIZE = 16  # connections kept open to the server
+CLIENT_TIMEOUT = 30.0  # seconds before a request is abandoned
+CLIENT_MAX_RETRIES = 5
+CLIENT_BACKOFF = 1.0  # seconds, doubled on each retry
+CLIENT_MAX_BACKOFF = 120.0
+CLIENT_TARGET_LATENCY = 2.0  # seconds, slower responses slow us down
+CLIENT_MAX_DELAY = 60.0  # longest adaptive delay between requests
+CLIENT_BREAKER_FAILURES = 10  # consecutive failures that open the circuit
+CLIENT_BREAKER_COOLDOWN = 300.0  # seconds before trying again
+
+# on-disk cache of API responses, see real/cache.py
+CACHE_FILE = os.sep.join([DEFAULT_LOC, 'response_cache.sqlite'])
+CACHE_MAX_BYTES = 4 * 1024 ** 3  # least recently used entries evicted past 4GB
+DAY = 24 * 3600
+# seconds a cached response stays fresh by endpoint type, None for forever
+CACHE_TTLS = {'search': 90 * DAY,
+              'parceldetail': 30 * DAY,
+              'parcel_ownershiphistory': 7 * DAY,
+              'parcel_assessmenthistory': 30 * DAY,
+              'default': 7 * DAY}
+# serve only cached responses and never contact the server
+CACHE_OFFLINE = False
+
+# compressed, indexed record store for scraped data, see real/store.py
+STORE_LOC = os.sep.join([DEFAULT_LOC, 'records'])
+STORE_SHARD_BYTES = 256 * 1024 ** 2
+
+# checkpoints journaled before AINData rewrites its pickle, see real/journal.py
+JOURNAL_COMPACT_EVERY = 50
+
+# persistent work queue for searches and detail scrapes, see real/work_queue.py
+QUEUE_FILE = os.sep.join([DEFAULT_LOC, 'work_queue.sqlite'])
+QUEUE_LEASE_SECONDS = 3600.0  # leased work not finished by then is re-queued
+QUEUE_MAX_ATTEMPTS = 5  # failures before an item is dead-lettered
+
+# json library for decoding records and responses, see real/decoding.py
+# 'msgspec', 'orjson' or 'json'; None picks the fastest one installed
+DECODER_BACKEND = None
+
+# BLS price series for inflation adjustment, see real/inflation.py
+INFLATION_FILE = os.sep.join([DEFAULT_LOC, 'inflation.txt'])
+INFLATION_BASE = '2000-01'  # the month whose dollars prices are shown in
+
+# the housing dataset partitioned by zip code and year, see real/dataset.py
+DATASET_LOC = os.sep.join([DEFAULT_LOC, 'wla_housing'])
+DATASET_FORMAT = 'parquet'  # or 'feather'
+
+# medians and quantiles of prices by zip code, bedrooms and month or year,
+# see real/cube.py
+CUBE_FILE = os.sep.join([DEFAULT_LOC, 'wla_cube.pkl'])
+CUBE_COLUMNS = ['DTTSalePrice', 'AssessedValue']
+CUBE_QUANTILES = [0.1, 0.25, 0.75, 0.9]
+CUBE_PRICE_RANGE = (1e5, 1e7)  # prices outside are left out, as in the plots
+
+# grid index of sale locations for comparables queries, see real/spatial.py
+SPATIAL_FILE = os.sep.join([DEFAULT_LOC, 'wla_spatial.pkl'])
+SPATIAL_CELL_METRES = 250.0
+SPATIAL_COLUMNS = ['AIN', 'ZipCode', 'RecordingDate', 'NumOfBeds',
+                   'DTTSalePrice', 'AssessedValue']
+
+# batch export of the plots, see export.py
+EXPORT_LOC = os.sep.join([DEFAULT_LOC, 'figures'])
+
 COLUMNS = ['AIN', 'SitusStreet',
            'SitusCity', 'SitusZipCode',
            'LegalDescription']
@@ -27,6 +111,12 @@ COLUMNS = ['AIN', 'SitusStreet',
 ROW_ELEMENTS = ['HSE_NBR', 'HSE_FRAC_NBR', 'HSE_DIR_CD', 'STR_NM',
                 'STR_SFX_CD', 'STR_SFX_DIR_CD', 'ZIP_CD']
 
+# the address book columns that are read, see real/addresses.py.  Everything
+# is read as text so house numbers come back the way they are written.
+ADDRESS_COLUMNS = ROW_ELEMENTS + ['UNIT_RANGE']
+ADDRESS_CHUNK_ROWS = 200000  # rows of the csv held in memory at a time
+ADDRESS_CACHE_LOC = os.sep.join([DEFAULT_LOC, 'address_cache'])
+
 
 def coerce_date(input_date: str) -> Union[datetime, float]:
     try:
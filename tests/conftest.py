@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..real import client
+from ..real.client import AssessorError, CircuitOpenError
+from ..resources.defaults import SEARCH_URL
+
+
+class FakeClient:
+    """
+    Stands in for client.AssessorClient.  A search for house number N on
+    N MAIN ST 90025 finds the parcel with AIN 4248000N, searches for the house
+    numbers in fail raise AssessorError and every request after the first
+    open_after raises CircuitOpenError.  A search for the whole street (see
+    sweep.make_street_search_string) finds the house numbers in street, on
+    every page.
+    """
+    def __init__(self, fail=(), open_after=None, street=()):
+        self.fail = {str(n) for n in fail}
+        self.street = [str(n) for n in street]
+        self.open_after = open_after
+        self.calls = 0
+        self.last_cached = False
+
+    def cached_json(self, url: str) -> None:
+        return None
+
+    def get_json(self, url: str) -> dict:
+        return self.fetch_json(url)
+
+    def fetch_json(self, url: str) -> dict:
+        self.calls += 1
+        if self.open_after is not None and self.calls > self.open_after:
+            raise CircuitOpenError('Circuit open, not requesting ' + url)
+        if url.startswith(SEARCH_URL):
+            number = url[len(SEARCH_URL):].split('%20')[0]
+            if number in self.fail:
+                raise AssessorError('HTTP 500 for ' + url)
+            numbers = [number] if number.isdigit() else self.street
+            return {'Parcels': [{'AIN': '4248{:06d}'.format(int(n)),
+                                 'SitusStreet': n + ' N MAIN ST',
+                                 'SitusCity': 'LOS ANGELES CA',
+                                 'SitusZipCode': '90025-1234',
+                                 'LegalDescription': 'TRACT ' + n}
+                                for n in numbers]}
+        ain = url.split('ain=')[-1]
+        if ain in self.fail:
+            raise AssessorError('HTTP 500 for ' + url)
+        return {'Parcel': {'AIN': ain}}
+
+
+@pytest.fixture
+def shared_client():
+    """ puts the shared client back the way it was after the test """
+    old = client._DEFAULT_CLIENT
+    yield client.set_client
+    client.set_client(old)
+
+
+@pytest.fixture
+def fake_client(shared_client):
+    """ installs a FakeClient(*args, **kwargs) as the shared client """
+    def install(*args, **kwargs):
+        fake = FakeClient(*args, **kwargs)
+        shared_client(fake)
+        return fake
+    return install
+
+
+def make_addresses(numbers) -> pd.DataFrame:
+    """ an address book of house numbers on MAIN ST 90025 """
+    n = len(numbers)
+    return pd.DataFrame({'HSE_NBR': [str(number) for number in numbers],
+                         'HSE_FRAC_NBR': np.full(n, np.nan),
+                         'HSE_DIR_CD': ['N'] * n,
+                         'STR_NM': ['MAIN'] * n,
+                         'STR_SFX_CD': ['ST'] * n,
+                         'STR_SFX_DIR_CD': np.full(n, np.nan),
+                         'ZIP_CD': [90025] * n})
+
+
+@pytest.fixture
+def address_file(tmp_path):
+    """ a pickled address book of house numbers 100 to 105 """
+    filename = str(tmp_path / 'address_dataframe.pkl')
+    make_addresses(range(100, 106)).to_pickle(filename)
+    return filename
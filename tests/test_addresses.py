@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..real.addresses import split_up_units, yield_units
+
+
+def split_up_units_by_row(df: pd.DataFrame) -> pd.DataFrame:
+    """ split_up_units as it was before it was vectorized """
+    df['UNIT'] = pd.Series(dtype=str)
+    rows = []
+    for row in df.iterrows():
+        try:
+            _ = np.isnan(row[1]['UNIT_RANGE'])
+        except TypeError:  # UNIT_RANGE is a string
+            for unit in yield_units(row[1]):
+                t = row[1]
+                t['UNIT'] = unit
+                rows.append(t.copy())
+        else:  # nan means no units in the building
+            rows.append(row[1].copy())
+    return pd.DataFrame(rows).reset_index(drop=True)
+
+
+def make_buildings(ranges: list) -> pd.DataFrame:
+    n = len(ranges)
+    return pd.DataFrame({'HSE_NBR': [str(100 + i) for i in range(n)],
+                         'STR_NM': ['MAIN'] * n,
+                         'ZIP_CD': [90025] * n,
+                         'UNIT_RANGE': ranges})
+
+
+@pytest.mark.parametrize('ranges', [
+    ['1-3', '10-12'],  # numeric ranges
+    ['A-C', 'a-b'],  # letter ranges
+    ['(1-4)', '(B-D)', '(7)'],  # parenthesized ranges
+    ['5', 'C', '007'],  # single units
+    [np.nan, np.nan],  # no units
+    ['1-3', np.nan, 'A-B', '(2-3)', '9', np.nan],  # all of them
+    ['3-1', '1-2'],  # backwards, no units
+    ['٣', '1-٢'],  # digits int() takes but the fast parser doesn't
+])
+def test_split_up_units_matches_iterrows(ranges):
+    expected = split_up_units_by_row(make_buildings(ranges))
+    actual = split_up_units(make_buildings(ranges))
+    pd.testing.assert_frame_equal(actual, expected)
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from ..real.async_scraper import async_scrape_ains_for_file
+
+
+def scrape(address_file, ain_file, chunk_size=2):
+    async_scrape_ains_for_file(address_file, ain_file, chunk_size=chunk_size,
+                               rate=1000.0, burst=100)
+    return pd.read_pickle(address_file), pd.read_pickle(ain_file)
+
+
+def test_failing_rows_dont_stall_the_run(fake_client, address_file,
+                                         tmp_path):
+    fake = fake_client(fail=[100, 101])
+    add, ain = scrape(address_file, str(tmp_path / 'ains.pkl'))
+    assert add['Searched'].tolist() == [False, False] + [True] * 4
+    assert sorted(ain['AIN']) == ['4248000{:d}'.format(n)
+                                  for n in range(102, 106)]
+    assert fake.calls == 6  # each failing row is tried once per run
+
+
+def test_circuit_open_keeps_what_was_found(fake_client, address_file,
+                                           tmp_path):
+    fake_client(open_after=3)
+    add, ain = scrape(address_file, str(tmp_path / 'ains.pkl'), chunk_size=1)
+    searched = add['Searched'].tolist()
+    assert searched == [True] * 3 + [False] * 3
+    assert sorted(ain['AIN']) == ['4248000{:d}'.format(n)
+                                  for n in range(100, 103)]
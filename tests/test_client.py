@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from ..real.cache import ResponseCache
+from ..real.client import AssessorClient, AssessorError, set_cache
+from ..real.scraper import make_ain_url, scrape
+from ..resources.defaults import DAY, TYPES
+
+AIN = '4248001002'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    for info in TYPES:
+        cache.put(make_ain_url(AIN, info), {'info': info})
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, 'sleep', slept.append)
+    return slept
+
+
+def test_cached_scrape_doesnt_sleep(cache, shared_client, sleeps):
+    shared_client(AssessorClient(cache=cache))
+    data = scrape(AIN, base_sleep=5.0)
+    assert data == {info: {'info': info} for info in TYPES}
+    assert sleeps == []
+
+
+def test_live_scrape_sleeps(fake_client, sleeps):
+    fake_client()
+    scrape(AIN, base_sleep=5.0)
+    assert len(sleeps) == len(TYPES)
+    assert all(5.0 <= s <= 10.0 for s in sleeps)
+
+
+def test_offline_only_answers_from_the_cache(cache, shared_client):
+    shared_client(AssessorClient(cache=cache))
+    client = set_cache(offline=True, max_age=DAY)
+    assert client.cache.ttls == {'default': DAY}
+    client.session = None  # any request would fail
+    url = make_ain_url(AIN, 'details')
+    cache._conn.execute('UPDATE responses SET fetched = 0')  # long expired
+    assert client.get_json(url) == {'info': 'details'}
+    assert client.last_cached
+    with pytest.raises(AssessorError):
+        client.get_json(make_ain_url('4248001003', 'details'))
+
+
+def test_no_cache(cache, shared_client):
+    shared_client(AssessorClient(cache=cache))
+    assert set_cache(enabled=False).cache is None
@@ -0,0 +1,95 @@
+from copy import deepcopy
+
+import pandas as pd
+import pytest
+
+from ..real.coercion import records_to_sales
+from ..real.json_reader import assessed_values_from_dict
+
+
+def make_record(ain: int, n_sales: int = 1, **fields) -> dict:
+    """ a scraped record, with fields overriding (or, if None, removing)
+    the parcel details """
+    parcel = {'AIN': str(ain), 'Longitude': '-118.45', 'Latitude': '34.04',
+              'SitusZipCode': '90025-1234', 'SitusStreet': '100 MAIN ST',
+              'NumOfBeds': '3', 'SqftMain': '1500', 'CreateDate': '01/02/1990',
+              'LotCorner': 'N', 'SubParts': [], 'LandAcres': ''}
+    parcel.update(fields)
+    parcel = {k: v for k, v in parcel.items() if v is not None}
+    sales = [{'SaleNumber': str(i), 'RecordingDate': '03/04/2005',
+              'DTTSalePrice': '500000', 'AssessedValue': '400000'}
+             for i in range(n_sales)]
+    return {'details': {'Parcel': parcel},
+            'ownership': {'Parcel_OwnershipHistory': sales}}
+
+
+def assert_matches_scalar(records: list) -> None:
+    """ records_to_sales gives what the scalar coercers do, dtypes too """
+    expected = []
+    for dd in deepcopy(records):
+        expected.extend(assessed_values_from_dict(dd))
+    expected = pd.DataFrame(expected)
+    actual = records_to_sales(records)
+    pd.testing.assert_frame_equal(actual, expected, check_like=True)
+    assert actual[expected.columns].dtypes.equals(expected.dtypes)
+    for column in expected.columns:  # 90025 isn't 90025.0 in an object
+        assert list(actual[column].map(type)) == \
+            list(expected[column].map(type)), column
+
+
+@pytest.mark.parametrize('zipcodes', [
+    ['90025-1234', '90064-0001'],
+    ['90025', ''],  # no ZIP+4 at all
+    ['', ''],
+    ['12', 'abc'],
+    ['abcde-1234'],
+    ['90025-1234', '', 'abcde-1234'],
+    ['90025-1234', '90025'],
+])
+def test_zipcodes(zipcodes):
+    assert_matches_scalar([make_record(4248000000 + i, SitusZipCode=zc)
+                           for i, zc in enumerate(zipcodes)])
+
+
+@pytest.mark.parametrize('beds', [
+    ['3', '4'],
+    ['3', ''],  # blank
+    ['3', 'abc'],  # invalid
+    ['', ''],
+    ['3', None],  # missing
+    [None, None],
+])
+def test_ints(beds):
+    assert_matches_scalar([make_record(4248000000 + i, NumOfBeds=b)
+                           for i, b in enumerate(beds)])
+
+
+@pytest.mark.parametrize('fields', [
+    {'Longitude': ''}, {'Longitude': 'abc'}, {'Longitude': None},
+    {'CreateDate': ''}, {'CreateDate': '2001-01-01'}, {'CreateDate': None},
+    {'LotCorner': 'Y'}, {'LotCorner': 'None'}, {'LotCorner': None},
+])
+def test_other_fields(fields):
+    assert_matches_scalar([make_record(4248000000), make_record(4248000001,
+                                                                **fields)])
+
+
+@pytest.mark.parametrize('corner', [['N', None], [None, None], ['Y', None]])
+def test_null_yn_fields(corner):
+    # a JSON null, unlike a missing field, is False as with yn_to_bool
+    records = [make_record(4248000000 + i) for i in range(len(corner))]
+    for record, value in zip(records, corner):
+        record['details']['Parcel']['LotCorner'] = value
+    assert_matches_scalar(records)
+    assert records_to_sales(records)['LotCorner'].dtype == bool
+
+
+def test_records_without_sales():
+    # the no-sales record is dropped by both, so its missing fields
+    # shouldn't change the types of the others'
+    assert_matches_scalar([make_record(4248000000, n_sales=2),
+                           make_record(4248000001, n_sales=0,
+                                       NumOfBeds=None, Longitude=None,
+                                       CreateDate=None, LotCorner=None),
+                           make_record(4248000002, SitusZipCode=None),
+                           make_record(4248000003)])
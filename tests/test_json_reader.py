@@ -0,0 +1,27 @@
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from ..real import json_reader
+from ..real.inflation import get_inflation
+from ..real.json_reader import concat_chunks
+
+
+def test_concat_chunks_matches_concat():
+    chunks = [pd.DataFrame({'AIN': [1, 2], 'SitusCity': ['LA', 'LA']}),
+              pd.DataFrame({'AIN': [3]}).iloc[0:0],
+              pd.DataFrame({'RecordingDate': pd.to_datetime(['2001-02-03']),
+                            'AIN': [4]}),
+              pd.DataFrame({'AIN': [5], 'LotCorner': [True]})]
+    assert_frame_equal(concat_chunks(iter(chunks)),
+                       pd.concat(chunks, ignore_index=True))
+    assert concat_chunks(iter([])).empty
+
+
+def test_inflation_indexes_use_the_base(monkeypatch):
+    dates = pd.Series(pd.to_datetime(['1995-06-01', '2010-03-01']))
+    monkeypatch.setattr(json_reader, 'INFLATION_BASE', '2010-03')
+    df = json_reader.add_inflation_indexes(pd.DataFrame({'RecordingDate':
+                                                         dates}))
+    for series in get_inflation().series:
+        assert list(df[series + 'Index']) == \
+            list(get_inflation().index(series, dates, '2010-03'))
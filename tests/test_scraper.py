@@ -0,0 +1,110 @@
+import pandas as pd
+
+from ..real import addresses
+from ..real.addresses import address_keys, address_search_strings
+from ..real.coverage import situs_keys
+from ..real.scraper import (scrape_ains_for_file, scrape_ains_from_queue,
+                           scrape_chunks_for_ains)
+from ..real.work_queue import WorkQueue, SEARCH
+
+
+def ains(numbers):
+    return ['4248000{:d}'.format(n) for n in numbers]
+
+
+def test_circuit_open_saves_ains_found(fake_client, address_file, tmp_path):
+    fake_client(open_after=3)
+    ain_file = str(tmp_path / 'ains.pkl')
+    scrape_ains_for_file(address_file, ain_file, chunk_size=2,
+                         base_sleep=0)
+    add = pd.read_pickle(address_file)
+    assert add['Searched'].tolist() == [True] * 3 + [False] * 3
+    assert sorted(pd.read_pickle(ain_file)['AIN']) == ains(range(100, 103))
+
+
+def test_circuit_open_hands_back_queued_work(fake_client, address_file,
+                                             tmp_path):
+    fake_client(open_after=3)
+    ain_file = str(tmp_path / 'ains.pkl')
+    with WorkQueue(str(tmp_path / 'queue.sqlite')) as queue:
+        scrape_ains_from_queue(address_file, ain_file, queue, chunk_size=2,
+                               base_sleep=0)
+        assert queue.counts(SEARCH) == {'done': 3, 'pending': 3}
+        attempts = queue._conn.execute(
+            "SELECT key, attempts FROM items WHERE state = 'pending'")
+        assert sorted(attempts) == [('3', 0), ('4', 0), ('5', 0)]
+    add = pd.read_pickle(address_file)
+    assert add['Searched'].tolist() == [True] * 3 + [False] * 3
+    assert sorted(pd.read_pickle(ain_file)['AIN']) == ains(range(100, 103))
+
+
+def test_failed_searches_are_retried(fake_client, address_file, tmp_path):
+    fake_client(fail=[101])
+    ain_file = str(tmp_path / 'ains.pkl')
+    scrape_ains_for_file(address_file, ain_file, chunk_size=2,
+                         base_sleep=0)
+    add = pd.read_pickle(address_file)
+    assert add['Searched'].tolist() == [True, False] + [True] * 4
+    fake_client()
+    scrape_ains_for_file(address_file, ain_file, chunk_size=2,
+                         base_sleep=0)
+    assert pd.read_pickle(address_file)['Searched'].all()
+    assert sorted(pd.read_pickle(ain_file)['AIN']) == ains(range(100, 106))
+
+
+def test_canonical_columns_are_stored(fake_client, address_file, tmp_path,
+                                      monkeypatch):
+    fake_client()
+    ain_file = str(tmp_path / 'ains.pkl')
+    scrape_ains_for_file(address_file, ain_file, chunk_size=2, chunks=1,
+                         base_sleep=0)
+    add = pd.read_pickle(address_file)
+    assert add['SearchString'].equals(address_search_strings(add))
+    assert add['AddressKey'].equals(address_keys(add))
+    res = pd.read_pickle(ain_file)
+    assert res['AddressKey'].tolist() == \
+        situs_keys(res['SitusStreet'], res['SitusZipCode']).tolist()
+
+    def recompute(df):
+        raise AssertionError('address columns worked out again')
+    monkeypatch.setattr(addresses, 'address_elements', recompute)
+    scrape_ains_for_file(address_file, ain_file, chunk_size=2,
+                         base_sleep=0)
+    res = pd.read_pickle(ain_file)
+    assert res['AddressKey'].notna().all()
+    assert sorted(res['AIN']) == ains(range(100, 106))
+
+
+def test_failing_searches_are_tried_once_per_run(fake_client, address_file,
+                                                 tmp_path):
+    fake = fake_client(fail=[100, 101])
+    ain_file = str(tmp_path / 'ains.pkl')
+    scrape_ains_for_file(address_file, ain_file, chunk_size=1,
+                         base_sleep=0)
+    assert fake.calls == 6
+    add = pd.read_pickle(address_file)
+    assert add['Searched'].tolist() == [False, False] + [True] * 4
+
+
+def test_failing_scrapes_are_tried_once_per_run(fake_client, tmp_path):
+    fake = fake_client(fail=ains([100]))
+    ain_file = str(tmp_path / 'ains.pkl')
+    pd.DataFrame({'AIN': ains(range(100, 103)),
+                  'SitusStreet': ['100 N MAIN ST'] * 3,
+                  'SitusZipCode': ['90025-1234'] * 3}).to_pickle(ain_file)
+    scrape_chunks_for_ains(ain_file, chunk_size=1, infos=['details'],
+                           base_sleep=0, location=str(tmp_path))
+    assert fake.calls == 3
+    assert pd.read_pickle(ain_file)['Scraped'].tolist() == \
+        [False, True, True]
+
+
+def test_failing_queue_items_are_tried_once_per_run(fake_client,
+                                                    address_file, tmp_path):
+    fake = fake_client(fail=[100])
+    ain_file = str(tmp_path / 'ains.pkl')
+    with WorkQueue(str(tmp_path / 'queue.sqlite')) as queue:
+        scrape_ains_from_queue(address_file, ain_file, queue, chunk_size=1,
+                               base_sleep=0)
+        assert fake.calls == 6
+        assert queue.counts(SEARCH) == {'done': 5, 'pending': 1}
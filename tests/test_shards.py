@@ -0,0 +1,74 @@
+import os
+
+import pandas as pd
+
+from ..real.shards import (INPUT, address_keys, make_shard_file,
+                           merge_record_stores, merge_shards,
+                           run_details_shard, run_search_shard,
+                           shard_files, shard_name)
+from ..real.store import RecordStore
+from .conftest import make_addresses
+
+
+def test_shards_run_and_merge(fake_client, address_file, tmp_path):
+    fake_client()
+    ain_file = str(tmp_path / 'ains.pkl')
+    store = str(tmp_path / 'records')
+    for shard in range(2):
+        run_search_shard(address_file, ain_file, shard, 2, base_sleep=0)
+    merge_shards('search', address_file, ain_file, store)
+    assert pd.read_pickle(address_file)['Searched'].all()
+    ains = pd.read_pickle(ain_file)['AIN'].tolist()
+    assert ains == ['4248000{:d}'.format(n) for n in range(100, 106)]
+
+    for shard in range(2):
+        run_details_shard(ain_file, shard, 2, location=store, base_sleep=0)
+    # the details stage's input shards don't overwrite the search's output
+    assert len(shard_files(ain_file)) == 2
+    assert len(shard_files(ain_file, INPUT)) == 2
+    merge_shards('details', address_file, ain_file, store)
+    assert pd.read_pickle(ain_file)['Scraped'].all()
+    with RecordStore(store) as merged:
+        assert sorted(merged.ains()) == ains
+
+
+def test_stale_shard_is_rebuilt(tmp_path):
+    filename = str(tmp_path / 'address_dataframe.pkl')
+    make_addresses(range(100, 110)).to_pickle(filename)
+    fn = make_shard_file(filename, 0, 2, address_keys, 'address')
+    assert fn == shard_name(filename, 0, 2, INPUT)
+    shard = pd.read_pickle(fn)
+    shard['Searched'] = True
+    shard.to_pickle(fn)
+    assert make_shard_file(filename, 0, 2, address_keys, 'address') == fn
+    assert pd.read_pickle(fn)['Searched'].all()
+
+    make_addresses(range(100, 130)).to_pickle(filename)
+    stamp = os.path.getmtime(fn) + 10
+    os.utime(filename, (stamp, stamp))
+    make_shard_file(filename, 0, 2, address_keys, 'address')
+    rebuilt = pd.read_pickle(fn)
+    assert rebuilt.shape[0] > shard.shape[0]
+    searched = rebuilt['Searched'].fillna(False).astype(bool)
+    assert searched[rebuilt.index.isin(shard.index)].all()
+    assert not searched[~rebuilt.index.isin(shard.index)].any()
+
+
+def test_merging_stores_again_adds_nothing(tmp_path):
+    location = str(tmp_path / 'records')
+    for shard in range(2):
+        with RecordStore(shard_name(location, shard, 2)) as part:
+            for ain in range(shard, 6, 2):
+                part.append(str(ain), {'Parcel': {'AIN': str(ain)}})
+    assert merge_record_stores(location) == 6
+    size = sum(os.path.getsize(os.path.join(location, fn))
+               for fn in os.listdir(location) if fn.endswith('.gz'))
+    assert merge_record_stores(location) == 6
+    assert size == sum(os.path.getsize(os.path.join(location, fn))
+                       for fn in os.listdir(location) if fn.endswith('.gz'))
+
+    with RecordStore(shard_name(location, 0, 2)) as part:
+        part.append('0', {'Parcel': {'AIN': '0', 'Rescraped': True}})
+    merge_record_stores(location)
+    with RecordStore(location) as merged:
+        assert merged.get('0')['Parcel']['Rescraped']
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from ..real.sweep import sweep_ains_for_file
+
+
+def test_finished_sweeps_are_not_repeated(fake_client, address_file,
+                                          tmp_path):
+    fake = fake_client(street=[100, 101, 102])
+    ain_file = str(tmp_path / 'ains.pkl')
+    stats = sweep_ains_for_file(address_file, ain_file, fallback=False,
+                                base_sleep=0)
+    assert stats['swept_streets'] == 1
+    assert stats['sweep_requests'] == 2  # the second page adds nothing
+    add = pd.read_pickle(address_file)
+    assert add['Swept'].all()
+    assert add['Searched'].tolist() == [True] * 3 + [False] * 3
+
+    fake.calls = 0
+    stats = sweep_ains_for_file(address_file, ain_file, fallback=False,
+                                base_sleep=0)
+    assert fake.calls == 0
+    assert stats['swept_before'] == 1
+    assert stats['swept_streets'] == stats['sweep_requests'] == 0
+
+
+def test_circuit_open_stops_the_sweep(fake_client, address_file, tmp_path):
+    fake_client(street=[100, 101, 102], open_after=1)
+    ain_file = str(tmp_path / 'ains.pkl')
+    stats = sweep_ains_for_file(address_file, ain_file, base_sleep=0)
+    assert stats['swept_streets'] == stats['fallback_requests'] == 0
+    add = pd.read_pickle(address_file)
+    assert not add['Swept'].any()  # swept again next time
+    assert add['Searched'].tolist() == [True] * 3 + [False] * 3
+    assert sorted(pd.read_pickle(ain_file)['AIN']) == \
+        ['4248000{:d}'.format(n) for n in range(100, 103)]
+
+
+def test_fallback_stops_after_chunks(fake_client, address_file, tmp_path):
+    fake = fake_client()  # the sweep finds nothing
+    ain_file = str(tmp_path / 'ains.pkl')
+    stats = sweep_ains_for_file(address_file, ain_file, chunk_size=2,
+                                chunks=1, base_sleep=0)
+    assert fake.calls == 1 + 2
+    assert stats['fallback_requests'] == 2
+    assert pd.read_pickle(address_file)['Searched'].sum() == 2
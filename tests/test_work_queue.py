@@ -0,0 +1,41 @@
+import os
+
+import pandas as pd
+
+from ..real.scraper import scrape_data_from_queue
+from ..real.work_queue import WorkQueue, DETAILS, SEARCH
+from ..resources.defaults import COLUMNS
+
+
+def test_expired_leases_use_up_attempts(tmp_path):
+    # a lease that has run out as soon as it's made, as if the worker died
+    with WorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=-1,
+                   max_attempts=2) as queue:
+        queue.add(SEARCH, ['1'])
+        assert queue.lease(SEARCH) == ['1']
+        assert queue.lease(SEARCH) == ['1']
+        assert queue.lease(SEARCH) == []
+        assert queue.dead_letters(SEARCH) == [('1', 2, 'lease expired')]
+
+
+def test_released_leases_keep_their_attempts(tmp_path):
+    with WorkQueue(str(tmp_path / 'queue.sqlite'), max_attempts=1) as queue:
+        queue.add(SEARCH, ['1'])
+        queue.release(SEARCH, queue.lease(SEARCH))
+        queue.fail(SEARCH, queue.lease(SEARCH)[0], 'HTTP 500')
+        assert queue.dead_letters(SEARCH) == [('1', 1, 'HTTP 500')]
+
+
+def test_queued_ain_missing_from_file(fake_client, tmp_path):
+    fake_client()
+    ain_file = str(tmp_path / 'ains.pkl')
+    pd.DataFrame({c: ['4248000100', '4248000101'] for c in COLUMNS})\
+        .to_pickle(ain_file)
+    with WorkQueue(str(tmp_path / 'queue.sqlite'), max_attempts=1) as queue:
+        queue.add(DETAILS, ['4248000999'])
+        scrape_data_from_queue(ain_file, queue, location=str(tmp_path),
+                               base_sleep=0)
+        assert queue.counts(DETAILS) == {'done': 2, 'dead': 1}
+        assert queue.dead_letters(DETAILS)[0][0] == '4248000999'
+    assert pd.read_pickle(ain_file)['Scraped'].all()
+    assert os.path.isfile(str(tmp_path / '4248000100.json'))